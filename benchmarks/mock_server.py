@@ -0,0 +1,604 @@
+import re
+import sys
+import json
+import time
+import base64
+import random
+import hashlib
+import logging
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Local stand-in for the IDMC and CDGC APIs the scripts in this repo call, so their throughput can be measured without a real org. It
+# implements identity login / token (v1 and the platform v2 login), user and group lookups, data360 search and asset details, ccgf-searchv2,
+# ccgf-contentv2 publish, catalog source management, orchestration job status and the notification service, all on one port.
+#
+# The catalog is generated from a profile: number of business assets and their relationships, CDAM assets, technical datasets in lineage
+# chains and catalog sources. The same profile sets the latency of each endpoint family (see idmc_common/ratelimit.py), a random error rate,
+# a server side throttle that answers 429 above a request rate and the lifetime of the tokens it hands out. Deletes really remove content, so
+# a purge ends with an empty catalog. Every request is counted and timed per family, see stats() or GET /__stats. Asset, search and catalog
+# source reads carry an ETag and answer 304 to a matching If-None-Match, and datasets have a modified time (touch() changes it).
+#
+# Only for benchmarking, nothing here checks a password.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+families = ["identity", "search", "publish", "catalog_source", "notification"]
+
+cdamClassTypes = ["DataAccessEnforcementPolicy", "DataFilterEnforcementPolicy", "DataProtection", "DataProtectionEnforcementPolicy", "PrecedenceTier"]
+relationshipTypes = ["core.DataSetToBusinessTerm", "com.infa.ccgf.models.governance.relatedTerm"]
+datasetClassType = "com.infa.odin.models.relational.Table"
+
+defaultProfile = {
+    "assets": 300,                  # business assets found by the gov purge
+    "relationships": 2,             # relationships pointing at each business asset
+    "cdamAssets": 40,               # CDAM assets of each CDAM class type
+    "datasets": 250,                # technical datasets, linked into lineage chains
+    "lineageDepth": 5,              # datasets per lineage chain
+    "sources": 12,                  # catalog sources
+    "sourceAssets": 2000,           # max technical assets per catalog source, each source gets a random count up to this
+    "jobBaseSeconds": 0.5,          # run time of a purge job ...
+    "jobSecondsPerAsset": 0.0005,   # ... plus this much per asset of the catalog source
+    "users": 10,
+    "groups": 5,
+    "latency": {},                  # milliseconds per endpoint family, a missing family answers straight away
+    "jitter": 0.2,                  # latency varies randomly by up to this fraction either way
+    "errorRate": 0.0,               # fraction of search and publish requests that fail with a 503
+    "throttle": 0,                  # requests per second the server accepts before it answers 429, 0 means no limit
+    "tokenTtl": 3600,               # lifetime of the JWTs handed out, in seconds
+    "seed": 1
+}
+
+profiles = {
+    "fast": {},
+    "realistic": {"latency": {"identity": 150, "search": 120, "publish": 200, "catalog_source": 80, "notification": 100}, "jitter": 0.3},
+    "flaky": {"latency": {"identity": 150, "search": 120, "publish": 200, "catalog_source": 80, "notification": 100}, "jitter": 0.3,
+              "errorRate": 0.02},
+    "throttled": {"latency": {"identity": 150, "search": 120, "publish": 200, "catalog_source": 80, "notification": 100}, "jitter": 0.3,
+                  "throttle": 40}
+}
+
+
+def build_profile(name="fast", **overrides):
+
+    # Profile dict for MockCatalog, a named preset with any setting overridden. None values are ignored so argparse defaults can be passed
+    profile = dict(defaultProfile, **profiles[name])
+    profile.update({key: value for key, value in overrides.items() if value is not None})
+
+    return profile
+
+
+def path_family(path):
+
+    if "/identity-service/" in path or "/ma/api/" in path or "/saas/public/core/" in path:
+        return "identity"
+    if "/ccgf-contentv2/" in path:
+        return "publish"
+    if "/ccgf-catalog-source-management/" in path or "/ccgf-orchestration-management-api-server/" in path:
+        return "catalog_source"
+    if "/notification-service/" in path:
+        return "notification"
+
+    return "search"
+
+
+def percentile(values, fraction):
+
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+class MockCatalog:
+
+    def __init__(self, profile):
+
+        self.profile = profile
+        self.lock = threading.Lock()
+        self.random = random.Random(profile['seed'])
+
+        self.businessAssets = {f"bus-{i:06d}": f"Business Term {i}" for i in range(profile['assets'])}
+
+        # target identity -> {source identity: [relationship types]}, the way searchv2 returns them, one hit per pair of assets
+        self.relationships = {
+            assetID: {f"ref-{i:06d}-{n}": list(relationshipTypes) for n in range(profile['relationships'])}
+            for i, assetID in enumerate(self.businessAssets)
+        }
+
+        self.cdamAssets = {
+            f"com.infa.ccgf.models.cdam.{classType}": {f"cdam-{classType}-{i:05d}": f"{classType} {i}" for i in range(profile['cdamAssets'])}
+            for classType in cdamClassTypes
+        }
+
+        self.datasets = [f"ds-{i:06d}" for i in range(profile['datasets'])]
+        self.datasetIndex = {datasetID: i for i, datasetID in enumerate(self.datasets)}
+        self.datasetModified = {datasetID: 1700000000000 for datasetID in self.datasets}
+
+        self.sources = {f"source_{i:03d}": self.random.randint(0, profile['sourceAssets']) for i in range(profile['sources'])}
+        self.jobs = {}
+
+        self.users = {f"user{i}": f"usr-{i:04d}" for i in range(profile['users'])}
+        self.groups = {f"group{i}": f"grp-{i:04d}" for i in range(profile['groups'])}
+        self.messages = []
+
+        self.throttleTokens = float(profile['throttle'])
+        self.throttleUpdated = time.monotonic()
+
+        self.started = time.time()
+        self.connections = 0
+        self.requests = {family: [] for family in families}
+        self.statuses = {family: {} for family in families}
+
+    # ---- Users and groups ---------------------------------------------------------------------------------------------------------------------
+    def list_principals(self, principals, nameField, query):
+
+        # q=<field>==<name> looks up one name, without q the principals are listed a page (limit, skip) at a time
+        if "q" in query:
+            name = query['q'][0].split("==")[-1].strip("'\"")
+            return [{"id": principals[name], nameField: name}] if name in principals else []
+
+        skip = int(query.get("skip", ["0"])[0])
+        limit = min(int(query.get("limit", ["100"])[0]), 200)
+        return [{"id": principalID, nameField: name} for name, principalID in list(principals.items())[skip:skip + limit]]
+
+    # ---- Request accounting -----------------------------------------------------------------------------------------------------------------
+
+    def record(self, family, status, seconds):
+
+        with self.lock:
+            self.requests[family].append(seconds)
+            self.statuses[family][status] = self.statuses[family].get(status, 0) + 1
+
+    def throttled(self):
+
+        # Token bucket with one second of burst, a request that finds it empty gets a 429
+        if not self.profile['throttle']:
+            return False
+
+        with self.lock:
+            now = time.monotonic()
+            rate = float(self.profile['throttle'])
+            self.throttleTokens = min(rate, self.throttleTokens + (now - self.throttleUpdated) * rate)
+            self.throttleUpdated = now
+
+            if self.throttleTokens < 1:
+                return True
+
+            self.throttleTokens = self.throttleTokens - 1
+            return False
+
+    def delay(self, family):
+
+        latency = self.profile['latency'].get(family, 0) / 1000.0
+        if latency:
+            jitter = self.profile['jitter']
+            time.sleep(latency * (1 + self.random.uniform(-jitter, jitter)))
+
+    def fail(self, family):
+        return family in ("search", "publish") and self.random.random() < self.profile['errorRate']
+
+    def stats(self):
+
+        # Request count, status codes and server side latency (seconds) per family, plus the totals
+        with self.lock:
+            summary = {"connections": self.connections, "families": {}}
+            allSeconds = []
+
+            for family in families:
+                seconds = self.requests[family]
+                allSeconds.extend(seconds)
+                if seconds:
+                    summary['families'][family] = {
+                        "requests": len(seconds),
+                        "statuses": {str(status): count for status, count in sorted(self.statuses[family].items())},
+                        "p50": percentile(seconds, 0.5),
+                        "p99": percentile(seconds, 0.99)
+                    }
+
+            summary['requests'] = len(allSeconds)
+            summary['errors'] = sum(count for family in families for status, count in self.statuses[family].items() if status >= 400)
+            summary['p50'] = percentile(allSeconds, 0.5)
+            summary['p99'] = percentile(allSeconds, 0.99)
+
+            return summary
+
+    # ---- Identity ---------------------------------------------------------------------------------------------------------------------------
+
+    def new_token(self):
+
+        payload = json.dumps({"sub": "benchmark", "exp": int(time.time() + self.profile['tokenTtl'])}).encode()
+        return "mock." + base64.urlsafe_b64encode(payload).decode().rstrip("=") + ".signature"
+
+    def token_valid(self, authorization):
+
+        try:
+            payload = authorization[len("Bearer "):].split(".")[1]
+            payload = payload + "=" * (-len(payload) % 4)
+            return json.loads(base64.urlsafe_b64decode(payload))['exp'] > time.time()
+        except (IndexError, ValueError, KeyError, TypeError):
+            return False
+
+    # ---- Assets -----------------------------------------------------------------------------------------------------------------------------
+
+    def dataset_name(self, index):
+        return f"dataset_{index}"
+
+    def lineage_item(self, baseUrl, fromIndex, toIndex):
+
+        fromID, toID = self.datasets[fromIndex], self.datasets[toIndex]
+
+        return {
+            "from": self.dataset_name(fromIndex),
+            "fromType": datasetClassType,
+            "to": self.dataset_name(toIndex),
+            "toType": datasetClassType,
+            "details": {
+                "fromUri": f"{baseUrl}/data360/assets/{fromID}?scheme=internal",
+                "toUri": f"{baseUrl}/data360/assets/{toID}?scheme=internal"
+            }
+        }
+
+    def touch(self, datasetID):
+
+        # A change to the dataset, its modified time moves on
+        with self.lock:
+            self.datasetModified[datasetID] = self.datasetModified[datasetID] + 1000
+
+    def dataset_document(self, baseUrl, datasetID, direction="both"):
+
+        # Datasets are chained lineageDepth at a time, ds 0 -> ds 1 -> ... -> ds lineageDepth-1, then the next chain starts
+        index = self.datasetIndex[datasetID]
+        depth = self.profile['lineageDepth']
+        chainStart = index - index % depth
+        chainEnd = min(chainStart + depth, len(self.datasets)) - 1
+
+        hops = []
+        if direction in ("inbound", "both"):
+            for distance in range(1, index - chainStart + 1):
+                hops.append({"distance": distance, "items": [self.lineage_item(baseUrl, index - distance, index - distance + 1)]})
+        if direction in ("outbound", "both"):
+            for distance in range(1, chainEnd - index + 1):
+                hops.append({"distance": distance, "items": [self.lineage_item(baseUrl, index + distance - 1, index + distance)]})
+
+        # The single asset call only returns the nearest hop, the scripts walk the rest themselves
+        if direction != "both":
+            hops = hops[:1]
+
+        return {
+            "core.identity": datasetID,
+            "summary": {"core.name": self.dataset_name(index)},
+            "systemAttributes": {"core.classType": datasetClassType, "core.lastModifiedOn": self.datasetModified[datasetID]},
+            "selfAttributes": {"core.resourceName": "benchmark_resource", "core.resourceType": "Oracle"},
+            "lineage": [{"hops": hops}] if hops else []
+        }
+
+    def search_assets(self, knowledgeQuery, body):
+
+        start, size = body.get("from", 0), body.get("size", 100)
+
+        # Asset count of a catalog source, used to order technical purges
+        filters = " ".join(spec.get("expr", "") for spec in body.get("filterSpec", []))
+        match = re.search(r'core\.origin = "([^"]*)"', filters)
+        if match:
+            return {"summary": {"total_hits": self.sources.get(match.group(1), 0)}, "hits": []}
+
+        if "technical dataset" in knowledgeQuery:
+            hits = [{"core.identity": datasetID, "summary": {"core.name": self.dataset_name(self.datasetIndex[datasetID])}}
+                    for datasetID in self.datasets[start:start + size]]
+            return {"summary": {"total_hits": len(self.datasets)}, "hits": hits}
+
+        with self.lock:
+            assetIDs = list(self.businessAssets)
+
+        hits = [{"core.identity": assetID,
+                 "summary": {"core.name": self.businessAssets.get(assetID, "")},
+                 "systemAttributes": {"core.classType": "com.infa.ccgf.models.governance.BusinessTerm"}}
+                for assetID in assetIDs[start:start + size]]
+
+        return {"summary": {"total_hits": len(assetIDs)}, "hits": hits}
+
+    def search_v2(self, body):
+
+        start, size = body.get("from", 0), body.get("size", 10000)
+
+        # Relationship search of the gov purge (elasticsearch query on core.targetIdentity)
+        if isinstance(body.get("query"), dict):
+            targets = [term['terms']['core.targetIdentity'] for term in body['query']['bool']['must'] if "core.targetIdentity" in term.get('terms', {})]
+            targetID = targets[0][0] if targets else ""
+
+            with self.lock:
+                links = list(self.relationships.get(targetID, {}).items())
+
+            hits = [{"sourceAsMap": {"core.sourceIdentity": sourceID, "core.targetIdentity": targetID, "type": list(types)}}
+                    for sourceID, types in links[start:start + size]]
+            return {"hits": {"total": {"value": len(links)}, "hits": hits}}
+
+        # Class type search of the CDAM purge
+        classTypes = [term['terms']['core.classType'][0] for bool in body.get("filter", []) for term in bool['bool']['filter']
+                      if "core.classType" in term.get('terms', {})]
+
+        with self.lock:
+            assets = list(self.cdamAssets.get(classTypes[0] if classTypes else "", {}).items())
+
+        hits = [{"attributes": {"core.identity": assetID, "core.name": name, "core.classType": classTypes[0]}}
+                for assetID, name in assets[start:start + size]]
+
+        return {"hits": {"total": {"value": len(assets)}, "hits": hits}}
+
+    def publish(self, body):
+
+        item = body['items'][0]
+
+        with self.lock:
+            if item['elementType'] == "RELATIONSHIP":
+                types = self.relationships.get(item['toIdentity'], {}).get(item['fromIdentity'], [])
+                if item['type'] in types:
+                    types.remove(item['type'])
+                if not types:
+                    self.relationships.get(item['toIdentity'], {}).pop(item['fromIdentity'], None)
+                return {"items": [{"messageCode": "CONTENT_DELETED"}]}
+
+            assetID = item['identity']
+
+            # Same as CDGC, an asset that still has relationships can't be deleted
+            if self.relationships.get(assetID):
+                return {"items": [{"messageCode": "CONTENT_FAILED",
+                                   "validations": [{"results": [{"messageCode": "RELATIONSHIP_EXISTS"}]}]}]}
+
+            if self.businessAssets.pop(assetID, None) is not None:
+                self.relationships.pop(assetID, None)
+                return {"items": [{"messageCode": "CONTENT_DELETED"}]}
+
+            for assets in self.cdamAssets.values():
+                if assets.pop(assetID, None) is not None:
+                    return {"items": [{"messageCode": "CONTENT_DELETED"}]}
+
+        return {"items": [{"messageCode": "CONTENT_FAILED", "validations": [{"results": [{"messageCode": "OBJECT_NOT_FOUND"}]}]}]}
+
+    # ---- Catalog sources and jobs -----------------------------------------------------------------------------------------------------------
+
+    def list_sources(self, offset, limit):
+
+        with self.lock:
+            names = sorted(self.sources)
+
+        return {"count": len(names), "datasources": [{"name": name, "id": name} for name in names[offset:offset + limit]]}
+
+    def start_purge(self, sourceName):
+
+        with self.lock:
+            jobID = f"job-{len(self.jobs):05d}-{sourceName}"
+            duration = self.profile['jobBaseSeconds'] + self.sources.get(sourceName, 0) * self.profile['jobSecondsPerAsset']
+            self.jobs[jobID] = (time.time(), duration)
+
+        return {"jobId": jobID}
+
+    def job_status(self, jobID):
+
+        with self.lock:
+            if jobID not in self.jobs:
+                return None
+            started, duration = self.jobs[jobID]
+
+        return {"id": jobID, "status": "COMPLETED" if time.time() - started >= duration else "RUNNING"}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    # Headers and body go out in one segment, otherwise delayed ACKs add ~40 ms to every request on a kept alive connection
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        logging.debug("mock: " + format % args)
+
+    def setup(self):
+        super().setup()
+        with self.server.catalog.lock:
+            self.server.catalog.connections = self.server.catalog.connections + 1
+
+    def send_json(self, status, body, headers=None, etag=False):
+
+        # etag=True adds an ETag (a hash of the body) and answers 304 without a body when the request's If-None-Match matches it
+        payload = json.dumps(body).encode()
+        headers = dict(headers or {})
+        if etag and status == 200:
+            headers['ETag'] = '"' + hashlib.sha1(payload).hexdigest()[:20] + '"'
+            if self.headers.get("If-None-Match") == headers['ETag']:
+                status, payload = 304, b""
+
+        self.send_response(status)
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+        return status
+
+    def read_body(self):
+
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length) if length else b""
+
+        try:
+            return json.loads(data) if data else {}
+        except ValueError:
+            return {}
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host', '127.0.0.1')}"
+
+    def handle_request(self, method):
+
+        started = time.perf_counter()
+        catalog = self.server.catalog
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        family = path_family(url.path)
+
+        # The body is always read, otherwise it would be taken for the next request on a kept alive connection
+        body = self.read_body()
+
+        if url.path == "/__stats":
+            self.send_json(200, catalog.stats())
+            return
+
+        if catalog.throttled():
+            status = self.send_json(429, {"error": {"message": "Too many requests"}}, {"Retry-After": "1"})
+        else:
+            catalog.delay(family)
+            status = self.route(catalog, method, url.path, query, body, family)
+
+        catalog.record(family, status, time.perf_counter() - started)
+
+    def route(self, catalog, method, path, query, body, family):
+
+        # ---- Identity, no token needed
+        if path.endswith("/identity-service/api/v1/Login"):
+            return self.send_json(200, {"orgId": "benchmark-org", "sessionId": "benchmark-session", "userName": body.get("username", "")})
+        if path.endswith("/ma/api/v2/user/login"):
+            return self.send_json(200, {"orgUuid": "benchmark-org", "icSessionId": "benchmark-session", "serverUrl": self.base_url() + "/saas"})
+        if path.endswith("/identity-service/api/v1/jwt/Token"):
+            return self.send_json(200, {"jwt_token": catalog.new_token()})
+
+        if not path.startswith("/saas/public/core/v3/") and not catalog.token_valid(self.headers.get("Authorization", "")):
+            return self.send_json(401, {"error": {"message": "Token is missing or has expired"}})
+
+        if catalog.fail(family):
+            return self.send_json(503, {"error": {"message": "Service temporarily unavailable"}})
+
+        # ---- Users and groups
+        if path.endswith("/saas/public/core/v3/users"):
+            return self.send_json(200, catalog.list_principals(catalog.users, "userName", query))
+        if path.endswith("/saas/public/core/v3/userGroups"):
+            return self.send_json(200, catalog.list_principals(catalog.groups, "userGroupName", query))
+
+        # ---- Search
+        if path == "/data360/search/v1/assets":
+            return self.send_json(200, catalog.search_assets(query.get("knowledgeQuery", [""])[0], body), etag=True)
+        if path == "/data360/search/v1/assets/details":
+            documents = [catalog.dataset_document(self.base_url(), datasetID) for datasetID in body if datasetID in catalog.datasetIndex]
+            # Only the requested segments, lineage-level and lineage-distance:n both stand for the lineage
+            segments = {segment.split("-")[0].split(":")[0] for segment in query.get("segments", [""])[0].split(",")}
+            documents = [{key: value for key, value in document.items() if key == "core.identity" or key in segments} for document in documents]
+            return self.send_json(200, documents, etag=True)
+        if path.startswith("/data360/search/v1/assets/"):
+            datasetID = path.rsplit("/", 1)[1]
+            if datasetID not in catalog.datasetIndex:
+                return self.send_json(404, {"error": {"message": "Asset not found"}})
+            direction = "outbound" if "lineage-direction:outbound" in query.get("segments", [""])[0] else "inbound"
+            return self.send_json(200, catalog.dataset_document(self.base_url(), datasetID, direction), etag=True)
+        if path == "/ccgf-searchv2/api/v1/search":
+            return self.send_json(200, catalog.search_v2(body))
+
+        # ---- Publish
+        if path == "/ccgf-contentv2/api/v1/publish":
+            return self.send_json(207, catalog.publish(body))
+
+        # ---- Catalog sources and jobs
+        if path == "/ccgf-catalog-source-management/api/v1/datasources":
+            return self.send_json(200, catalog.list_sources(int(query.get("offset", ["0"])[0]), int(query.get("limit", ["25"])[0])), etag=True)
+        if path.startswith("/ccgf-catalog-source-management/api/v1/datasources/") and method == "DELETE":
+            sourceName = path.rsplit("/", 1)[1]
+            if query.get("type") == ["purge"]:
+                return self.send_json(200, catalog.start_purge(sourceName))
+            with catalog.lock:
+                catalog.sources.pop(sourceName, None)
+            return self.send_json(200, {})
+        if path.startswith("/ccgf-orchestration-management-api-server/api/v1/jobs/"):
+            jobInfo = catalog.job_status(path.rsplit("/", 1)[1])
+            return self.send_json(200, jobInfo) if jobInfo else self.send_json(404, {"error": {"message": "Job not found"}})
+
+        # ---- Notifications
+        if path == "/notification-service/api/v1/Messages":
+            messages = body if isinstance(body, list) else [body]
+            with catalog.lock:
+                catalog.messages.extend(messages)
+                firstID = len(catalog.messages) - len(messages)
+            return self.send_json(200, [{"id": f"msg-{firstID + i:06d}"} for i in range(len(messages))])
+
+        return self.send_json(404, {"error": {"message": f"No mock for {method} {path}"}})
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 512
+
+    def __init__(self, profile, host="127.0.0.1", port=0):
+        self.catalog = MockCatalog(profile)
+        super().__init__((host, port), MockHandler)
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def start(self):
+
+        # Serves from a daemon thread, for use inside the benchmark runner
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+
+        return self
+
+
+def profile_arguments(parser):
+
+    # Profile options shared with run_benchmarks.py
+    parser.add_argument("--profile", default="fast", choices=sorted(profiles), help="latency / error / throttle preset (default: fast)")
+    parser.add_argument("--assets", type=int, help="business assets")
+    parser.add_argument("--relationships", type=int, help="relationships per business asset")
+    parser.add_argument("--cdam-assets", dest="cdamAssets", type=int, help="CDAM assets per class type")
+    parser.add_argument("--datasets", type=int, help="technical datasets")
+    parser.add_argument("--lineage-depth", dest="lineageDepth", type=int, help="datasets per lineage chain")
+    parser.add_argument("--sources", type=int, help="catalog sources")
+    parser.add_argument("--users", type=int, help="platform users (user0, user1, ...)")
+    parser.add_argument("--groups", type=int, help="user groups (group0, group1, ...)")
+    parser.add_argument("--latency", type=json.loads, help='latency per family in ms, e.g. \'{"search": 100, "publish": 200}\'')
+    parser.add_argument("--error-rate", dest="errorRate", type=float, help="fraction of search and publish requests that fail with a 503")
+    parser.add_argument("--throttle", type=int, help="requests per second before the server answers 429")
+    parser.add_argument("--token-ttl", dest="tokenTtl", type=int, help="token lifetime in seconds")
+
+
+def profile_from_arguments(args):
+
+    settings = {key: getattr(args, key) for key in defaultProfile if hasattr(args, key)}
+    return build_profile(args.profile, **settings)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)-5s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Mock IDMC / CDGC API server for benchmarks")
+    parser.add_argument("--port", type=int, default=8765)
+    profile_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(profile_from_arguments(args), port=args.port)
+    logging.info(f"Mock IDMC / CDGC server listening on {server.url} (profile {args.profile}), stats at {server.url}/__stats")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import importlib
+import subprocess
+from pathlib import Path
+import mock_server
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Throughput benchmark of the main workflow of every script, run against mock_server.py. Each scenario gets a fresh mock catalog built from
+# the profile and runs its script in a child process (the scripts read their settings with "from setup import *", so two of them can't
+# share an interpreter). The child imports the script, points login_url and cdgc_api_url at the mock, turns the credential cache off and
+# calls its main() the same way the command line would. It never talks to a real org, which is also why the ok_to_delete agreement isn't
+# needed here.
+#
+# For each scenario the report shows the requests the mock served, how many failed, the wall time of main(), requests per second and the
+# p50 / p99 latency of the requests as seen by the server. --json writes the full results (including a per family breakdown) and
+# --compare prints the change in wall time and requests per second against such a file from an earlier run.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+repoRoot = Path(__file__).resolve().parent.parent
+benchUser = "benchmark"
+benchPassword = "benchmark"
+
+scenarios = {
+    "gov-thread": {"dir": "cdgc_purge_content", "script": "cdgc_delete_gov_assets", "settings": {"executionMode": "thread"},
+                   "remaining": lambda catalog: len(catalog.businessAssets)},
+    "gov-async": {"dir": "cdgc_purge_content", "script": "cdgc_delete_gov_assets", "settings": {"executionMode": "async"},
+                  "remaining": lambda catalog: len(catalog.businessAssets)},
+    "cdam-thread": {"dir": "cdgc_purge_content", "script": "cdgc_delete_cdam_assets", "settings": {"executionMode": "thread"},
+                    "remaining": lambda catalog: sum(len(assets) for assets in catalog.cdamAssets.values())},
+    "cdam-async": {"dir": "cdgc_purge_content", "script": "cdgc_delete_cdam_assets", "settings": {"executionMode": "async"},
+                   "remaining": lambda catalog: sum(len(assets) for assets in catalog.cdamAssets.values())},
+    "technical-thread": {"dir": "cdgc_purge_content", "script": "cdgc_delete_technical_assets", "argv": ["-a", "-d", "-e", "thread"],
+                         "settings": {"statusPollInitial": 0.2, "statusPollMax": 1}, "remaining": lambda catalog: len(catalog.sources)},
+    "technical-async": {"dir": "cdgc_purge_content", "script": "cdgc_delete_technical_assets", "argv": ["-a", "-d", "-e", "async"],
+                        "settings": {"statusPollInitial": 0.2, "statusPollMax": 1}, "remaining": lambda catalog: len(catalog.sources)},
+    "lineage-list": {"dir": "cdgc_lineage", "script": "cdgc_list_object_lineage", "argv": ["-s", "dataset"]},
+    "lineage-export": {"dir": "cdgc_lineage", "script": "cdgc_export_lineage", "argv": ["-a", "ds-000002"]},
+    "notification": {"dir": "notifications", "script": "idmc_send_bell_notification", "argv": ["-t", "Benchmark", "-m", "Benchmark run", "-e", "user1"]}
+}
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Child process -- runs one script against the mock
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def run_child(name, url, resultFile):
+
+    scenario = scenarios[name]
+
+    sys.path.insert(0, str(repoRoot / scenario['dir']))
+    module = importlib.import_module(scenario['script'])
+
+    module.login_url = module.cdgc_api_url = module.idmc_pod_url = url
+    module.username, module.password = benchUser, benchPassword
+    module.credentialCache = ""
+    for setting, value in scenario.get('settings', {}).items():
+        setattr(module, setting, value)
+
+    result = {"ok": True}
+    started = time.perf_counter()
+    try:
+        if "argv" in scenario:
+            module.main([scenario['script'] + ".py"] + scenario['argv'])
+        else:
+            module.main(benchUser, benchPassword, 9999)
+    except SystemExit as e:
+        result = {"ok": not e.code, "error": f"exit {e.code}"}
+    except Exception as e:
+        result = {"ok": False, "error": repr(e)}
+    result['wall'] = time.perf_counter() - started
+
+    with open(resultFile, "w") as childResult:
+        json.dump(result, childResult)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def run_scenario(name, profile, timeout, keep):
+
+    server = mock_server.MockServer(profile).start()
+    workDir = tempfile.mkdtemp(prefix=f"idmc_bench_{name}_")
+    logFile = os.path.join(workDir, "script.log")
+    resultFile = os.path.join(workDir, "result.json")
+
+    logging.info(f"Running {name}")
+
+    try:
+        with open(logFile, "w") as scriptLog:
+            child = subprocess.run([sys.executable, str(Path(__file__).resolve()), "--child", name, "--url", server.url, "--result", resultFile],
+                                   cwd=workDir, stdout=scriptLog, stderr=subprocess.STDOUT, timeout=timeout)
+        if os.path.isfile(resultFile):
+            with open(resultFile) as childResultFile:
+                childResult = json.load(childResultFile)
+        else:
+            childResult = {"ok": False, "error": f"exit {child.returncode}", "wall": 0}
+    except subprocess.TimeoutExpired:
+        childResult = {"ok": False, "error": f"timed out after {timeout}s", "wall": timeout}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    stats = server.catalog.stats()
+    wall = childResult['wall']
+
+    result = {
+        "scenario": name,
+        "ok": childResult['ok'],
+        "error": childResult.get('error', ""),
+        "wall": wall,
+        "requests": stats['requests'],
+        "errors": stats['errors'],
+        "rps": stats['requests'] / wall if wall else 0.0,
+        "p50": stats['p50'],
+        "p99": stats['p99'],
+        "connections": stats['connections'],
+        "families": stats['families']
+    }
+    if "remaining" in scenarios[name]:
+        result['remaining'] = scenarios[name]['remaining'](server.catalog)
+
+    if not result['ok']:
+        with open(logFile) as scriptLog:
+            logging.error(f"{name} failed ({result['error']}), last lines of {logFile}:\n" + "".join(scriptLog.readlines()[-15:]))
+
+    if keep or not result['ok']:
+        logging.info(f"    - Output kept in {workDir}")
+    else:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return result
+
+
+def print_report(results, baseline):
+
+    print()
+    print(f"{'Scenario':<18} {'Requests':>9} {'Errors':>7} {'Wall s':>8} {'Req/s':>9} {'p50 ms':>8} {'p99 ms':>8}  {'vs baseline':<24}")
+    print("-" * 100)
+
+    for result in results:
+        comparison = ""
+        previous = baseline.get(result['scenario'])
+        if previous and previous['wall'] and previous['rps']:
+            comparison = f"wall {100 * (result['wall'] / previous['wall'] - 1):+.1f}%  req/s {100 * (result['rps'] / previous['rps'] - 1):+.1f}%"
+
+        status = "" if result['ok'] else "  FAILED"
+        print(f"{result['scenario']:<18} {result['requests']:>9} {result['errors']:>7} {result['wall']:>8.2f} {result['rps']:>9.1f} "
+              f"{1000 * result['p50']:>8.1f} {1000 * result['p99']:>8.1f}  {comparison:<24}{status}")
+
+    print()
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Benchmark the IDMC / CDGC scripts against the mock server")
+    parser.add_argument("--scenarios", default=",".join(scenarios), help="comma separated scenarios (default: all), one of " + ", ".join(scenarios))
+    parser.add_argument("--timeout", type=int, default=600, help="seconds before a scenario is stopped")
+    parser.add_argument("--json", dest="jsonFile", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory (logs, journals, CSVs) of every scenario")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    mock_server.profile_arguments(parser)
+    args = parser.parse_args(argv[1:])
+
+    if args.child:
+        run_child(args.child, args.url, args.result)
+        return
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)-5s - %(message)s')
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        logging.error(f"Unknown scenario(s): {', '.join(unknown)}")
+        sys.exit(2)
+
+    profile = mock_server.profile_from_arguments(args)
+    logging.info(f"Profile {args.profile}: {json.dumps(profile)}")
+
+    results = [run_scenario(name, profile, args.timeout, args.keep) for name in names]
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as baselineFile:
+            baseline = {result['scenario']: result for result in json.load(baselineFile)['results']}
+
+    print_report(results, baseline)
+
+    if args.jsonFile:
+        with open(args.jsonFile, "w") as resultsFile:
+            json.dump({"profile": args.profile, "settings": profile, "results": results}, resultsFile, indent=2)
+        logging.info(f"Results written to {args.jsonFile}")
+
+    if not all(result['ok'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,166 @@
+import os
+import time
+import sqlite3
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Local SQLite copy of the catalog written by cdgc_snapshot_catalog.py, so analyses can run at disk speed instead of querying the API.
+#
+#   assets  - one row per asset: identity, name, class type, resource name and type, and the lineage link count and deepest hop the
+#             details API reported for it (what cdgc_list_object_lineage.py filters on)
+#   edges   - one row per lineage link (source -> target) and the asset whose lineage reported it. A link is usually reported by the assets
+#             at both ends, use "select distinct source, target" for the graph
+#   meta    - key / value: the search the snapshot was taken with and when it was last refreshed
+#
+# Indexes cover the lookups the scripts make: assets by name and by resource, edges by source, by target and by reporting asset. A full
+# snapshot is built in a new file next to the old one and renamed over it when complete, so a reader never sees a half written snapshot.
+# An incremental refresh updates the file in place, one transaction per batch of assets.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+schema = """
+create table if not exists assets (
+    id text primary key,
+    name text,
+    classType text,
+    resourceName text,
+    resourceType text,
+    lineageLinks integer not null default 0,
+    lineageHops integer not null default 0,
+    refreshed real
+);
+create table if not exists edges (
+    source text not null,
+    target text not null,
+    sourceName text,
+    sourceType text,
+    targetName text,
+    targetType text,
+    asset text not null,
+    primary key (source, target, asset)
+) without rowid;
+create table if not exists meta (
+    key text primary key,
+    value text
+);
+create index if not exists assetsName on assets (name);
+create index if not exists assetsResource on assets (resourceName, resourceType);
+create index if not exists edgesSource on edges (source);
+create index if not exists edgesTarget on edges (target);
+create index if not exists edgesAsset on edges (asset);
+"""
+
+
+def asset_id(uri):
+
+    # Asset ID out of a lineage URI (.../data360/assets/<id>?scheme=internal), the same way cdgc_export_lineage.py reads it
+    return uri.split("/")[5].split("?")[0]
+
+
+def asset_record(asset):
+
+    # Converts one asset of a bulk details response into (asset row, edge rows), so only what the snapshot keeps stays in memory
+    assetID = asset['core.identity']
+    links = hops = 0
+    edges = {}
+
+    for lineage in asset.get('lineage', []):
+        for hop in lineage['hops']:
+            links = links + len(hop['items'])
+            hops = max(hops, hop['distance'])
+            for item in hop['items']:
+                source, target = asset_id(item['details']['fromUri']), asset_id(item['details']['toUri'])
+                edges[(source, target)] = (source, target, item.get('from'), item.get('fromType'), item.get('to'), item.get('toType'), assetID)
+
+    row = (assetID, asset.get('summary', {}).get('core.name'), asset.get('systemAttributes', {}).get('core.classType'),
+           asset.get('selfAttributes', {}).get('core.resourceName'), asset.get('selfAttributes', {}).get('core.resourceType'),
+           links, hops, time.time())
+
+    return row, list(edges.values())
+
+
+class CatalogSnapshot:
+
+    def __init__(self, fileName, create=False):
+
+        # create=True starts an empty snapshot in fileName + ".new", commit_full() moves it into place
+        self.fileName = fileName
+        self.path = fileName + ".new" if create else fileName
+
+        if create and os.path.exists(self.path):
+            os.remove(self.path)
+        if not create and not os.path.isfile(self.path):
+            raise FileNotFoundError(f"No catalog snapshot {self.path}, take one with cdgc_snapshot_catalog.py")
+
+        # Rollback journal rather than WAL, so the file is complete on its own when it is renamed. A new snapshot isn't synced to disk
+        # while it is built, if the machine goes down it is simply taken again
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+        if create:
+            self.db.execute("pragma synchronous = off")
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def get_meta(self, key, default=None):
+
+        row = self.db.execute("select value from meta where key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.db.execute("insert or replace into meta (key, value) values (?, ?)", (key, str(value)))
+
+    def write_assets(self, records):
+
+        # records are asset_record() results. The edges an asset reported are replaced, so a refresh drops links that are gone
+        self.db.execute("begin")
+        try:
+            for row, edges in records:
+                self.db.execute("delete from edges where asset = ?", (row[0],))
+                self.db.execute("insert or replace into assets values (?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self.db.executemany("insert or replace into edges values (?, ?, ?, ?, ?, ?, ?)", edges)
+            self.db.execute("commit")
+        except BaseException:
+            self.db.execute("rollback")
+            raise
+
+    def commit_full(self):
+
+        # Renames the new snapshot over the old one
+        self.db.close()
+        os.replace(self.path, self.fileName)
+        self.path = self.fileName
+        self.db = sqlite3.connect(self.path, isolation_level=None)
+
+    def counts(self):
+        return (self.db.execute("select count(*) from assets").fetchone()[0],
+                self.db.execute("select count(*) from (select distinct source, target from edges)").fetchone()[0])
+
+    def asset(self, assetID):
+
+        # Assets outside the snapshot's search are only known by the name and class type the lineage links give them
+        row = self.db.execute("select id, name, classType, resourceName, resourceType from assets where id = ?", (assetID,)).fetchone()
+        if row is None:
+            row = self.db.execute("select source, sourceName, sourceType, '', '' from edges where source = ? union all "
+                                  "select target, targetName, targetType, '', '' from edges where target = ? limit 1", (assetID, assetID)).fetchone()
+
+        return dict(zip(("id", "name", "classType", "resourceName", "resourceType"), row)) if row else None
+
+    def find_assets(self, name="", resourceName="", resourceType=""):
+
+        # IDs of the assets whose name contains name, optionally in one resource or resource type
+        query = "select id from assets where name like ? escape '\\'"
+        parameters = ["%" + name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"]
+        if resourceName:
+            query = query + " and resourceName = ?"
+            parameters.append(resourceName)
+        if resourceType:
+            query = query + " and resourceType = ?"
+            parameters.append(resourceType)
+
+        return [row[0] for row in self.db.execute(query, parameters)]
+
+    def edges(self):
+
+        # Every distinct lineage link, as (source, target)
+        return self.db.execute("select distinct source, target from edges")
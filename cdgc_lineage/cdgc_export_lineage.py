@@ -1,10 +1,11 @@
 import json
-import requests
 import sys
 import getopt
 from csv import writer
 from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, coalesce, credentials, httpcache, metrics, profiling, progress, ratelimit, tracing
 import logging
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
@@ -14,10 +15,13 @@ import logging
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
 loglevel = 1
+metricsInterval = 0
+profileMode = ""
+assetRequests = coalesce.Coalescer("get_asset", coalesceCacheSize, coalesceCacheSeconds)
 processedAssets = []
 mainAssetInfo = []
-sessionID = []
 idmcUsers = []
+exportProgress = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,59 +32,28 @@ logging.basicConfig(
 # Functions
 # ----------------------------------------------------------------------------------------------------------------------------------------------
 
-def idmc_login(username, password, url):
-
-    logging.info("Login to IDMC server")
-    
-    url = url + "/identity-service/api/v1/Login"
-    raw_data = '{"username": "' + username + '","password": "' + password + '"}'
-    headers = {'Content-type': 'application/json'}
-
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
-
-    if response.status_code == 400:
-        logging.info("Error Logging in")
-        print(response.text)
-        exit(1)
-
-    return loginInfo
-
-
-def generate_token(sessionID, url):
-
-    logging.info("Generate Bearer Token")
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {'Content-type': 'application/json', 'cookie': 'USER_SESSION=' + sessionID, 'IDS-SESSION-ID': sessionID}
-
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
-
-    return tokenJson
-
-
-def get_idmc_users(url, bearToken):
-
-    global sessionID
+def get_idmc_users(url):
 
     logging.info("Getting Platform Users")
     url = url + "/saas/public/core/v3/users"
 
-    headers = {'Content-type': 'application/json', 'Authorization': 'Bearer ' + bearToken, 'INFA-SESSION-ID': sessionID}
-    response = requests.get(url, headers=headers)
+    response = client.get("identity", url, headers={'INFA-SESSION-ID': client.sessionID})
     resultJson = response.text
 
     return json.loads(resultJson)
 
 
-def get_asset(url, orgID, bearToken):
+def get_asset(url):
+
+    # The starting asset and the first inbound lineage level are the same request, the second one comes from the cache
+    return assetRequests.call(url, fetch_asset, url)
+
+
+def fetch_asset(url):
     
     logging.debug("Getting Asset")
 
-    headers = {'Content-type': 'application/json', 'X-INFA-ORG-ID': orgID, 'Authorization': 'Bearer ' + bearToken}
-    response = requests.get(url, headers=headers)
+    response = client.conditional("search", "GET", url)
     assetInfo = response.text
 
     if response.status_code != 200:
@@ -93,52 +66,56 @@ def get_asset(url, orgID, bearToken):
     return assetInfo
 
 
-def process_lineage(assetID, loginInfo, bearToken, direction, writeFileFlag):
+def process_lineage(assetID, direction, writeFileFlag):
     global processedAssets
     stakeholderList = []
 
-    url = cdgc_api_url + "/data360/search/v1/assets/" + assetID + "?scheme=internal&segments=all,lineage-direction:" + direction
-    assetInfo = get_asset(url, loginInfo['orgId'], bearToken)
-
-    if assetInfo is not None:
-        logging.info("    - Asset Name : " + assetInfo['summary']['core.name'])
-        logging.info("    - Asset Type : " + assetInfo['systemAttributes']['core.classType'])
-        logging.info("    - Resource name : " + assetInfo['selfAttributes']['core.resourceName'])
-        logging.info("    - Resource type : " + assetInfo['selfAttributes']['core.resourceType'])
-        #json_formatted_str = json.dumps(assetInfo, indent=2)
-        #print(json_formatted_str)
-
-    #if assetInfo is not None and 'stakeholdership' in assetInfo:
-    stakeholderList = []
-
-    if writeFileFlag == "Y":
-        write_output(assetInfo, direction, stakeholderList)
-
-    # Process Lineage for this object
-    if assetInfo is not None and 'lineage' in assetInfo:
-        for lineage in assetInfo['lineage']:
-            for hops in lineage['hops']:
-                logging.info("    - Lineage found!")
-                for lineageItems in hops['items']:
-                    if direction == "inbound":
-                        lineageField = "fromUri"
-                        lineageTitle = "from"
-                        lineageType = "fromType"
-                    else:
-                        lineageField = "toUri"
-                        lineageTitle = "to"
-                        lineageType = "toType"
-
-                    relatedAssetID = lineageItems['details'][lineageField].split("/")[5]
-                    relatedAssetID = relatedAssetID.split("?")[0]
-
-                    if relatedAssetID in processedAssets:
-                        logging.info("    - Loop found, skipping")
-                    else:
-                        processedAssets.append(relatedAssetID)
-                        logging.info("    - Found Lineage To : " + lineageItems[lineageTitle] + " (" + lineageItems[lineageType] + ")")
-                        logging.info("    - -----------------")
-                        process_lineage(relatedAssetID, loginInfo, bearToken, direction, "Y")
+    # One span per asset, nested by lineage level since the function recurses for every related asset
+    with tracing.span("lineage " + direction, {"idmc.assetId": assetID}):
+        url = cdgc_api_url + "/data360/search/v1/assets/" + assetID + "?scheme=internal&segments=all,lineage-direction:" + direction
+        assetInfo = get_asset(url)
+        exportProgress.advance()
+
+        if assetInfo is not None:
+            logging.info("    - Asset Name : " + assetInfo['summary']['core.name'])
+            logging.info("    - Asset Type : " + assetInfo['systemAttributes']['core.classType'])
+            logging.info("    - Resource name : " + assetInfo['selfAttributes']['core.resourceName'])
+            logging.info("    - Resource type : " + assetInfo['selfAttributes']['core.resourceType'])
+            #json_formatted_str = json.dumps(assetInfo, indent=2)
+            #print(json_formatted_str)
+
+        #if assetInfo is not None and 'stakeholdership' in assetInfo:
+        stakeholderList = []
+
+        if writeFileFlag == "Y":
+            write_output(assetInfo, direction, stakeholderList)
+
+        # Process Lineage for this object
+        if assetInfo is not None and 'lineage' in assetInfo:
+            for lineage in assetInfo['lineage']:
+                for hops in lineage['hops']:
+                    logging.info("    - Lineage found!")
+                    for lineageItems in hops['items']:
+                        if direction == "inbound":
+                            lineageField = "fromUri"
+                            lineageTitle = "from"
+                            lineageType = "fromType"
+                        else:
+                            lineageField = "toUri"
+                            lineageTitle = "to"
+                            lineageType = "toType"
+
+                        relatedAssetID = lineageItems['details'][lineageField].split("/")[5]
+                        relatedAssetID = relatedAssetID.split("?")[0]
+
+                        if relatedAssetID in processedAssets:
+                            logging.info("    - Loop found, skipping")
+                        else:
+                            processedAssets.append(relatedAssetID)
+                            exportProgress.add_total(1)
+                            logging.info("    - Found Lineage To : " + lineageItems[lineageTitle] + " (" + lineageItems[lineageType] + ")")
+                            logging.info("    - -----------------")
+                            process_lineage(relatedAssetID, direction, "Y")
 
 
 def write_output(assetInfo, direction, stakeholderList):
@@ -170,19 +147,21 @@ def write_output(assetInfo, direction, stakeholderList):
 def main(argv):
     # Set Parameters
     global mainAssetInfo
-    global sessionID
     global idmcUsers
+    global metricsInterval, profileMode, exportProgress
 
     assetID = ""
 
     arg_help = f"""cdgc_export_lineage.py -a <asset_id>
         -h              help
         -a <asset id>   ID of the asset 
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase
     """.format(argv[0])
 
     # Fetch and Test Command Line Arguments
     try:
-        opts, args = getopt.getopt(argv[1:], "ha:", ["help", "asset="])
+        opts, args = getopt.getopt(argv[1:], "ha:", ["help", "asset=", "metrics-interval=", "profile="])
         arg1 = argv[1]
     except IndexError:
         print(arg_help)
@@ -194,34 +173,53 @@ def main(argv):
             sys.exit(2)
         elif opt in ("-a", "--asset"):
             assetID = arg
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
 
     logging.info("Starting")
     logging.info("Parameters")
     logging.info("    - Starting Asset ID: " + assetID)
 
     # Login and set variables
-    loginInfo = idmc_login(username, password, login_url)
-    sessionID = loginInfo['sessionId']
-    tokenJson = generate_token(loginInfo['sessionId'], login_url)
-    bearToken = tokenJson['jwt_token']
+    ratelimit.configure(rateLimits, rateLimitBurst)
+    metrics.configure("cdgc_export_lineage", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_export_lineage", traceFile)
+    profiling.configure("cdgc_export_lineage", profileMode, profileFile, profileInterval)
+    progress.configure(progressDisplay, progressReportSeconds)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    httpcache.configure(httpCacheFile, httpCacheDays)
+    logging.info("Login to IDMC server")
+    with tracing.span("login"):
+        credentials.login(username, password, login_url)
 
     url = cdgc_api_url + "/data360/search/v1/assets/" + assetID + "?scheme=internal&segments=all,lineage-direction:inbound"
-    mainAssetInfo = get_asset(url, loginInfo['orgId'], bearToken)
+    with tracing.span("starting asset"):
+        mainAssetInfo = get_asset(url)
     logging.info("    - Starting Asset Name: " + mainAssetInfo['summary']['core.name'])
 
-    idmcUsers = get_idmc_users("https://usw5.dm-us.informaticacloud.com", bearToken)
+    with tracing.span("platform users"):
+        idmcUsers = get_idmc_users(idmc_pod_url)
+
+    # The total grows as lineage is found, the starting asset is read once per direction
+    exportProgress = progress.Progress("Export", 2, "assets", ("search",))
 
     # Getting Inbound Lineage
     logging.info("Getting Inbound Lineage Path")
     processedAssets.clear()
     processedAssets.append(assetID)
-    process_lineage(assetID, loginInfo, bearToken, "inbound", "N")
+    process_lineage(assetID, "inbound", "N")
     logging.info("No More Inbound Lineage")
 
     # Getting Outbound Lineage
     logging.info("Getting Outbound Lineage Path")
-    process_lineage(assetID, loginInfo, bearToken, "outbound", "N")
+    process_lineage(assetID, "outbound", "N")
     logging.info("No More Outbound Lineage")
+    exportProgress.finish()
 
     logging.info("Script Finished")
 
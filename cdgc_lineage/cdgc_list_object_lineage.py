@@ -1,13 +1,15 @@
+import re
 import json
 import datetime
 import requests
+from urllib3.exceptions import ReadTimeoutError
 import sys
 import getopt
 import logging
-
-from requests_toolbelt.multipart.encoder import total_len
-
+from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, httpcache, metrics, profiling, progress, ratelimit, tracing
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 # Overview -
@@ -16,6 +18,8 @@ from setup import *
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
 loglevel = 1
+metricsInterval = 0
+profileMode = ""
 bulkAssetLimit = 5
 searchAssetCount = 50  # Max 100 due to API limitations, recommend set to a factor of 5
 apiTimeout = 120
@@ -29,81 +33,100 @@ logging.basicConfig(
 # Functions
 # ----------------------------------------------------------------------------------------------------------------------------------------------
 
-def idmc_login(username, password, url):
-
-    logging.info("Logging into IDMC")
-
-    url = url + "/identity-service/api/v1/Login"
-    raw_data = '{"username": "' + username + '","password": "' + password + '"}'
-    headers = {'Content-type': 'application/json'}
+def search_cdgc(url, searchTerm, segments, startpos=0):
 
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
+    global searchAssetCount
 
-    if response.status_code == 400:
-        logging.error("Error Logging in")
-        print(response.text)
-        exit(1)
+    logging.info("Searching for : " + searchTerm + " (row start = " + str(startpos) + ")")
+    url = url + "/data360/search/v1/assets?knowledgeQuery=" + searchTerm + "&segments=" + segments
 
-    return loginInfo
+    raw_data = '{"from": ' + str(startpos) + ',"size": ' + str(searchAssetCount) + '}'
 
+    response = client.conditional("search", "POST", url, data=raw_data)
+    searchResults = response.text
+    searchResults = json.loads(searchResults)
 
-def generate_token(sessionID, url):
+    logging.debug("    - API Response code = " + str(response.status_code))
 
-    logging.info("Generating Bearer Token")
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {'Content-type': 'application/json', 'cookie': 'USER_SESSION=' + sessionID, 'IDS-SESSION-ID': sessionID}
+    return searchResults
 
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
 
-    return tokenJson
+def with_segments(url, segments):
+    return re.sub(r"segments=[^&]*", "segments=" + segments, url)
 
 
-def search_cdgc(url, orgID, bearToken, searchTerm, segments, startpos=0):
+def asset_version(asset):
+    return asset.get('systemAttributes', {}).get(assetModifiedAttribute)
 
-    global searchAssetCount
 
-    logging.info("Searching for : " + searchTerm + " (row start = " + str(startpos) + ")")
-    url = url + "/data360/search/v1/assets?knowledgeQuery=" + searchTerm + "&segments=" + segments
+def current_lineage(url, assetIDs, lineageSegments):
 
-    raw_data = '{"from": ' + str(startpos) + ',"size": ' + str(searchAssetCount) + '}'
-    headers = {'Content-type': 'application/json', 'X-INFA-ORG-ID': orgID, 'Authorization': 'Bearer ' + bearToken}
+    # Modified time and lineage of each asset, from a details call without the attribute segments, {} when it fails
+    segments = ",".join(["systemAttributes"] + lineageSegments)
+    try:
+        response, assetInfo = client.request_items("search", "POST", with_segments(url, segments), "item", data=json.dumps(assetIDs), timeout=apiTimeout)
+    except (requests.exceptions.Timeout, ReadTimeoutError):
+        return {}
 
-    response = requests.post(url, headers=headers, data=raw_data)
-    searchResults = response.text
-    searchResults = json.loads(searchResults)
+    return {asset.get('core.identity'): asset for asset in assetInfo or [] if asset_version(asset)}
 
-    logging.debug("    - API Response code = " + str(response.status_code))
 
-    return searchResults
+def cached_part(asset):
+    return {key: value for key, value in asset.items() if key != "lineage"}
 
 
-def get_asset_bulk(url, orgID, bearToken, assets):
+def get_asset_bulk(url, assets):
 
     global apiTimeout
 
     logging.debug("Getting Assets from API")
 
     raw_data = assets
-    headers = {'Content-type': 'application/json', 'X-INFA-ORG-ID': orgID, 'Authorization': 'Bearer ' + bearToken}
-
+    requestUrl = url
+
+    # Only the attributes of an asset are kept in the HTTP cache, they are reused while the asset's modified time hasn't changed. Its
+    # lineage can change without that (a link added anywhere within its distance), so the lineage of the cached assets is fetched again
+    # every time, in the same call as their modified times. The fetched assets are asked for with their system attributes, to store them
+    # with their modified time
+    cachedAssets = {}
+    if httpcache.enabled():
+        assetIDs = json.loads(assets)
+        segments = re.search(r"segments=([^&]*)", url)
+        segments = segments.group(1).split(",") if segments else []
+        cachedAssets = httpcache.get_items(client.orgID, url, assetIDs)
+        if cachedAssets:
+            current = current_lineage(url, list(cachedAssets), [segment for segment in segments if segment.startswith("lineage")])
+            cachedAssets = {assetID: dict(asset, **{key: value for key, value in current[assetID].items() if key not in asset})
+                            for assetID, (version, asset) in cachedAssets.items()
+                            if assetID in current and str(asset_version(current[assetID])) == version}
+            httpcache.reused_items(client.orgID, url, cachedAssets)
+        if len(cachedAssets) == len(assetIDs):
+            return [cachedAssets[assetID] for assetID in assetIDs]
+
+        raw_data = json.dumps([assetID for assetID in assetIDs if assetID not in cachedAssets], indent=2)
+        if segments and "systemAttributes" not in segments:
+            requestUrl = with_segments(url, ",".join(segments + ["systemAttributes"]))
+
+    # The asset details come back as one array, the assets are decoded one at a time from the response stream
     try:
-        response = requests.post(url, headers=headers, data=raw_data, timeout=apiTimeout)
-        assetInfo = response.text
+        response, assetInfo = client.request_items("search", "POST", requestUrl, "item", data=raw_data, timeout=apiTimeout)
         logging.debug("    - API Response code = " + str(response.status_code))
 
-        if response.status_code != 200:
+        if assetInfo is None:
             logging.error("Error getting assets. Unexpected response code")
             return
-        else:
-            assetInfo = json.loads(assetInfo)
+
+        if httpcache.enabled():
+            httpcache.put_items(client.orgID, url, [(asset.get('core.identity'), asset_version(asset), cached_part(asset)) for asset in assetInfo])
+
+        # In the order of the request, the cached assets in their place
+        if cachedAssets:
+            fetched = {asset.get('core.identity'): asset for asset in assetInfo}
+            return [cachedAssets.get(assetID) or fetched[assetID] for assetID in assetIDs if assetID in cachedAssets or assetID in fetched]
 
         return assetInfo
 
-    except requests.exceptions.Timeout:
+    except (requests.exceptions.Timeout, ReadTimeoutError):
         logging.error("API Call Timed Out! Skipping!")
         return ""
 
@@ -113,7 +136,7 @@ def get_asset_bulk(url, orgID, bearToken, assets):
 # ----------------------------------------------------------------------------------------------------------------------------------------------
 def main(argv):
 
-    global searchAssetCount
+    global searchAssetCount, metricsInterval, profileMode
 
     searchTerm =  resourceName =  resourceType = ""
     lineageHops = lineageAssets = totalAssets = assetsLeft = matchCount = maxDistance = 0
@@ -128,11 +151,13 @@ def main(argv):
         -l  <levels>    Number of levels/hops to search for. 2 to 5. APIs do not return anything more than 5 levels (optional) 
         -a  <count>     Asset Count - Lineage must contain at least this many assets (optional)
         -x              Supress Output for Assets that have no lineage (optional)
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run (optional)
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase (optional)
     """.format(argv[0])
 
     # Fetch and Test Command Line Arguments
     try:
-        opts, args = getopt.getopt(argv[1:], "hs:r:t:l:a:x", ["help", "search=", "resource_name=", "resource_type=", "levels=", "assets=", "supress"])
+        opts, args = getopt.getopt(argv[1:], "hs:r:t:l:a:x", ["help", "search=", "resource_name=", "resource_type=", "levels=", "assets=", "supress", "metrics-interval=", "profile="])
         arg1 = argv[1]
     except IndexError:
         print(arg_help)
@@ -154,6 +179,13 @@ def main(argv):
             lineageAssets = arg
         elif opt in ("-x", "--supress"):
             supressAssetsFlag = "Y"
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
 
     logging.info("Starting Script")
     logging.info("Search Parameters - Search Term: " + searchTerm)
@@ -171,9 +203,16 @@ def main(argv):
         logging.info("Search Parameters - Lineage Assets: " + str(lineageAssets))
 
     # Login and set variables
-    loginInfo = idmc_login(username, password, login_url)
-    tokenJson = generate_token(loginInfo['sessionId'], login_url)
-    bearToken = tokenJson['jwt_token']
+    ratelimit.configure(rateLimits, rateLimitBurst)
+    metrics.configure("cdgc_list_object_lineage", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_list_object_lineage", traceFile)
+    profiling.configure("cdgc_list_object_lineage", profileMode, profileFile, profileInterval)
+    progress.configure(progressDisplay, progressReportSeconds)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    httpcache.configure(httpCacheFile, httpCacheDays)
+    logging.info("Logging into IDMC")
+    with tracing.span("login"):
+        credentials.login(username, password, login_url)
 
     # Do a search -- this gets our # of assets we need to start and the first X items, based on searchAssetCount variable
     finalSearchTerm = "(technical dataset *" + searchTerm + "*) "
@@ -185,7 +224,8 @@ def main(argv):
 
     logging.info("Searching for Assets")
     logging.info("Search Syntax : " + finalSearchTerm)
-    searchResults = search_cdgc(cdgc_api_url, loginInfo['orgId'], tokenJson['jwt_token'], finalSearchTerm, "summary")
+    with tracing.span("search"):
+        searchResults = search_cdgc(cdgc_api_url, finalSearchTerm, "summary")
 
     if searchResults:
         totalAssets = searchResults['summary']['total_hits']
@@ -195,6 +235,8 @@ def main(argv):
         logging.info("Search Term did not find any results")
 
     if searchResults:
+        scanProgress = progress.Progress("Scan", int(totalAssets), "assets", ("search",), lambda: f"{matchCount} with lineage")
+
         # Loop through search results
         for i in range(0, int(totalAssets), searchAssetCount):
 
@@ -204,7 +246,8 @@ def main(argv):
             else:
                 logging.info("Checking remaining assets")
 
-            searchResults = search_cdgc(cdgc_api_url, loginInfo['orgId'], tokenJson['jwt_token'], finalSearchTerm, "summary", i)
+            with tracing.span("search page", {"idmc.from": i}):
+                searchResults = search_cdgc(cdgc_api_url, finalSearchTerm, "summary", i)
 
             bulkCount = 0
             assetJson = []
@@ -218,7 +261,8 @@ def main(argv):
                 # If we reached our limit, start the search process
                 if bulkCount == bulkAssetLimit:
                     url = cdgc_api_url + "/data360/search/v1/assets/details?scheme=internal&segments=selfAttributes,summary,lineage-level,lineage-distance:5"
-                    assetResults = get_asset_bulk(url, loginInfo['orgId'], bearToken, json.dumps(assetJson, indent=2))
+                    with tracing.span("bulk fetch", {"idmc.assets": len(assetJson)}):
+                        assetResults = get_asset_bulk(url, json.dumps(assetJson, indent=2))
 
                     try:
                         for bulk_asset in assetResults:
@@ -246,6 +290,8 @@ def main(argv):
                     except (Exception,):
                         logging.error("##### ERROR With Parsing Asset Results!", 1)
 
+                    scanProgress.advance(len(assetJson))
+
                     # reset our controls before the next loop
                     bulkCount = 0
                     assetJson = []
@@ -253,6 +299,9 @@ def main(argv):
             # need to add handler for when there is less than 5 assets
             if bulkCount < 5 & bulkCount > 0:
                 logging.info("Less than 5 assets are left, these are skipped for now")
+                scanProgress.advance(bulkCount)
+
+        scanProgress.finish()
 
     logging.info("Script Completed")
 
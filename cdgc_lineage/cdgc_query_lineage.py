@@ -0,0 +1,223 @@
+import sys
+import getopt
+import logging
+from csv import writer
+from pathlib import Path
+from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import profiling, tracing
+import catalog_snapshot
+import lineage_graph
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Answers lineage questions from a catalog snapshot (take one with cdgc_snapshot_catalog.py) instead of the API, so it makes no API calls
+# and needs no login. The lineage links are loaded into lineage_graph.py and each query takes milliseconds.
+#
+#   -a <asset id>                   inbound and outbound lineage of the asset, written to <asset name>_inbound.csv and _outbound.csv in the
+#                                   same format as cdgc_export_lineage.py
+#   -a <asset id> -p <asset id>     shortest lineage path from the first asset to the second
+#   -i <asset id>,<asset id>,...    impact set: every asset downstream of any of them, written to <first asset name>_impact.csv
+#   -s / -r / -t / -l / -c          assets with lineage, like cdgc_list_object_lineage.py (-c is its -a, the lineage link count)
+#
+# The results are as fresh as the snapshot, refresh it first when that matters.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+loglevel = 1
+profileMode = ""
+maxLineageDistance = 5      # the details API doesn't return lineage further than this, the list query uses the same limit
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)-5s - %(message)s'
+)
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+
+def write_output(snapshot, fileName, assetIDs):
+
+    # Same columns as cdgc_export_lineage.py, the stakeholders aren't in the snapshot so the column is empty there too
+    logging.info(f"    - Writing {len(assetIDs)} assets to {fileName}")
+
+    with open(fileName, 'w', newline='') as fileCSV:
+        csvAppend = writer(fileCSV)
+        csvAppend.writerow(["Name", "Asset ID", "Class Type", "Resource Name", "Resource Type", "Stakeholders", "Asset URL"])
+        for assetID in assetIDs:
+            assetInfo = snapshot.asset(assetID) or {"name": "", "classType": "", "resourceName": "", "resourceType": ""}
+            csvAppend.writerow([assetInfo['name'], assetID, assetInfo['classType'], assetInfo['resourceName'], assetInfo['resourceType'], "", assetID])
+
+
+def asset_name(snapshot, assetID):
+
+    assetInfo = snapshot.asset(assetID)
+    if assetInfo is None:
+        logging.error(f"Asset {assetID} is not in the snapshot")
+        exit(1)
+
+    return assetInfo['name']
+
+
+def export_lineage(snapshot, graph, assetID):
+
+    mainAssetName = asset_name(snapshot, assetID)
+    logging.info("    - Starting Asset Name: " + mainAssetName)
+
+    for direction in (lineage_graph.INBOUND, lineage_graph.OUTBOUND):
+        with tracing.span("lineage " + direction):
+            reached = graph.closure([assetID], direction)
+        logging.info(f"{len(reached)} assets in the {direction} lineage, {max((distance for related, distance in reached), default=0)} levels deep")
+        write_output(snapshot, mainAssetName + "_" + direction + ".csv", [related for related, distance in reached])
+
+
+def shortest_path(snapshot, graph, sourceID, targetID):
+
+    with tracing.span("shortest path"):
+        path = graph.shortest_path(sourceID, targetID)
+
+    if path is None:
+        logging.info(f"No lineage path from {sourceID} to {targetID}")
+        return
+
+    logging.info(f"Lineage path of {len(path) - 1} links")
+    for assetID in path:
+        assetInfo = snapshot.asset(assetID)
+        logging.info(f"    - {assetInfo['name']} ({assetInfo['classType']}) {assetID}")
+
+
+def impact_set(snapshot, graph, assetIDs):
+
+    mainAssetName = asset_name(snapshot, assetIDs[0])
+
+    with tracing.span("impact"):
+        reached = graph.closure(assetIDs, lineage_graph.OUTBOUND)
+    logging.info(f"{len(reached)} assets are downstream of {len(assetIDs)} assets")
+
+    write_output(snapshot, mainAssetName + "_impact.csv", [related for related, distance in reached])
+
+
+def list_lineage(snapshot, graph, searchTerm, resourceName, resourceType, lineageHops, lineageAssets):
+
+    with tracing.span("search"):
+        assetIDs = snapshot.find_assets(searchTerm, resourceName, resourceType)
+    logging.info("Found " + str(len(assetIDs)) + " assets")
+
+    with tracing.span("link counts", {"idmc.assets": len(assetIDs)}):
+        counts = graph.link_counts(assetIDs, maxLineageDistance)
+
+    matchCount = 0
+    for assetID in assetIDs:
+        lineageCount, maxDistance = counts.get(assetID, (0, 0))
+        if lineageCount >= 1 and maxDistance >= lineageHops and lineageCount >= lineageAssets:
+            matchCount = matchCount + 1
+            assetInfo = snapshot.asset(assetID)
+            logging.info(f"Asset : {assetInfo['name']} (Resource : {assetInfo['resourceName']})")
+            logging.info(f"    - This asset has lineage!")
+            logging.info("    - ID: " + assetID)
+            logging.info("    - Lineage Links: " + str(lineageCount))
+            logging.info("    - Hops: " + str(maxDistance))
+
+    logging.info(f"{matchCount} of {len(assetIDs)} assets match")
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+def main(argv):
+
+    global profileMode
+
+    assetID = pathAssetID = searchTerm = resourceName = resourceType = ""
+    impactAssets = []
+    lineageHops = lineageAssets = 0
+    snapshotName = snapshotFile
+
+    arg_help = f"""cdgc_query_lineage.py -a <asset id> [-p <asset id>] | -i <asset ids> | -s <term> -r <resource name> -t <resource type> -l <hops> -c <count>
+        -h              help
+        -f  <file>      Snapshot file (optional, default {snapshotFile})
+        -a  <asset id>  Write the inbound and outbound lineage of this asset to CSV files, like cdgc_export_lineage.py
+        -p  <asset id>  With -a, show the shortest lineage path from the -a asset to this one instead
+        -i  <ids>       Write every asset downstream of these comma separated assets to a CSV file
+        -s  <term>      List assets with lineage whose name contains this, like cdgc_list_object_lineage.py
+        -r  <name>      Restrict the list to a specific resource scanner (optional)
+        -t  <type>      Restrict the list to a specific resource type (case sensitive!!) (optional)
+        -l  <levels>    Number of levels/hops the lineage must reach. 2 to 5 (optional)
+        -c  <count>     Lineage must contain at least this many links (optional)
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase (optional)
+    """.format(argv[0])
+
+    try:
+        opts, args = getopt.getopt(argv[1:], "hf:a:p:i:s:r:t:l:c:", ["help", "file=", "asset=", "path=", "impact=", "search=", "resource_name=",
+                                                                      "resource_type=", "levels=", "count=", "profile="])
+    except getopt.GetoptError:
+        print(arg_help)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(arg_help)
+            sys.exit(2)
+        elif opt in ("-f", "--file"):
+            snapshotName = arg
+        elif opt in ("-a", "--asset"):
+            assetID = arg
+        elif opt in ("-p", "--path"):
+            pathAssetID = arg
+        elif opt in ("-i", "--impact"):
+            impactAssets = [impactAsset.strip() for impactAsset in arg.split(",") if impactAsset.strip()]
+        elif opt in ("-s", "--search"):
+            searchTerm = arg
+        elif opt in ("-r", "--resource_name"):
+            resourceName = arg
+        elif opt in ("-t", "--resource_type"):
+            resourceType = arg
+        elif opt in ("-l", "--levels"):
+            lineageHops = int(arg)
+        elif opt in ("-c", "--count"):
+            lineageAssets = int(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    if pathAssetID and not assetID:
+        print(arg_help)
+        sys.exit(2)
+
+    if not lineage_graph.available():
+        logging.error("numpy is required to query the snapshot (pip install numpy)")
+        exit(1)
+
+    tracing.configure("cdgc_query_lineage", traceFile)
+    profiling.configure("cdgc_query_lineage", profileMode, profileFile, profileInterval)
+
+    logging.info("Starting")
+    try:
+        snapshot = catalog_snapshot.CatalogSnapshot(snapshotName)
+    except FileNotFoundError as e:
+        logging.error(str(e))
+        exit(1)
+    logging.info(f"Snapshot {snapshotName} : {snapshot.get_meta('search')}")
+
+    with tracing.span("load"):
+        graph = lineage_graph.LineageGraph(snapshot.edges())
+    logging.info(f"Loaded {graph.linkCount} lineage links between {len(graph.ids)} assets")
+
+    if assetID and pathAssetID:
+        shortest_path(snapshot, graph, assetID, pathAssetID)
+    elif assetID:
+        export_lineage(snapshot, graph, assetID)
+    elif impactAssets:
+        impact_set(snapshot, graph, impactAssets)
+    else:
+        list_lineage(snapshot, graph, searchTerm, resourceName, resourceType, lineageHops, lineageAssets)
+
+    snapshot.close()
+    logging.info("Script Completed")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,231 @@
+import json
+import math
+import time
+import sys
+import getopt
+import logging
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, metrics, profiling, ratelimit, tracing
+import catalog_snapshot
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Takes a local snapshot of the catalog (see catalog_snapshot.py) that other analyses can read instead of the live API. The assets matching
+# the search are listed with paged searches that run in parallel, then their details and lineage come from bulk details calls, also in
+# parallel, and are written to SQLite as they arrive.
+#
+# By default the snapshot is refreshed incrementally: only the assets modified since the last refresh (snapshotModifiedFilter) are fetched
+# again and their rows and lineage links are replaced. Assets deleted from the catalog are only dropped by a full snapshot (--full), which
+# is also taken when there is no snapshot yet or the search has changed.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+loglevel = 1
+metricsInterval = 0
+profileMode = ""
+apiTimeout = 120
+detailSegments = "selfAttributes,summary,systemAttributes,lineage-level,lineage-distance:5"
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)-5s - %(message)s'
+)
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+
+def search_page(searchTerm, startpos, modifiedDays=0):
+
+    # One page of asset IDs, returns (total hits, IDs) or None when the page can't be read. Runs in the pool, so it doesn't exit itself
+    url = cdgc_api_url + "/data360/search/v1/assets?knowledgeQuery=" + searchTerm + "&segments=summary"
+
+    data = {"from": startpos, "size": snapshotPageSize}
+    if modifiedDays:
+        data['filterSpec'] = [{"type": "dsl", "expr": snapshotModifiedFilter.format(days=modifiedDays)}]
+
+    for attempt in range(3):
+        try:
+            response = client.post("search", url, data=json.dumps(data))
+            if response.status_code == 200:
+                searchResults = json.loads(response.text)
+                return searchResults['summary']['total_hits'], [asset['core.identity'] for asset in searchResults.get('hits', [])]
+            logging.warning(f"Search page at {startpos} failed : HTTP {response.status_code} {response.text}")
+        except Exception as e:
+            logging.warning(f"Search page at {startpos} failed : {e!r}")
+        time.sleep(2 ** attempt)
+
+    return None
+
+
+def search_assets(searchTerm, pool, modifiedDays=0):
+
+    # The first page gives the total, the remaining pages are fetched in parallel. A page that can't be read ends the run before anything
+    # is committed, a snapshot missing a page would look complete
+    page = search_page(searchTerm, 0, modifiedDays)
+    if page is None:
+        logging.error("Search failed, no snapshot taken")
+        exit(1)
+    totalHits, assetIDs = page
+    logging.info(f"    - {totalHits} assets to fetch")
+
+    offsets = range(snapshotPageSize, int(totalHits), snapshotPageSize)
+    for startpos, page in zip(offsets, pool.imap(tracing.task(lambda startpos: search_page(searchTerm, startpos, modifiedDays), "search page"), offsets)):
+        if page is None:
+            logging.error(f"Unable to read the search page at {startpos}, no snapshot taken")
+            exit(1)
+        assetIDs.extend(page[1])
+
+    # Pages can overlap when assets are added while the search runs
+    return list(dict.fromkeys(assetIDs))
+
+
+def get_asset_records(assetIDs):
+
+    # Asset details and lineage of a batch of assets, decoded from the response stream straight into snapshot rows
+    url = cdgc_api_url + "/data360/search/v1/assets/details?scheme=internal&segments=" + detailSegments
+
+    for attempt in range(3):
+        try:
+            response, records = client.request_items("search", "POST", url, "item", data=json.dumps(assetIDs), convert=catalog_snapshot.asset_record,
+                                                     timeout=apiTimeout)
+            if records is not None:
+                return records
+            logging.warning(f"Asset details failed : HTTP {response.status_code}")
+        except Exception as e:
+            logging.warning(f"Asset details failed : {e!r}")
+        time.sleep(2 ** attempt)
+
+    logging.error(f"Unable to get the details of {len(assetIDs)} assets, they are missing from the snapshot : {', '.join(assetIDs)}")
+    return []
+
+
+def fetch_details(snapshot, assetIDs, pool):
+
+    batches = [assetIDs[i:i + snapshotBulkSize] for i in range(0, len(assetIDs), snapshotBulkSize)]
+    written = 0
+
+    for records in pool.imap_unordered(tracing.task(get_asset_records, "bulk fetch"), batches):
+        snapshot.write_assets(records)
+        written = written + len(records)
+        if written // 1000 != (written - len(records)) // 1000:
+            logging.info(f"    - {written} of {len(assetIDs)} assets written")
+
+    return written
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+def main(argv):
+
+    global metricsInterval, profileMode
+
+    searchTerm = resourceName = resourceType = ""
+    snapshotName = snapshotFile
+    fullFlag = "N"
+
+    arg_help = f"""cdgc_snapshot_catalog.py -s <term> -r <resource name> -t <resource type> -o <file> --full
+        -h              help
+        -s  <term>      Only snapshot technical datasets whose name contains this (optional, default all)
+        -r  <name>      Restrict the snapshot to a specific resource scanner (optional)
+        -t  <type>      Restrict the snapshot to a specific resource type (case sensitive!!) (optional)
+        -o  <file>      Snapshot file (optional, default {snapshotFile})
+        --full          Take a full snapshot instead of refreshing the assets modified since the last one (optional)
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run (optional)
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase (optional)
+    """.format(argv[0])
+
+    try:
+        opts, args = getopt.getopt(argv[1:], "hs:r:t:o:", ["help", "search=", "resource_name=", "resource_type=", "output=", "full", "metrics-interval=", "profile="])
+    except getopt.GetoptError:
+        print(arg_help)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(arg_help)
+            sys.exit(2)
+        elif opt in ("-s", "--search"):
+            searchTerm = arg
+        elif opt in ("-r", "--resource_name"):
+            resourceName = arg
+        elif opt in ("-t", "--resource_type"):
+            resourceType = arg
+        elif opt in ("-o", "--output"):
+            snapshotName = arg
+        elif opt == "--full":
+            fullFlag = "Y"
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    # Same search syntax as cdgc_list_object_lineage.py
+    finalSearchTerm = "(technical dataset *" + searchTerm + "*) "
+    if resourceName:
+        finalSearchTerm = finalSearchTerm + " in resource \"" + resourceName + "\""
+    if resourceType:
+        finalSearchTerm = finalSearchTerm + "in catalog source with resource type \"" + resourceType + "\""
+
+    logging.info("Starting")
+    logging.info("Search Syntax : " + finalSearchTerm)
+
+    # A refresh only makes sense on a snapshot of the same search
+    modifiedDays = 0
+    if fullFlag == "N" and Path(snapshotName).is_file():
+        snapshot = catalog_snapshot.CatalogSnapshot(snapshotName)
+        refreshed = float(snapshot.get_meta("refreshed", 0))
+        if snapshot.get_meta("search") == finalSearchTerm and refreshed:
+            modifiedDays = max(1, math.ceil((time.time() - refreshed) / 86400))
+            logging.info(f"Refreshing {snapshotName}, assets modified in the last {modifiedDays} day(s)")
+        else:
+            logging.info(f"{snapshotName} was taken with another search, taking a full snapshot")
+            snapshot.close()
+
+    if not modifiedDays:
+        logging.info(f"Taking a full snapshot into {snapshotName}")
+        snapshot = catalog_snapshot.CatalogSnapshot(snapshotName, create=True)
+
+    ratelimit.configure(rateLimits, rateLimitBurst)
+    client.configure(snapshotThreads)
+    metrics.configure("cdgc_snapshot_catalog", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_snapshot_catalog", traceFile)
+    profiling.configure("cdgc_snapshot_catalog", profileMode, profileFile, profileInterval)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    logging.info("Logging into IDMC")
+    with tracing.span("login"):
+        credentials.login(username, password, login_url)
+
+    started = time.time()
+
+    with ThreadPool(snapshotThreads) as pool:
+        logging.info("Searching for Assets")
+        with tracing.span("search"):
+            assetIDs = search_assets(finalSearchTerm, pool, modifiedDays)
+
+        logging.info(f"Getting details and lineage of {len(assetIDs)} assets")
+        with tracing.span("details", {"idmc.assets": len(assetIDs)}):
+            written = fetch_details(snapshot, assetIDs, pool)
+
+    # The refresh time is when this run started, so changes made while it ran are picked up by the next refresh
+    snapshot.set_meta("search", finalSearchTerm)
+    snapshot.set_meta("refreshed", started)
+    if not modifiedDays:
+        snapshot.commit_full()
+
+    assetCount, edgeCount = snapshot.counts()
+    snapshot.close()
+
+    logging.info(f"{written} assets written, the snapshot holds {assetCount} assets and {edgeCount} lineage links")
+    logging.info("Script Completed")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
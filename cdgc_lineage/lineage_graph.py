@@ -0,0 +1,178 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# In memory lineage graph over the links of a catalog snapshot (see catalog_snapshot.py), used by cdgc_query_lineage.py. Asset IDs are
+# interned to integers and the links are held as two CSR (compressed sparse row) adjacency arrays, one per direction: the targets of node
+# i are indices[indptr[i]:indptr[i + 1]]. Every query walks the graph a whole BFS level at a time with NumPy array operations instead of
+# one asset at a time, so a closure over thousands of assets takes milliseconds. Requires numpy (pip install numpy).
+#
+#   closure()       - upstream (inbound) or downstream (outbound) assets of one or more assets, with their distance. Several starting
+#                     assets give the impact set of a change to all of them
+#   shortest_path() - fewest links from one asset to another following the lineage direction
+#   link_counts()   - lineage links and hops within a distance of each asset, both directions, as the details API reports them
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+INBOUND = "inbound"
+OUTBOUND = "outbound"
+batchSize = 256         # assets whose link counts are computed together, as the columns of one boolean matrix
+
+
+def available():
+    return numpy is not None
+
+
+def csr(rows, cols, size):
+
+    # Adjacency of rows -> cols as (indptr, indices)
+    order = numpy.argsort(rows, kind="stable")
+    indptr = numpy.zeros(size + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.bincount(rows, minlength=size), out=indptr[1:])
+
+    return indptr, cols[order]
+
+
+def neighbours(adjacency, nodes):
+
+    # Every link out of nodes, as (from, to) arrays
+    indptr, indices = adjacency
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    total = int(counts.sum())
+    if not total:
+        return nodes[:0], nodes[:0]
+
+    offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + numpy.arange(total)
+    return numpy.repeat(nodes, counts), indices[offsets]
+
+
+class LineageGraph:
+
+    def __init__(self, edges):
+
+        # edges is an iterable of (source asset ID, target asset ID) pairs
+        pairs = numpy.array(list(edges), dtype=str).reshape(-1, 2)
+        self.ids, interned = numpy.unique(pairs, return_inverse=True)
+        interned = interned.reshape(-1, 2).astype(numpy.int32)
+        self.index = {assetID: node for node, assetID in enumerate(self.ids.tolist())}
+
+        size = len(self.ids)
+        self.adjacency = {OUTBOUND: csr(interned[:, 0], interned[:, 1], size),
+                          INBOUND: csr(interned[:, 1], interned[:, 0], size)}
+        self.linkCount = len(interned)
+
+    def nodes(self, assetIDs):
+
+        # Interned IDs of the assets that have lineage, assets without any are left out
+        return numpy.array([self.index[assetID] for assetID in assetIDs if assetID in self.index], dtype=numpy.int32)
+
+    def closure(self, assetIDs, direction, maxDistance=None):
+
+        # Returns [(asset ID, distance)] of every asset reachable from assetIDs, nearest first. The starting assets aren't included
+        size = len(self.ids)
+        distance = numpy.full(size, -1, dtype=numpy.int32)
+        frontier = numpy.unique(self.nodes(assetIDs))
+        distance[frontier] = 0
+        reached = []
+
+        level = 0
+        while frontier.size and (maxDistance is None or level < maxDistance):
+            level = level + 1
+            sources, targets = neighbours(self.adjacency[direction], frontier)
+            targets = numpy.unique(targets)
+            frontier = targets[distance[targets] < 0]
+            distance[frontier] = level
+            reached.append(frontier)
+
+        if not reached:
+            return []
+
+        reached = numpy.concatenate(reached)
+        return list(zip(self.ids[reached].tolist(), distance[reached].tolist()))
+
+    def shortest_path(self, sourceID, targetID):
+
+        # Asset IDs from sourceID to targetID following the lineage direction, None when there is no such path
+        if sourceID not in self.index or targetID not in self.index:
+            return None
+
+        source, target = self.index[sourceID], self.index[targetID]
+        parent = numpy.full(len(self.ids), -1, dtype=numpy.int32)
+        parent[source] = source
+        frontier = numpy.array([source], dtype=numpy.int32)
+
+        while frontier.size and parent[target] < 0:
+            sources, targets = neighbours(self.adjacency[OUTBOUND], frontier)
+            new = parent[targets] < 0
+            frontier, first = numpy.unique(targets[new], return_index=True)
+            parent[frontier] = sources[new][first]
+
+        if parent[target] < 0:
+            return None
+
+        path = [target]
+        while path[-1] != source:
+            path.append(int(parent[path[-1]]))
+
+        return self.ids[path[::-1]].tolist()
+
+    def link_counts(self, assetIDs, maxDistance=5):
+
+        # Returns {asset ID: (links, hops)}: the lineage links within maxDistance of each asset upstream and downstream, and the longest
+        # distance it has lineage in either direction. Assets without lineage are left out
+        counts = {}
+        nodes = self.nodes(assetIDs)
+
+        for start in range(0, len(nodes), batchSize):
+            batch = nodes[start:start + batchSize]
+            links = numpy.zeros(len(batch), dtype=numpy.int64)
+            hops = numpy.zeros(len(batch), dtype=numpy.int32)
+
+            for direction in (INBOUND, OUTBOUND):
+                batchLinks, batchHops = self.batch_counts(batch, direction, maxDistance)
+                links = links + batchLinks
+                hops = numpy.maximum(hops, batchHops)
+
+            counts.update(zip(self.ids[batch].tolist(), zip(links.tolist(), hops.tolist())))
+
+        return counts
+
+    def batch_counts(self, batch, direction, maxDistance):
+
+        # One BFS per column of a (nodes x batch) boolean matrix, all columns advanced a level at a time. A link is within maxDistance when
+        # the asset it leaves is at most maxDistance - 1 away, so the links are the out degrees of the assets visited before the last level
+        indptr, indices = self.adjacency[direction]
+        degree = numpy.diff(indptr)
+        columns = numpy.arange(len(batch))
+
+        visited = numpy.zeros((len(self.ids), len(batch)), dtype=bool)
+        visited[batch, columns] = True
+        active = numpy.unique(batch)
+        frontier = visited[active]
+        links = numpy.zeros(len(batch), dtype=numpy.int64)
+        hops = numpy.zeros(len(batch), dtype=numpy.int32)
+
+        for level in range(1, maxDistance + 1):
+            links = links + degree[active] @ frontier
+
+            # Each column reaches the targets of its frontier rows
+            sources, targets = neighbours((indptr, indices), active)
+            if not targets.size:
+                break
+            rows = numpy.searchsorted(active, sources)
+            order = numpy.argsort(targets, kind="stable")
+            targets, starts = numpy.unique(targets[order], return_index=True)
+            reached = numpy.logical_or.reduceat(frontier[rows[order]], starts, axis=0) & ~visited[targets]
+
+            keep = reached.any(axis=1)
+            active, frontier = targets[keep], reached[keep]
+            if not active.size:
+                break
+            visited[active] = visited[active] | frontier
+            hops[frontier.any(axis=0)] = level
+
+        return links, hops
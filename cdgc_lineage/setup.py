@@ -2,4 +2,35 @@ username = ""
 password = ""
 
 login_url = "https://dm-us.informaticacloud.com"
-cdgc_api_url = "https://cdgc-api.dm-us.informaticacloud.com"
\ No newline at end of file
+cdgc_api_url = "https://cdgc-api.dm-us.informaticacloud.com"
+idmc_pod_url = "https://usw5.dm-us.informaticacloud.com"     # pod of the org, used for the platform user list
+
+# Shared by the scripts of every folder, the idmc_common module named at the end of a line explains the setting
+rateLimits = {"identity": 0, "search": 0, "publish": 0, "catalog_source": 0, "notification": 0}  # requests per second per endpoint family, 0 = no limit (ratelimit.py)
+rateLimitBurst = 1                                  # requests that may go out back to back (ratelimit.py)
+credentialCache = "~/.idmc/credentials.json"        # session and token reused by the next run, "" logs in every time (credentials.py)
+tokenRefreshMargin = 300                            # seconds before it expires that the token is refreshed (credentials.py)
+metricsJsonFile = "{script}.metrics.json"           # API metrics summary written at exit, "" for none (metrics.py)
+metricsPromFile = "{script}.prom"                   # the same as a Prometheus textfile, "" for none (metrics.py)
+traceFile = ""                                      # OTLP JSON trace of the run, e.g. "{script}.trace.json", "" for none (tracing.py)
+profileFile = "{script}.{phase}"                    # reports of --profile, one per phase (profiling.py)
+profileInterval = 0.005                             # seconds between two stack samples (profiling.py)
+coalesceCacheSize = 1000                            # recent asset details kept by the export, 0 for none (coalesce.py)
+coalesceCacheSeconds = 300                          # seconds an asset is kept (coalesce.py)
+httpCacheFile = "~/.idmc/http_cache.db"             # catalog reads revalidated instead of downloaded again, "" for none (httpcache.py)
+httpCacheDays = 7                                   # entries not used for this many days are dropped (httpcache.py)
+progressDisplay = "auto"                            # auto, live, log or off (progress.py)
+progressReportSeconds = 10                          # seconds between two progress log lines (progress.py)
+
+# Catalog snapshot (cdgc_snapshot_catalog.py) -- SQLite file, parallel requests, assets per search page and per bulk details call. A
+# refresh searches for the assets modified since the last one with snapshotModifiedFilter ({days} is replaced by the number of days)
+snapshotFile = "cdgc_snapshot.db"
+snapshotThreads = 8
+snapshotPageSize = 100
+snapshotBulkSize = 25
+snapshotModifiedFilter = "core.LastModifiedOn within last {days} day"
+
+# The attributes of bulk asset details are kept per asset with this system attribute, the asset's modified time. The next bulk call gets
+# the modified times and the lineage of the cached assets in one call and only fetches the attributes of the assets that have changed.
+# Assets without it are never cached
+assetModifiedAttribute = "core.lastModifiedOn"
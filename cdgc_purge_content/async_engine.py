@@ -0,0 +1,158 @@
+import time
+import asyncio
+import logging
+import importlib.util
+from idmc_common import client, credentials, jsonstream, metrics, ratelimit, tracing
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Non-blocking HTTP engine used by the purge scripts when they run with "-e async". Every request goes through one aiohttp session on a
+# single event loop, so hundreds of requests can be in flight without an OS thread per request. The connector caps the number of open
+# connections to each host and a semaphore caps the total number of requests in flight. Each request waits for its endpoint family's rate
+# limit before it takes a slot. Requests are recorded in the shared metrics and traced the same way as the threaded ones.
+#
+# A token refresh logs in with blocking requests, so it runs in a worker thread while the loop carries on; the coroutines that need the new
+# token wait on one asyncio lock and only the first of them refreshes. run() works through the items with a fixed number of worker
+# coroutines taking them from a bounded queue, so a search result or plan of any size never has more than a few tasks alive at once.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+apiTimeout = 120
+
+# Imported by the first engine, aiohttp takes longer to import than the rest of a script and the thread mode doesn't need it
+aiohttp = None
+
+
+def async_available():
+    return importlib.util.find_spec("aiohttp") is not None
+
+
+class AsyncEngine:
+
+    def __init__(self, concurrency, connectionsPerHost):
+        self.concurrency = concurrency
+        self.connectionsPerHost = connectionsPerHost
+        self.session = None
+        self.semaphore = None
+        self.refreshLock = None
+
+    async def __aenter__(self):
+        global aiohttp
+        import aiohttp
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.connectionsPerHost)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=apiTimeout))
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.refreshLock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *excInfo):
+        await self.session.close()
+
+    async def request(self, family, method, url, headers=None, data=None, prefix=None, convert=None):
+
+        # Returns the status code and the response body as text, the same two things the threaded helpers look at. Same as the shared
+        # client, the org and auth headers are sent by default and a 401 gets a new token and one more try.
+        # With a prefix a 200 response is decoded incrementally instead, and the body returned is the list of convert(item) for every item
+        # at that prefix (see client.request_items)
+        status, body, sentToken = await self.send(family, method, url, headers, data, prefix, convert)
+
+        if status == 401 and client.refreshHook is not None:
+            await self.refresh(sentToken)
+            status, body, sentToken = await self.send(family, method, url, headers, data, prefix, convert)
+
+        return status, body
+
+    async def refresh(self, staleToken=None):
+
+        # The check is repeated under the lock, the coroutines that waited for another one's refresh find the token is new already
+        if client.refreshHook is None or not credentials.refresh_due(staleToken):
+            return
+
+        async with self.refreshLock:
+            if credentials.refresh_due(staleToken):
+                await asyncio.get_running_loop().run_in_executor(None, client.refreshHook, staleToken)
+
+    async def send(self, family, method, url, headers, data, prefix, convert):
+
+        await ratelimit.acquire_async(family)
+
+        async with self.semaphore:
+            # Headers are built once the request has a slot, so it doesn't go out with a token that expired while it was waiting
+            await self.refresh()
+            requestHeaders = {'Content-type': 'application/json'}
+            requestHeaders.update(client.session_headers())
+            if headers:
+                requestHeaders.update(headers)
+
+            with tracing.http_span(family, method, url) as httpSpan:
+                started = time.perf_counter()
+                try:
+                    async with self.session.request(method, url, headers=requestHeaders, data=data) as response:
+                        if prefix is not None and response.status == 200:
+                            body = [convert(item) if convert else item async for item in jsonstream.items_async(response, prefix)]
+                        else:
+                            body = await response.text()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    metrics.record(family, method, url, type(e).__name__, time.perf_counter() - started, len(data or ""))
+                    raise
+
+                httpSpan.set_status(response.status)
+                metrics.record(family, method, url, response.status, time.perf_counter() - started, len(data or ""), response.content.total_bytes)
+
+            return response.status, body, requestHeaders.get('Authorization', '')[len('Bearer '):]
+
+
+def run_coroutine(func, concurrency, connectionsPerHost, *args):
+
+    # Runs func(engine, *args) on a new event loop with its own engine and returns the result
+    async def run_with_engine():
+        async with AsyncEngine(concurrency, connectionsPerHost) as engine:
+            return await func(engine, *args)
+
+    return asyncio.run(run_with_engine())
+
+
+def run(func, items, concurrency, connectionsPerHost, onResult=None):
+
+    # Runs func(engine, item) for every item on one event loop with concurrency workers. Exceptions are logged and passed on in place of
+    # the result, and onResult(item, result) is called as each item finishes
+    async def run_item(engine, item):
+        try:
+            with tracing.span(func.__name__):
+                result = await func(engine, item)
+        except Exception as e:
+            logging.error(f"Async task failed : {e!r}")
+            result = e
+
+        if onResult is not None:
+            onResult(item, result)
+
+        return result
+
+    async def worker(engine, queue):
+        while True:
+            item = await queue.get()
+            try:
+                if item is done:
+                    return
+                await run_item(engine, item)
+            finally:
+                queue.task_done()
+
+    async def run_items(engine):
+
+        # The queue holds a couple of items per worker, the producer waits for room instead of creating a task for every item up front
+        workerCount = max(1, concurrency)
+        queue = asyncio.Queue(maxsize=2 * workerCount)
+        workers = [asyncio.create_task(worker(engine, queue)) for index in range(workerCount)]
+
+        for item in items:
+            await queue.put(item)
+        for index in range(workerCount):
+            await queue.put(done)
+
+        await asyncio.gather(*workers)
+
+    done = object()
+    run_coroutine(run_items, concurrency, connectionsPerHost)
@@ -1,9 +1,15 @@
 import json
-import requests
 import sys
 import getopt
-from multiprocessing.pool import ThreadPool
+from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, metrics, profiling, progress, ratelimit, tracing
+import async_engine
+import purge_plan
+import purge_journal
+import purge_results
+import purge_shards
 import logging
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
@@ -14,10 +20,20 @@ import logging
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
 loglevel = 1
-concurrentThreads = 25
-orgID = sessionID = token = ""
+metricsInterval = 0
+profileMode = ""
 
-delete_count = 1
+cdamAssets = ["DataAccessEnforcementPolicy", "DataFilterEnforcementPolicy", "DataProtection", "DataProtectionEnforcementPolicy", "PrecedenceTier"]
+
+planFile = executePlanFile = ""
+latencySampler = purge_plan.LatencySampler()
+
+journalFile = "cdgc_delete_cdam_assets.journal"
+resumeFlag = "N"
+shardIndex = shardCount = 0
+runner = None
+journal = None
+deletedAssets = set()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,52 +43,6 @@ logging.basicConfig(
 ######################################################################################################
 # Functions
 ######################################################################################################
-def idmc_login(idmcUsername, idmcPassword, url):
-
-    url = url + "/identity-service/api/v1/Login"
-
-    raw_data = {
-        "username": idmcUsername,
-        "password": idmcPassword,
-    }
-
-    headers = {
-        "Content-type": "application/json"
-    }
-
-    raw_data = json.dumps(raw_data)
-
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
-
-    if "error" in loginInfo:
-        logging.error(f"Error logging into IDMC : {loginInfo['error']['message']}")
-        exit(1)
-
-    return loginInfo
-
-
-def generate_token(url):
-
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {
-        "Content-type": "application/json",
-        "cookie": "USER_SESSION=" + sessionID,
-        "IDS-SESSION-ID": sessionID
-    }
-
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
-
-    if "error" in tokenJson:
-        logging.error(f"Error getting token: {tokenJson['error']['message']}")
-        exit(1)
-
-    return tokenJson
-
-
 def search_cdgc(searchTerm):
 
 
@@ -170,8 +140,6 @@ def search_cdgc(searchTerm):
     }
 
     headers = {
-        "Authorization": "Bearer " + token,
-        "Accept-Encoding": "gzip, deflate, br",
         "accept": "*/*",
         "content-type": "application/json",
         "X-INFA-SEARCH-LANGUAGE": "knowledge-graph-search",
@@ -180,31 +148,38 @@ def search_cdgc(searchTerm):
 
     data = json.dumps(data)
 
-    response = requests.post(url, headers=headers, data=data)
-    searchResults = response.text
-    searchResults = json.loads(searchResults)
+    # A page holds up to 10,000 hits, so they are decoded one at a time from the response stream and only what the delete needs is kept
+    response, searchAssets = client.request_items("search", "POST", url, "hits.hits.item", headers, data, search_hit_asset)
 
-    return searchResults
+    if searchAssets is None:
+        logging.error(f"Search failed, API Response code = " + str(response.status_code))
+        return []
 
+    return searchAssets
 
-def delete_asset(assetID, assetClassType):
 
-    global delete_count
+def search_hit_asset(hit):
 
-    logging.debug(f"Attempting to delete an asset id: {assetID}")
+    return {
+        "identity": hit['attributes']['core.identity'],
+        "name": hit['attributes']['core.name'],
+        "classType": hit['attributes']['core.classType']
+    }
 
-    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
 
-    headers = {
+def publish_headers():
+
+    return {
         "Accept": "application/json",
         "Content-type": "application/json",
-        "X-INFA-ORG-ID": orgID,
-        "Authorization": "Bearer " + token,
-        "IDS-SESSION-ID": sessionID,
+        "IDS-SESSION-ID": client.sessionID,
         "X-INFA-PRODUCT-ID": "CDGC"
     }
 
-    postData = {
+
+def delete_asset_body(assetID, assetClassType):
+
+    return {
         "items": [
             {
                 "elementType": "OBJECT",
@@ -219,103 +194,198 @@ def delete_asset(assetID, assetClassType):
         ]
     }
 
-    postData = json.dumps(postData)
-    response = requests.post(url, headers=headers, data=postData)
+
+def delete_asset(assetID, assetClassType):
+
+    logging.debug(f"Attempting to delete an asset id: {assetID}")
+
+    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
+
+    postData = json.dumps(delete_asset_body(assetID, assetClassType))
+    response = client.post("publish", url, headers=publish_headers(), data=postData)
 
     if response.status_code != 207:
         logging.warning(f"API Response code = " + str(response.status_code))
         print(response.text)
-        return
+        return purge_results.HTTP_ERROR
     else:
         deleteResponse = response.text
         deleteResponse = json.loads(deleteResponse)
 
-        if deleteResponse['items'][0]['messageCode'] == "CONTENT_FAILED":
-            logging.debug(f"Status: " + deleteResponse['items'][0]['messageCode'])
-            logging.debug(f"Reason: " + deleteResponse['items'][0]['validations'][0]['results'][0]['messageCode'])
-        else:
-            delete_count = delete_count + 1
-            logging.debug(f"Asset has been deleted")
+        return purge_results.check_delete_response(deleteResponse, "Asset", assetID, journal)
 
-        return deleteResponse
 
+def process_asset(asset):
 
-def process_search_results(asset):
+    # this function runs with  Threadpool for parallel execution and an asset array is passed, but each asset is processed individually.
+    # Assets come from search_hit_asset() or a plan file, both have the same fields. It returns one of the purge_results statuses
 
-    # this function runs with  Threadpool for parallel execution and an asset array is passed, but each asset is processed individually
+    if asset['identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + asset['name'])
+        return purge_results.SKIPPED
 
-    logging.info(f"Deleting Asset : " + asset['attributes']['core.name'])
+    logging.info(f"Deleting Asset : " + asset['name'])
 
     # Delete the asset
     try:
-        response = delete_asset(asset['attributes']['core.identity'], asset['attributes']['core.classType'])
+        return delete_asset(asset['identity'], asset['classType'])
 
     except Exception as e:
-        logging.error(f"Error deleting asset")
-        exit(1)
+        logging.error(f"Error deleting asset {asset['identity']} : {e!r}")
+        return purge_results.EXCEPTION
 
 
-######################################################################################################
-# Main
-######################################################################################################
-def main(idmcUsername, idmcPassword, days):
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Async versions of the functions above, used when the execution mode is "async"
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+async def delete_asset_async(engine, assetID, assetClassType):
+
+    logging.debug(f"Attempting to delete an asset id: {assetID}")
 
-    cdamAssets = ["DataAccessEnforcementPolicy", "DataFilterEnforcementPolicy", "DataProtection", "DataProtectionEnforcementPolicy", "PrecedenceTier"]
+    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
 
-    global delete_count, orgID, token, sessionID
+    status, deleteResponse = await engine.request("publish", "POST", url, publish_headers(), json.dumps(delete_asset_body(assetID, assetClassType)))
 
-    logging.info(f'Starting Script')
+    if status != 207:
+        logging.warning(f"API Response code = " + str(status))
+        print(deleteResponse)
+        return purge_results.HTTP_ERROR
 
-    # Login and set variable
-    logging.info(f'Logging into IDMC')
-    loginInfo = idmc_login(idmcUsername, idmcPassword, login_url)
-    orgID = loginInfo['orgId']
-    sessionID = loginInfo['sessionId']
+    return purge_results.check_delete_response(json.loads(deleteResponse), "Asset", assetID, journal)
+
+
+async def process_asset_async(engine, asset):
+
+    if asset['identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + asset['name'])
+        return purge_results.SKIPPED
+
+    logging.info(f"Deleting Asset : " + asset['name'])
+
+    return await delete_asset_async(engine, asset['identity'], asset['classType'])
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Plan functions, used by --plan and --execute-plan
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def create_plan():
+
+    planAssets = []
+
+    for assetType in cdamAssets:
+        logging.info(f'Searching CDGC for asset type: {assetType}')
+        with tracing.span("search", {"idmc.classType": assetType}):
+            searchAssets = latencySampler.timed("search", search_cdgc, f"com.infa.ccgf.models.cdam.{assetType}")
+
+        logging.info(f"Found {len(searchAssets)} objects")
+        planAssets.extend(searchAssets)
+
+    requestCounts = {"assetDelete": len(planAssets)}
+    concurrency = asyncConcurrency if executionMode == "async" else concurrentThreads
+    planEstimate = purge_plan.estimate(requestCounts, latencySampler, publishLatencyEstimate, concurrency, rateLimits)
+
+    purge_plan.write_plan(planFile, "cdgc_delete_cdam_assets", planAssets, planEstimate)
 
-    logging.info(f'Generate Access Token')
-    tokenJson = generate_token(login_url)
-    token = tokenJson['jwt_token']
 
-    # keeps looping until no more objects are deleted
-    while delete_count != 0:
-        # reset this before we start our search and deletes
-        delete_count = 0
+def search_and_delete():
+
+    retryPass = 0
+
+    # keeps searching and deleting until a pass deletes nothing and has nothing worth retrying
+    while True:
+        passDeleted = passTransientErrors = 0
 
         for assetType in cdamAssets:
             logging.info(f'Searching CDGC for asset type: {assetType}')
             searchTerm = f"com.infa.ccgf.models.cdam.{assetType}"
-            searchResults = search_cdgc(searchTerm)
+            with tracing.span("search", {"idmc.classType": assetType}):
+                searchAssets = search_cdgc(searchTerm)
 
-            if "hits" in searchResults:
-                logging.info(f"Found {searchResults['hits']['total']['value']} objects to delete")
+            if searchAssets:
+                logging.info(f"Found {len(searchAssets)} objects to delete")
                 logging.info(f'Starting to delete assets')
-                with ThreadPool(concurrentThreads) as pool:
-                    pool.imap_unordered(process_search_results, searchResults['hits']['hits'])
-                    pool.close()
-                    pool.join()
+                results = runner.run(process_asset, process_asset_async, searchAssets)
+
+                passDeleted = passDeleted + results.counts[purge_results.DELETED]
+                passTransientErrors = passTransientErrors + results.counts[purge_results.HTTP_ERROR] + results.counts[purge_results.EXCEPTION]
             else:
                 logging.info(f"Found nothing to delete")
 
+        if passDeleted > 0:
+            retryPass = 0
+        elif passTransientErrors > 0 and retryPass < maxRetryPasses:
+            retryPass = retryPass + 1
+            logging.info(f"Nothing deleted in this pass, retrying failed assets (pass {retryPass} of {maxRetryPasses})")
+        else:
+            break
+
+
+######################################################################################################
+# Main
+######################################################################################################
+def main(idmcUsername, idmcPassword, days):
+
+    global executionMode, runner, journal, deletedAssets
+
+    logging.info(f'Starting Script')
+
+    if executionMode == "async" and not async_engine.async_available():
+        logging.warning(f'aiohttp is not installed, falling back to the thread pool')
+        executionMode = "thread"
+
+    logging.info(f'Execution mode : {executionMode}')
+    runner = purge_results.TaskRunner(executionMode, concurrentThreads, asyncConcurrency, asyncConnectionsPerHost)
+
+    # Login and set variable
+    logging.info(f'Logging into IDMC')
+    ratelimit.configure(purge_shards.shard_rates(rateLimits, shardCount) if shardCount else rateLimits, rateLimitBurst)
+    metrics.configure("cdgc_delete_cdam_assets", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_delete_cdam_assets", traceFile)
+    profiling.configure("cdgc_delete_cdam_assets", profileMode, profileFile, profileInterval)
+    progress.configure(progressDisplay, progressReportSeconds)
+    client.configure(concurrentThreads)
+    # Shards log in on their own rather than sharing the cached session
+    credentials.configure("" if shardCount else credentialCache, tokenRefreshMargin)
+    with tracing.span("login"):
+        loginInfo = credentials.login(idmcUsername, idmcPassword, login_url)
+
+    if planFile:
+        create_plan()
+    else:
+        # CDAM purges don't delete relationships, the journal has none
+        journal, deletedAssets, _ = purge_journal.open_journal(journalFile, journalGroupSize, journalGroupSeconds, resumeFlag == "Y")
+        try:
+            if executePlanFile:
+                purge_plan.execute_plan(executePlanFile, "cdgc_delete_cdam_assets", runner, process_asset, process_asset_async, maxRetryPasses, shardIndex, shardCount)
+            else:
+                search_and_delete()
+        finally:
+            journal.close()
+
     logging.info(f'Script Completed')
 
 if __name__ == "__main__":
 
     daysOld = 9999
 
-    if ok_to_delete != "Y":
-        print(f"Please update setup.py and set ok_to_delete to confirm it's ok to delete assets")
-        sys.exit(2)
-
     # Set Parameters
-    arg_help = f"""cdgc_delete_cdam_assets.py -h -u <username> -p <password> -d <# of days>
+    arg_help = f"""cdgc_delete_cdam_assets.py -h -u <username> -p <password> -e <mode>
            -h               help
            -u  <username>   Username to log into IDMC
            -p  <password>   Password to log into IDMC
+           -e  <mode>       Execution mode: thread (default) or async
+           --plan <file>            Dry run, write everything that would be deleted to a plan file with a time estimate
+           --execute-plan <file>    Delete the assets listed in a plan file without searching again
+           --resume                 Skip everything the journal of a previous run has already deleted
+           --journal <file>         Journal file (default: cdgc_delete_cdam_assets.journal, <plan>.shards/shard<k>of<N>/journal with --shard)
+           --shard <k>/<N>          With --execute-plan, only delete shard k of N of the plan (see cdgc_purge_shards.py)
+           --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run
+           --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase
        """.format(sys.argv[0])
 
     # Fetch and Test Command Line Arguments
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hu:p:a:x", ["help", "username=", "password=", "debug"])
+        opts, args = getopt.getopt(sys.argv[1:], "hu:p:a:xe:", ["help", "username=", "password=", "debug", "engine=", "plan=", "execute-plan=", "resume", "journal=", "shard=", "metrics-interval=", "profile="])
 
     except:
         print(arg_help)
@@ -331,6 +401,42 @@ if __name__ == "__main__":
         elif opt in ("-x", "--debug"):
             logging.getLogger().setLevel(logging.DEBUG)
             logging.debug(f'Debug logging enabled')
+        elif opt in ("-e", "--engine"):
+            executionMode = arg
+        elif opt == "--plan":
+            planFile = arg
+        elif opt == "--execute-plan":
+            executePlanFile = arg
+        elif opt == "--resume":
+            resumeFlag = "Y"
+        elif opt == "--journal":
+            journalFile = arg
+        elif opt == "--shard":
+            shard = purge_shards.parse_shard(arg)
+            if shard is None:
+                print(arg_help)
+                sys.exit(2)
+            shardIndex, shardCount = shard
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    # Shards split a plan, there is nothing to split in a search and delete run
+    if shardCount and not executePlanFile:
+        print(f"--shard only works with --execute-plan")
+        sys.exit(2)
+
+    if shardCount and journalFile == "cdgc_delete_cdam_assets.journal":
+        journalFile = purge_shards.journal_file(executePlanFile, shardIndex, shardCount)
+
+    # A plan is a dry run, nothing is deleted so the agreement isn't needed
+    if ok_to_delete != "Y" and not planFile:
+        print(f"Please update setup.py and set ok_to_delete to confirm it's ok to delete assets")
+        sys.exit(2)
 
     if not username or not password:
         print(f"Username or password was not provided. Please include it in your parameters or update setup.py")
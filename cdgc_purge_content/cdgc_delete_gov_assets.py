@@ -1,9 +1,17 @@
 import json
-import requests
+import asyncio
 import sys
 import getopt
 from multiprocessing.pool import ThreadPool
+from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, metrics, profiling, progress, ratelimit, tracing
+import async_engine
+import purge_plan
+import purge_journal
+import purge_results
+import purge_shards
 import logging
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
@@ -14,10 +22,19 @@ import logging
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
 loglevel = 1
-concurrentThreads = 25
-orgID = sessionID = token = ""
+metricsInterval = 0
+profileMode = ""
 
-delete_count = 1
+planFile = executePlanFile = ""
+latencySampler = purge_plan.LatencySampler()
+
+journalFile = "cdgc_delete_gov_assets.journal"
+resumeFlag = "N"
+shardIndex = shardCount = 0
+runner = None
+journal = None
+deletedAssets = set()
+deletedRelationships = set()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -27,58 +44,12 @@ logging.basicConfig(
 ######################################################################################################
 # Functions
 ######################################################################################################
-def idmc_login(idmcUsername, idmcPassword, url):
-
-    url = url + "/identity-service/api/v1/Login"
-
-    raw_data = {
-        "username": idmcUsername,
-        "password": idmcPassword,
-    }
-
-    headers = {
-        "Content-type": "application/json"
-    }
-
-    raw_data = json.dumps(raw_data)
-
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
-
-    if "error" in loginInfo:
-        logging.error(f"Error logging into IDMC : {loginInfo['error']['message']}")
-        exit(1)
-
-    return loginInfo
-
-
-def generate_token(url):
-
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {
-        "Content-type": "application/json",
-        "cookie": "USER_SESSION=" + sessionID,
-        "IDS-SESSION-ID": sessionID
-    }
-
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
-
-    if "error" in tokenJson:
-        logging.error(f"Error getting token: {tokenJson['error']['message']}")
-        exit(1)
-
-    return tokenJson
-
-
-def search_cdgc(searchTerm, segments, days = 9999):
+def search_cdgc(searchTerm, segments, days = 9999, startpos = 0):
 
     url = cdgc_api_url + "/data360/search/v1/assets?knowledgeQuery=" + searchTerm + "&segments=" + segments
 
     data = {
-        "from": 0,
+        "from": startpos,
         "size": 100,
         "filterSpec": [
             {
@@ -89,34 +60,29 @@ def search_cdgc(searchTerm, segments, days = 9999):
     }
 
     headers = {
-        "Content-type": "application/json",
-        "X-INFA-ORG-ID": orgID,
-        "Authorization": "Bearer " + token
+        "Content-type": "application/json"
     }
 
     data = json.dumps(data)
 
-    response = requests.post(url, headers=headers, data=data)
+    response = client.post("search", url, headers=headers, data=data)
     searchResults = response.text
     searchResults = json.loads(searchResults)
 
     return searchResults
 
 
-def get_asset_relationship(assetID):
-
-    url = cdgc_api_url + "/ccgf-searchv2/api/v1/search"
+def relationship_headers():
 
-    logging.debug(f"Getting Relationships for asset ID = {assetID}")
-
-    headers = {
+    return {
         "Content-type": "application/json",
-        "X-INFA-ORG-ID": orgID,
-        "X-INFA-SEARCH-LANGUAGE": "elasticsearch",
-        "Authorization": "Bearer " + token
+        "X-INFA-SEARCH-LANGUAGE": "elasticsearch"
     }
 
-    body = {
+
+def relationship_query(assetID):
+
+    return {
        "from":0,
        "size":250,
        "query":{
@@ -151,39 +117,20 @@ def get_asset_relationship(assetID):
        }
     }
 
-    body = json.dumps(body)
-
-    response = requests.post(url, headers=headers, data=body)
-    assetInfo = response.text
-
-    logging.debug(f"Got Relationship Response")
-
-    if response.status_code != 200:
-        logging.error(f"Unexpected API Response code = " + str(response.status_code))
-        exit(1)
-    else:
-        assetInfo = json.loads(assetInfo)
-
-    return assetInfo
-
-
-def delete_asset(assetID, assetClassType):
 
-    global delete_count
+def publish_headers():
 
-    logging.debug(f"Attempting to delete an asset")
-
-    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
-    headers = {
+    return {
         "Accept": "application/json",
         "Content-type": "application/json",
-        "X-INFA-ORG-ID": orgID,
-        "Authorization": "Bearer " + token,
-        "IDS-SESSION-ID": sessionID,
+        "IDS-SESSION-ID": client.sessionID,
         "X-INFA-PRODUCT-ID": "CDGC"
     }
 
-    postData = {
+
+def delete_asset_body(assetID, assetClassType):
+
+    return {
         "items": [
             {
                 "elementType": "OBJECT",
@@ -198,92 +145,335 @@ def delete_asset(assetID, assetClassType):
         ]
     }
 
-    postData = json.dumps(postData)
 
-    response = requests.post(url, headers=headers, data=postData)
+def delete_relationship_body(fromIdentity, toIdentity, link):
+
+    return {
+        "items": [
+            {
+             "elementType":"RELATIONSHIP",
+             "fromIdentity": fromIdentity,
+             "toIdentity": toIdentity,
+             "operation":"DELETE",
+             "type": link,
+             "identityType":"INTERNAL",
+             "attributes": {}
+            }
+        ]
+    }
+
+
+def hit_relationships(assetLink):
+
+    # One relationship search hit can hold several relationship types between the same two assets
+    return [
+        {
+            "fromIdentity": assetLink['sourceAsMap']['core.sourceIdentity'],
+            "toIdentity": assetLink['sourceAsMap']['core.targetIdentity'],
+            "type": link
+        }
+        for link in assetLink['sourceAsMap']['type']
+    ]
+
+
+def get_asset_relationship(assetID):
+
+    # Returns the relationships pointing at the asset, or None if the search failed. The hits are decoded one at a time from the
+    # response stream and only the identities and types are kept
+    url = cdgc_api_url + "/ccgf-searchv2/api/v1/search"
+
+    logging.debug(f"Getting Relationships for asset ID = {assetID}")
+
+    body = json.dumps(relationship_query(assetID))
+
+    response, assetLinks = client.request_items("search", "POST", url, "hits.hits.item", relationship_headers(), body, hit_relationships)
+
+    logging.debug(f"Got Relationship Response")
+
+    if assetLinks is None:
+        logging.error(f"Unexpected API Response code = " + str(response.status_code))
+        return None
+
+    return [relationship for relationships in assetLinks for relationship in relationships]
+
+
+def delete_asset(assetID, assetClassType):
+
+    logging.debug(f"Attempting to delete an asset")
+
+    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
+
+    postData = json.dumps(delete_asset_body(assetID, assetClassType))
+
+    response = client.post("publish", url, headers=publish_headers(), data=postData)
 
     if response.status_code != 207:
         logging.warning(f"API Response code = " + str(response.status_code))
         print(response.text)
-        return
+        return purge_results.HTTP_ERROR
     else:
         deleteResponse = response.text
         deleteResponse = json.loads(deleteResponse)
 
-        if deleteResponse['items'][0]['messageCode'] == "CONTENT_FAILED":
-            logging.debug(f"Status: " + deleteResponse['items'][0]['messageCode'])
-            logging.debug(f"Reason: " + deleteResponse['items'][0]['validations'][0]['results'][0]['messageCode'])
-        else:
-            delete_count = delete_count + 1
-            logging.debug(f"Asset has been deleted")
+        return purge_results.check_delete_response(deleteResponse, "Asset", assetID, journal)
 
-        return deleteResponse
 
+def delete_relationship_link(fromIdentity, toIdentity, link):
 
-def delete_relationship(assetLink):
+    relationshipKey = purge_journal.relationship_key(fromIdentity, toIdentity, link)
+    if relationshipKey in deletedRelationships:
+        logging.debug(f"Relationship already deleted, skipping")
+        return purge_results.SKIPPED
 
     logging.debug(f"Attempting to delete a relationship")
 
     url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
-    headers = {
-        "Accept": "application/json",
-        "Content-type": "application/json",
-        "X-INFA-ORG-ID": orgID,
-        "Authorization": "Bearer " + token,
-        "IDS-SESSION-ID": sessionID,
-        "X-INFA-PRODUCT-ID": "CDGC"
-    }
 
-    for link in assetLink['sourceAsMap']['type']:
+    body = json.dumps(delete_relationship_body(fromIdentity, toIdentity, link))
 
-        body = {
-            "items": [
-                {
-                 "elementType":"RELATIONSHIP",
-                 "fromIdentity": assetLink['sourceAsMap']['core.sourceIdentity'],
-                 "toIdentity": assetLink['sourceAsMap']['core.targetIdentity'],
-                 "operation":"DELETE",
-                 "type": link,
-                 "identityType":"INTERNAL",
-                 "attributes": {}
-                }
-            ]
-        }
+    response = client.post("publish", url, headers=publish_headers(), data=body)
 
-        body = json.dumps(body)
+    if response.status_code != 207:
+        logging.warning(f"Relationship {relationshipKey} not deleted, API Response code = " + str(response.status_code))
+        return purge_results.HTTP_ERROR
 
-        response = requests.post(url, headers=headers, data=body)
+    deleteResponse = response.text
+    deleteResponse = json.loads(deleteResponse)
+    return purge_results.check_delete_response(deleteResponse, "Relationship", relationshipKey, journal)
 
-        deleteResponse = response.text
-        deleteResponse = json.loads(deleteResponse)
 
-        if deleteResponse['items'][0]['messageCode'] == "CONTENT_FAILED":
-            logging.debug(f"Status: " + deleteResponse['items'][0]['messageCode'])
-            logging.debug(f"Reason: " + deleteResponse['items'][0]['validations'][0]['results'][0]['messageCode'])
-        else:
-            logging.debug(f"Relationship has been deleted")
+def links_failed(statuses, assetName):
+
+    # An asset can't be deleted while a relationship to it is left, so when a relationship delete failed on an HTTP error the asset is left
+    # for the next pass (which retries the relationship first) instead of reporting the content failure that would follow
+    failed = statuses.count(purge_results.HTTP_ERROR)
+    if failed:
+        logging.warning(f"{failed} of {len(statuses)} relationships of {assetName} were not deleted, leaving the asset for the next pass")
+
+    return failed > 0
 
 
 def process_search_results(asset):
 
-    # this function runs with  Threadpool for parallel execution and an asset array is passed, but each asset is processed individually
+    # this function runs with  Threadpool for parallel execution and an asset array is passed, but each asset is processed individually.
+    # It returns one of the purge_results statuses
+
+    if asset['core.identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + asset['summary']['core.name'])
+        return purge_results.SKIPPED
 
     logging.info(f"Asset : " + asset['summary']['core.name'])
-    assetLinks = get_asset_relationship(asset['core.identity'])
 
-    # If relationships exist, then go delete them. Might need to multi-thread this step at some point
-    if assetLinks['hits']['total']['value'] > 0:
-        logging.debug(f"Found " + str(assetLinks['hits']['total']['value']) + " Asset Links")
-        for assetLink in assetLinks['hits']['hits']:
-            delete_relationship(assetLink)
+    try:
+        relationships = get_asset_relationship(asset['core.identity'])
+        if relationships is None:
+            return purge_results.HTTP_ERROR
+
+        # If relationships exist, then go delete them. Might need to multi-thread this step at some point
+        if relationships:
+            logging.debug(f"Found " + str(len(relationships)) + " Asset Links")
+            statuses = [delete_relationship_link(relationship['fromIdentity'], relationship['toIdentity'], relationship['type'])
+                        for relationship in relationships]
+            if links_failed(statuses, asset['summary']['core.name']):
+                return purge_results.HTTP_ERROR
+
+        # Delete the asset
+        return delete_asset(asset['core.identity'], asset['systemAttributes']['core.classType'])
+
+    except Exception as e:
+        logging.error(f"Error deleting asset {asset['core.identity']} : {e!r}")
+        return purge_results.EXCEPTION
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Async versions of the functions above, used when the execution mode is "async"
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+async def get_asset_relationship_async(engine, assetID):
+
+    url = cdgc_api_url + "/ccgf-searchv2/api/v1/search"
+
+    logging.debug(f"Getting Relationships for asset ID = {assetID}")
+
+    status, assetLinks = await engine.request("search", "POST", url, relationship_headers(), json.dumps(relationship_query(assetID)),
+                                             "hits.hits.item", hit_relationships)
+
+    if status != 200:
+        logging.error(f"Unexpected API Response code = " + str(status))
+        return None
+
+    return [relationship for relationships in assetLinks for relationship in relationships]
+
+
+async def delete_asset_async(engine, assetID, assetClassType):
+
+    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
+
+    status, deleteResponse = await engine.request("publish", "POST", url, publish_headers(), json.dumps(delete_asset_body(assetID, assetClassType)))
+
+    if status != 207:
+        logging.warning(f"API Response code = " + str(status))
+        print(deleteResponse)
+        return purge_results.HTTP_ERROR
+
+    return purge_results.check_delete_response(json.loads(deleteResponse), "Asset", assetID, journal)
+
+
+async def delete_relationship_link_async(engine, fromIdentity, toIdentity, link):
+
+    relationshipKey = purge_journal.relationship_key(fromIdentity, toIdentity, link)
+    if relationshipKey in deletedRelationships:
+        logging.debug(f"Relationship already deleted, skipping")
+        return purge_results.SKIPPED
+
+    url = cdgc_api_url + "/ccgf-contentv2/api/v1/publish"
+
+    status, deleteResponse = await engine.request("publish", "POST", url, publish_headers(), json.dumps(delete_relationship_body(fromIdentity, toIdentity, link)))
+
+    if status != 207:
+        logging.warning(f"Relationship {relationshipKey} not deleted, API Response code = " + str(status))
+        return purge_results.HTTP_ERROR
+
+    return purge_results.check_delete_response(json.loads(deleteResponse), "Relationship", relationshipKey, journal)
+
+
+async def process_search_results_async(engine, asset):
+
+    if asset['core.identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + asset['summary']['core.name'])
+        return purge_results.SKIPPED
+
+    logging.info(f"Asset : " + asset['summary']['core.name'])
+    relationships = await get_asset_relationship_async(engine, asset['core.identity'])
+
+    if relationships is None:
+        return purge_results.HTTP_ERROR
+
+    # Relationships of one asset are independent of each other, so they are deleted concurrently
+    if relationships:
+        logging.debug(f"Found " + str(len(relationships)) + " Asset Links")
+        statuses = await asyncio.gather(*(delete_relationship_link_async(engine, relationship['fromIdentity'], relationship['toIdentity'], relationship['type'])
+                                          for relationship in relationships))
+        if links_failed(statuses, asset['summary']['core.name']):
+            return purge_results.HTTP_ERROR
+
+    return await delete_asset_async(engine, asset['core.identity'], asset['systemAttributes']['core.classType'])
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Plan functions, used by --plan and --execute-plan
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def plan_asset_relationships(planAsset):
+
+    relationships = latencySampler.timed("relationships", get_asset_relationship, planAsset['identity'])
+
+    if relationships is None:
+        logging.warning(f"Relationship lookup failed, relationships of {planAsset['name']} are not in the plan")
+        return
+
+    planAsset['relationships'].extend(relationships)
+
+
+def create_plan(assetType, days):
+
+    planAssets = []
+    startpos = 0
+
+    # Page through the whole search result, the normal purge only ever looks at the first page and searches again
+    logging.info(f'Searching CDGC for asset type: {assetType}')
+    while True:
+        with tracing.span("search", {"idmc.from": startpos}):
+            searchResults = latencySampler.timed("search", search_cdgc, assetType, "all", days, startpos)
+
+        if "hits" not in searchResults or not searchResults['hits']:
+            break
+
+        for asset in searchResults['hits']:
+            planAssets.append({
+                "identity": asset['core.identity'],
+                "name": asset['summary']['core.name'],
+                "classType": asset['systemAttributes']['core.classType'],
+                "relationships": []
+            })
+
+        startpos = startpos + len(searchResults['hits'])
+        if startpos >= int(searchResults['summary']['total_hits']):
+            break
+
+    logging.info(f"Found {len(planAssets)} assets, looking up their relationships")
+    with tracing.span("relationship lookup", {"idmc.assets": len(planAssets)}), ThreadPool(concurrentThreads) as pool:
+        pool.map(tracing.task(plan_asset_relationships, "plan_asset_relationships"), planAssets)
+
+    requestCounts = {
+        "relationshipDelete": sum(len(planAsset['relationships']) for planAsset in planAssets),
+        "assetDelete": len(planAssets)
+    }
+    concurrency = asyncConcurrency if executionMode == "async" else concurrentThreads
+    planEstimate = purge_plan.estimate(requestCounts, latencySampler, publishLatencyEstimate, concurrency, rateLimits)
+
+    purge_plan.write_plan(planFile, "cdgc_delete_gov_assets", planAssets, planEstimate, days=days)
+
+
+def process_plan_asset(planAsset):
+
+    if planAsset['identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + planAsset['name'])
+        return purge_results.SKIPPED
+
+    logging.info(f"Asset : " + planAsset['name'])
 
-    # Delete the asset
     try:
-        response = delete_asset(asset['core.identity'], asset['systemAttributes']['core.classType'])
+        statuses = [delete_relationship_link(relationship['fromIdentity'], relationship['toIdentity'], relationship['type'])
+                    for relationship in planAsset['relationships']]
+        if links_failed(statuses, planAsset['name']):
+            return purge_results.HTTP_ERROR
+
+        return delete_asset(planAsset['identity'], planAsset['classType'])
 
     except Exception as e:
-        logging.error(f"Error deleting asset")
-        exit(1)
+        logging.error(f"Error deleting asset {planAsset['identity']} : {e!r}")
+        return purge_results.EXCEPTION
+
+
+async def process_plan_asset_async(engine, planAsset):
+
+    if planAsset['identity'] in deletedAssets:
+        logging.info(f"Asset already deleted, skipping : " + planAsset['name'])
+        return purge_results.SKIPPED
+
+    logging.info(f"Asset : " + planAsset['name'])
+
+    statuses = await asyncio.gather(*(delete_relationship_link_async(engine, relationship['fromIdentity'], relationship['toIdentity'], relationship['type']) for relationship in planAsset['relationships']))
+    if links_failed(statuses, planAsset['name']):
+        return purge_results.HTTP_ERROR
+
+    return await delete_asset_async(engine, planAsset['identity'], planAsset['classType'])
+
+
+def search_and_delete(assetType, days):
+
+    retryPass = 0
+
+    # keeps searching and deleting until a pass deletes nothing and has nothing worth retrying
+    while True:
+        logging.info(f'Searching CDGC for asset type: {assetType}')
+        with tracing.span("search"):
+            searchResults = search_cdgc(assetType, "all", days)
+
+        if "hits" not in searchResults or not searchResults['hits']:
+            logging.info(f"Found nothing to delete")
+            break
+
+        logging.info(f"Found {searchResults['summary']['total_hits']} objects to delete")
+        logging.info(f'Starting to delete assets')
+        results = runner.run(process_search_results, process_search_results_async, searchResults['hits'])
+
+        if results.counts[purge_results.DELETED] > 0:
+            retryPass = 0
+        elif purge_results.should_retry(results) and retryPass < maxRetryPasses:
+            retryPass = retryPass + 1
+            logging.info(f"Nothing deleted in this pass, retrying failed assets (pass {retryPass} of {maxRetryPasses})")
+        else:
+            break
 
 
 ######################################################################################################
@@ -291,38 +481,42 @@ def process_search_results(asset):
 ######################################################################################################
 def main(idmcUsername, idmcPassword, days):
 
-    global delete_count, orgID, token, sessionID
+    global executionMode, runner, journal, deletedAssets, deletedRelationships
     assetType = "business assets"
 
     logging.info(f'Starting')
 
-    # Login and set variable
-    logging.info(f'Logging into IDMC')
-    loginInfo = idmc_login(idmcUsername, idmcPassword, login_url)
-    orgID = loginInfo['orgId']
-    sessionID = loginInfo['sessionId']
-
-    logging.info(f'Generate Access Token')
-    tokenJson = generate_token(login_url)
-    token = tokenJson['jwt_token']
+    if executionMode == "async" and not async_engine.async_available():
+        logging.warning(f'aiohttp is not installed, falling back to the thread pool')
+        executionMode = "thread"
 
-    # keeps looping until no more objects are deleted
-    while delete_count != 0:
-        # reset this before we start our search and deletes
-        delete_count = 0
+    logging.info(f'Execution mode : {executionMode}')
+    runner = purge_results.TaskRunner(executionMode, concurrentThreads, asyncConcurrency, asyncConnectionsPerHost)
 
-        logging.info(f'Searching CDGC for asset type: {assetType}')
-        searchResults = search_cdgc(assetType, "all", days)
-
-        if "hits" in searchResults:
-            logging.info(f"Found {searchResults['summary']['total_hits']} objects to delete")
-            logging.info(f'Starting to delete assets')
-            with ThreadPool(concurrentThreads) as pool:
-                pool.imap_unordered(process_search_results, searchResults['hits'])
-                pool.close()
-                pool.join()
-        else:
-            logging.info(f"Found nothing to delete")
+    # Login and set variable
+    logging.info(f'Logging into IDMC')
+    ratelimit.configure(purge_shards.shard_rates(rateLimits, shardCount) if shardCount else rateLimits, rateLimitBurst)
+    metrics.configure("cdgc_delete_gov_assets", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_delete_gov_assets", traceFile)
+    profiling.configure("cdgc_delete_gov_assets", profileMode, profileFile, profileInterval)
+    progress.configure(progressDisplay, progressReportSeconds)
+    client.configure(concurrentThreads)
+    # Shards log in on their own rather than sharing the cached session
+    credentials.configure("" if shardCount else credentialCache, tokenRefreshMargin)
+    with tracing.span("login"):
+        loginInfo = credentials.login(idmcUsername, idmcPassword, login_url)
+
+    if planFile:
+        create_plan(assetType, days)
+    else:
+        journal, deletedAssets, deletedRelationships = purge_journal.open_journal(journalFile, journalGroupSize, journalGroupSeconds, resumeFlag == "Y")
+        try:
+            if executePlanFile:
+                purge_plan.execute_plan(executePlanFile, "cdgc_delete_gov_assets", runner, process_plan_asset, process_plan_asset_async, maxRetryPasses, shardIndex, shardCount)
+            else:
+                search_and_delete(assetType, days)
+        finally:
+            journal.close()
 
     logging.info(f'Script Completed')
 
@@ -330,21 +524,25 @@ if __name__ == "__main__":
 
     daysOld = 9999
 
-    if ok_to_delete != "Y":
-        print(f"Please update setup.py and set ok_to_delete to confirm it's ok to delete assets")
-        sys.exit(2)
-
     # Set Parameters
-    arg_help = f"""cdgc_delete_gov_assets.py -h -u <username> -p <password> -d <# of days>
+    arg_help = f"""cdgc_delete_gov_assets.py -h -u <username> -p <password> -d <# of days> -e <mode>
            -h               help
            -u  <username>   Username to log into IDMC
            -p  <password>   Password to log into IDMC
            -d  <number>     Only delete assets that are specific number of days old
+           -e  <mode>       Execution mode: thread (default) or async
+           --plan <file>            Dry run, write everything that would be deleted to a plan file with a time estimate
+           --execute-plan <file>    Delete the assets and relationships listed in a plan file without searching again
+           --resume                 Skip everything the journal of a previous run has already deleted
+           --journal <file>         Journal file (default: cdgc_delete_gov_assets.journal, <plan>.shards/shard<k>of<N>/journal with --shard)
+           --shard <k>/<N>          With --execute-plan, only delete shard k of N of the plan (see cdgc_purge_shards.py)
+           --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run
+           --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase
        """.format(sys.argv[0])
 
     # Fetch and Test Command Line Arguments
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hu:p:d:a:x", ["help", "username=", "password=", "days=", "debug"])
+        opts, args = getopt.getopt(sys.argv[1:], "hu:p:d:a:xe:", ["help", "username=", "password=", "days=", "debug", "engine=", "plan=", "execute-plan=", "resume", "journal=", "shard=", "metrics-interval=", "profile="])
 
     except:
         print(arg_help)
@@ -362,6 +560,42 @@ if __name__ == "__main__":
         elif opt in ("-x", "--debug"):
             logging.getLogger().setLevel(logging.DEBUG)
             logging.debug(f'Debug logging enabled')
+        elif opt in ("-e", "--engine"):
+            executionMode = arg
+        elif opt == "--plan":
+            planFile = arg
+        elif opt == "--execute-plan":
+            executePlanFile = arg
+        elif opt == "--resume":
+            resumeFlag = "Y"
+        elif opt == "--journal":
+            journalFile = arg
+        elif opt == "--shard":
+            shard = purge_shards.parse_shard(arg)
+            if shard is None:
+                print(arg_help)
+                sys.exit(2)
+            shardIndex, shardCount = shard
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    # Shards split a plan, there is nothing to split in a search and delete run
+    if shardCount and not executePlanFile:
+        print(f"--shard only works with --execute-plan")
+        sys.exit(2)
+
+    if shardCount and journalFile == "cdgc_delete_gov_assets.journal":
+        journalFile = purge_shards.journal_file(executePlanFile, shardIndex, shardCount)
+
+    # A plan is a dry run, nothing is deleted so the agreement isn't needed
+    if ok_to_delete != "Y" and not planFile:
+        print(f"Please update setup.py and set ok_to_delete to confirm it's ok to delete assets")
+        sys.exit(2)
 
     if not username or not password:
         print(f"Username or password was not provided. Please include it in your parameters or update setup.py")
@@ -1,12 +1,18 @@
 import json
 import datetime
+import asyncio
 import requests
 import sys
-import time
-from random import randrange
+from functools import partial
+from collections import Counter
 import getopt
 from multiprocessing.pool import ThreadPool
+from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, httpcache, metrics, profiling, progress, ratelimit, tracing
+import async_engine
+import job_monitor
 import logging
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
@@ -15,14 +21,17 @@ import logging
 # This script will purge metadata from a specific scanner, or all scanners. It also can delete the scanner once the purge is finished.
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
-concurrentThreads = 8
-statusTimeout = 45
+statusPollInitial = 15      # seconds before the first status check of a purge job
+statusPollMax = 120         # longest wait between two status checks of the same job
+catalogSourcePageSize = 25
 deleteScannerFlag = "N"
 scannerToPurge = "All"
 allScannersFlag = "N"
 loglevel = 1
+metricsInterval = 0
+profileMode = ""
+purgeProgress = None
 
-orgID = sessionID = token = ""
 
 logging.basicConfig(
     level=logging.INFO,
@@ -32,64 +41,80 @@ logging.basicConfig(
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 # Functions
 # ---------------------------------------------------------------------------------------------------------------------------------------------
-def idmc_login(idmcUsername, idmcPassword, url):
+def get_catalog_sources(url):
 
-    url = url + "/identity-service/api/v1/Login"
+    catalogSource = {'datasources': []}
+    offset = 0
 
-    raw_data = {"username": idmcUsername, "password": idmcPassword}
-    headers = {"Content-type": "application/json"}
+    # Page through every catalog source, a page shorter than the page size is the last one
+    while True:
+        pageUrl = url + "/ccgf-catalog-source-management/api/v1/datasources?offset=" + str(offset) + "&limit=" + str(catalogSourcePageSize) + "&sort=name:ASC"
 
-    raw_data = json.dumps(raw_data)
+        response = client.conditional("catalog_source", "GET", pageUrl)
+        page = json.loads(response.text)
+        datasources = page.get('datasources', [])
 
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
+        catalogSource['datasources'].extend(datasources)
+        offset = offset + len(datasources)
 
-    if "error" in loginInfo:
-        logging.error(f"Error logging into IDMC : {loginInfo['error']['message']}")
-        exit(1)
+        if len(datasources) < catalogSourcePageSize:
+            break
 
-    return loginInfo
+    return catalogSource
 
 
-def generate_token(url):
+def get_scanner_asset_count(scanner):
 
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {
-        "Content-type": "application/json",
-        "cookie": "USER_SESSION=" + sessionID,
-        "IDS-SESSION-ID": sessionID
+    # Returns the number of assets of the catalog source, or None when the count search failed
+    url = cdgc_api_url + "/data360/search/v1/assets?knowledgeQuery=*&segments=summary"
+
+    data = {
+        "from": 0,
+        "size": 0,
+        "filterSpec": [
+            {
+                "type": "dsl",
+                "expr": scannerAssetFilter.format(id=scanner.get('id', scanner['name']), name=scanner['name'])
+            }
+        ]
     }
 
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
+    try:
+        response = client.post("search", url, data=json.dumps(data))
+        if response.status_code != 200:
+            logging.warning(f"Unable to count assets of {scanner['name']}, API Response code = {response.status_code}")
+            return None
+        return int(json.loads(response.text)['summary']['total_hits'])
+    except (requests.RequestException, ValueError, KeyError) as e:
+        logging.warning(f"Unable to count assets of {scanner['name']} : {e!r}")
+        return None
 
-    if "error" in tokenJson:
-        logging.error(f"Error getting token: {tokenJson['error']['message']}")
-        logging.error(f"Session ID = {sessionID}")
-        exit(1)
 
-    return tokenJson
+def order_scanners(scanners):
 
+    # Largest first keeps the biggest purges from starting last and stretching out the total run time. Scanners that couldn't be counted
+    # go last, in catalog order, rather than being taken for empty
+    with tracing.span("count assets", {"idmc.scanners": len(scanners)}), ThreadPool(technicalThreads) as pool:
+        assetCounts = pool.map(tracing.task(get_scanner_asset_count), scanners)
 
-def get_catalog_sources(url):
-    
-    url = url + "/ccgf-catalog-source-management/api/v1/datasources?offset=0&limit=25&sort=name:ASC"
-    headers = {'Content-type': 'application/json', 'X-Infa-Org-Id': orgID, 'Authorization': 'Bearer ' + token}
+    for scanner, assetCount in zip(scanners, assetCounts):
+        scanner['assetCount'] = assetCount
 
-    response = requests.get(url, headers=headers)
-    catalogSource = response.text
-    catalogSource = json.loads(catalogSource)
+    uncounted = assetCounts.count(None)
+    if uncounted:
+        logging.warning(f"{uncounted} of {len(scanners)} scanners couldn't be counted, they are purged after the counted ones")
+
+    return sorted(scanners, key=lambda scanner: (scanner['assetCount'] is None, -(scanner['assetCount'] or 0)))
 
-    return catalogSource
+
+def catalog_headers():
+    return {'IDS-SESSION-ID': client.sessionID}
 
 
 def purge_catalog_source(url, scannerName):
     url = url + "/ccgf-catalog-source-management/api/v1/datasources/" + scannerName + "?type=purge"
-    headers = {'Content-type': 'application/json', 'X-Infa-Org-Id': orgID, 'Authorization': 'Bearer ' + token, 'IDS-SESSION-ID': sessionID}
 
-    response = requests.delete(url, headers=headers)
+    response = client.delete("catalog_source", url, headers=catalog_headers())
     purgeCatalog = response.text
     purgeCatalog = json.loads(purgeCatalog)
 
@@ -98,60 +123,176 @@ def purge_catalog_source(url, scannerName):
 
 def delete_catalog_source(url, scannerName):
     url = url + "/ccgf-catalog-source-management/api/v1/datasources/" + scannerName + "?type=soft"
-    headers = {'Content-type': 'application/json', 'X-Infa-Org-Id': orgID, 'Authorization': 'Bearer ' + token, 'IDS-SESSION-ID': sessionID}
 
-    response = requests.delete(url, headers=headers)
+    response = client.delete("catalog_source", url, headers=catalog_headers())
     purgeCatalog = response.text
     purgeCatalog = json.loads(purgeCatalog)
 
     return purgeCatalog
 
 
+def job_info_url(url, scannerID):
+    # Only the job status is read, so none of the expandChildren blocks are requested
+    return url + "/ccgf-orchestration-management-api-server/api/v1/jobs/" + scannerID + "?aggregateResourceUsage=false"
+
+
 def get_job_info(url, scannerID):
-    url = url + "/ccgf-orchestration-management-api-server/api/v1/jobs/" + scannerID + "?aggregateResourceUsage=false&expandChildren=INPUT-PROPERTIES&expandChildren=OUTPUT-PROPERTIES&expandChildren=TASK-HIERARCHY&expandChildren=WORKFLOW-DETAILS&expandChildren=OPERATIONS"
-    headers = {'Content-type': 'application/json', 'X-Infa-Org-Id': orgID, 'Authorization': 'Bearer ' + token, 'IDS-SESSION-ID': sessionID}
 
-    response = requests.get(url, headers=headers)
+    response = client.get("catalog_source", job_info_url(url, scannerID), headers=catalog_headers())
     jobInfoJson = response.text
     jobInfoJson = json.loads(jobInfoJson)
 
     return jobInfoJson
 
 
-def check_scanner_status(url, jobId, name):
+def get_job_status(jobId):
+    return get_job_info(cdgc_api_url, jobId)['status']
 
-    global statusTimeout
-    global deleteScannerFlag
 
-    keepCheckingFlag = "Y"
-    statusList = ['COMPLETED', 'FAILED', 'COMPLETED WITH ERRORS', 'PARTIAL_COMPLETED']
+def purge_completed(monitor, pendingScanners, job, status):
 
-    while keepCheckingFlag == "Y":
-        jobInfo = get_job_info(url, jobId)
-        logging.info("Checking Job Status [" + name + "] : " + jobInfo['status'])
+    # Runs inside the monitor loop, a failure here is recorded for the scanner rather than ending the loop with other jobs still running
+    purgeProgress.advance()
 
-        # Check if the purge has completed (even with errors)
-        if jobInfo['status'] in statusList:
-            keepCheckingFlag = "N"
+    # Delete scanner if the user wants to delete
+    if deleteScannerFlag == "Y" and status == "COMPLETED":
+        logging.info("Deleting Scanner: " + job.name)
+        try:
+            delete_catalog_source(cdgc_api_url, job.name)
+        except Exception as e:
+            scanner_delete_failed(monitor, job, e)
+
+    start_purges(monitor, pendingScanners)
+
+
+def scanner_delete_failed(monitor, job, error):
+    logging.error(f"Unable to delete scanner {job.name} after its purge : {error!r}")
+    monitor.results[job.name] = "COMPLETED, SCANNER NOT DELETED"
+
+
+def asset_count_text(scanner):
+    return "unknown number of" if scanner.get('assetCount') is None else str(scanner['assetCount'])
 
-            # Delete scanner if the user wants to delete
-            if deleteScannerFlag == "Y" and jobInfo['status'] == "COMPLETED":
-                logging.info("Deleting Scanner: " + name)
-                delete_catalog_source(url, name)
-        else:
-            time.sleep(statusTimeout)
 
+def process_scanner(scanner):
 
-def process_scanner(scanner, singleScanner=""):
+    logging.info("Requesting Scanner to Purge : " + scanner['name'] + " (" + asset_count_text(scanner) + " assets)")
 
-    logging.info("Requesting Scanner to Purge : " + scanner['name'])
+    return purge_catalog_source(cdgc_api_url, scanner['name'])
 
-    # pause for a random amount, so we're not firing every API request off at once
-    time.sleep(randrange(5))
 
-    jobResponse = purge_catalog_source(cdgc_api_url, scanner['name'])
+def add_purge_job(monitor, scanner, jobResponse):
+
     if "jobId" in jobResponse:
-        check_scanner_status(cdgc_api_url, jobResponse['jobId'], scanner['name'])
+        monitor.add(jobResponse['jobId'], scanner['name'])
+    else:
+        logging.warning(f"Purge of {scanner['name']} did not start : {jobResponse}")
+        monitor.results[scanner['name']] = "NOT STARTED"
+        purgeProgress.advance()
+
+
+def start_purges(monitor, pendingScanners):
+
+    # Only ever keep maxRunningPurges purge jobs running on the server, the next one starts when a running one finishes
+    while pendingScanners and monitor.running < maxRunningPurges:
+        scanner = pendingScanners.pop(0)
+        try:
+            jobResponse = process_scanner(scanner)
+        except Exception as e:
+            jobResponse = {"error": repr(e)}
+        add_purge_job(monitor, scanner, jobResponse)
+
+
+def purge_scanners(scanners):
+
+    monitor = job_monitor.JobMonitor(statusPollInitial, statusPollMax, maxStatusPollFailures)
+    pendingScanners = list(scanners)
+
+    start_purges(monitor, pendingScanners)
+    monitor.run(get_job_status, partial(purge_completed, monitor, pendingScanners))
+
+    return monitor.results
+
+
+def log_results(results):
+
+    # Returns True when every purge completed
+    logging.info("Purge results : " + ", ".join(f"{status} {count}" for status, count in sorted(Counter(results.values()).items())))
+    for name, status in sorted(results.items()):
+        if status != "COMPLETED":
+            logging.warning(f"    - {name} : {status}")
+
+    return all(status == "COMPLETED" for status in results.values())
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Async versions of the functions above, used when the execution mode is "async"
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+async def purge_catalog_source_async(engine, url, scannerName):
+    url = url + "/ccgf-catalog-source-management/api/v1/datasources/" + scannerName + "?type=purge"
+
+    status, purgeCatalog = await engine.request("catalog_source", "DELETE", url, catalog_headers())
+    return json.loads(purgeCatalog)
+
+
+async def delete_catalog_source_async(engine, url, scannerName):
+    url = url + "/ccgf-catalog-source-management/api/v1/datasources/" + scannerName + "?type=soft"
+
+    status, purgeCatalog = await engine.request("catalog_source", "DELETE", url, catalog_headers())
+    return json.loads(purgeCatalog)
+
+
+async def get_job_info_async(engine, url, scannerID):
+
+    status, jobInfoJson = await engine.request("catalog_source", "GET", job_info_url(url, scannerID), catalog_headers())
+    return json.loads(jobInfoJson)
+
+
+async def get_job_status_async(engine, jobId):
+    jobInfo = await get_job_info_async(engine, cdgc_api_url, jobId)
+    return jobInfo['status']
+
+
+async def purge_completed_async(engine, monitor, pendingScanners, job, status):
+
+    purgeProgress.advance()
+
+    if deleteScannerFlag == "Y" and status == "COMPLETED":
+        logging.info("Deleting Scanner: " + job.name)
+        try:
+            await delete_catalog_source_async(engine, cdgc_api_url, job.name)
+        except Exception as e:
+            scanner_delete_failed(monitor, job, e)
+
+    await start_purges_async(engine, monitor, pendingScanners)
+
+
+async def process_scanner_async(engine, scanner):
+
+    logging.info("Requesting Scanner to Purge : " + scanner['name'] + " (" + asset_count_text(scanner) + " assets)")
+
+    return await purge_catalog_source_async(engine, cdgc_api_url, scanner['name'])
+
+
+async def start_purges_async(engine, monitor, pendingScanners):
+
+    while pendingScanners and monitor.running < maxRunningPurges:
+        scanner = pendingScanners.pop(0)
+        try:
+            jobResponse = await process_scanner_async(engine, scanner)
+        except Exception as e:
+            jobResponse = {"error": repr(e)}
+        add_purge_job(monitor, scanner, jobResponse)
+
+
+async def purge_scanners_async(engine, scanners):
+
+    monitor = job_monitor.JobMonitor(statusPollInitial, statusPollMax, maxStatusPollFailures)
+    pendingScanners = list(scanners)
+
+    await start_purges_async(engine, monitor, pendingScanners)
+    await monitor.run_async(partial(get_job_status_async, engine), partial(purge_completed_async, engine, monitor, pendingScanners))
+
+    return monitor.results
 
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 # Main
@@ -159,20 +300,25 @@ def process_scanner(scanner, singleScanner=""):
 def main(argv):
 
     # Set Parameters
-    arg_help = f"""cdgc_delete_technical_assets.py -h -s <scanner> -a -d -u <username> -p <password>
+    arg_help = f"""cdgc_delete_technical_assets.py -h -s <scanner> -a -d -u <username> -p <password> -e <mode> -m <count>
         -h              help
         -s  <scanner>   Purge Specific Scanner
         -a              Purge All Scanners
         -u  <username>  Username to log into IDMC
         -p  <password>  Password to log into IDMC
         -d              Delete Scanner after it's purged
+        -e  <mode>      Execution mode: thread (default) or async
+        -m  <count>     Max purge jobs running on the server at once (default from setup.py)
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase
     """.format(argv[0])
 
-    global deleteScannerFlag, allScannersFlag, scannerToPurge, orgID, sessionID, token, username, password
+    global deleteScannerFlag, allScannersFlag, scannerToPurge, username, password, executionMode, maxRunningPurges, metricsInterval, profileMode
+    global purgeProgress
 
     # Fetch and Test Command Line Arguments
     try:
-        opts, args = getopt.getopt(argv[1:], "has:du:p:", ["help", "all", "scanner=", "delete", "username=", "password="])
+        opts, args = getopt.getopt(argv[1:], "has:du:p:e:m:", ["help", "all", "scanner=", "delete", "username=", "password=", "engine=", "max-running=", "metrics-interval=", "profile="])
     except:
         print(arg_help)
         sys.exit(2)
@@ -190,6 +336,21 @@ def main(argv):
             username = arg
         elif opt in ("-p", "--password"):
             password = arg
+        elif opt in ("-e", "--engine"):
+            executionMode = arg
+        elif opt in ("-m", "--max-running"):
+            if not arg.isdigit() or int(arg) < 1:
+                print(f"ERROR: -m must be a number of purge jobs of 1 or more, not {arg}\n")
+                print(arg_help)
+                sys.exit(2)
+            maxRunningPurges = int(arg)
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
 
     if allScannersFlag == "N" and scannerToPurge == "All":
         print("ERROR: You must include a scanner to purge (-s <scanner>) or purge all scanners (-a)\n")
@@ -200,40 +361,61 @@ def main(argv):
     logging.info(f"Parameter -> User: {username}")
     logging.info(f"Parameter -> Scanner to Purge: {scannerToPurge}")
     logging.info(f"Parameter -> Delete Scanner after Purge: {deleteScannerFlag}")
-    logging.info(f"Parameter -> Concurrent Processes: {concurrentThreads}")
+    logging.info(f"Parameter -> Concurrent Processes: {technicalThreads}")
+    logging.info(f"Parameter -> Max Running Purges: {maxRunningPurges}")
+
+    if executionMode == "async" and not async_engine.async_available():
+        logging.warning(f"aiohttp is not installed, falling back to the thread pool")
+        executionMode = "thread"
+
+    logging.info(f"Parameter -> Execution Mode: {executionMode}")
 
     # Login and set variables
     logging.info(f'Logging into IDMC')
-    loginInfo = idmc_login(username, password, login_url)
-    orgID = loginInfo['orgId']
-    sessionID = loginInfo['sessionId']
-
-    logging.info(f'Generate Access Token')
-    tokenJson = generate_token(login_url)
-    token = tokenJson['jwt_token']
+    ratelimit.configure(rateLimits, rateLimitBurst)
+    metrics.configure("cdgc_delete_technical_assets", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("cdgc_delete_technical_assets", traceFile)
+    profiling.configure("cdgc_delete_technical_assets", profileMode, profileFile, profileInterval)
+    progress.configure(progressDisplay, progressReportSeconds)
+    client.configure(technicalThreads)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    httpcache.configure(httpCacheFile, httpCacheDays)
+    with tracing.span("login"):
+        loginInfo = credentials.login(username, password, login_url)
 
     # Get entire list of scanners
     logging.info("Getting scanner list from MCC")
-    catalogSources = get_catalog_sources(cdgc_api_url)
+    with tracing.span("list catalog sources"):
+        catalogSources = get_catalog_sources(cdgc_api_url)
 
     for index, item in enumerate(catalogSources['datasources']):
-        item["token"] = token
+        item["token"] = client.token
         item["loginInfo"] = loginInfo
         catalogSources['datasources'][index] = item
 
+    logging.info(f"Found {len(catalogSources['datasources'])} scanners")
+
     if allScannersFlag == "Y":
-        if catalogSources:
-            pool = ThreadPool()
-            with ThreadPool(concurrentThreads) as pool:
-                pool.map(process_scanner, catalogSources['datasources'])
-            pool.close()
-
-    if allScannersFlag == "N":
-        if catalogSources:
-            for scanner in catalogSources['datasources']:
-                if scanner['name'] != scannerToPurge:
-                    continue
-                process_scanner(scanner)
+        logging.info("Counting assets per scanner to schedule the largest purges first")
+        scanners = order_scanners(catalogSources['datasources'])
+    else:
+        scanners = [scanner for scanner in catalogSources['datasources'] if scanner['name'] == scannerToPurge]
+        if not scanners:
+            logging.error(f"Scanner {scannerToPurge} not found, none of the {len(catalogSources['datasources'])} catalog sources has that name")
+            exit(1)
+
+    # Every purge job is tracked by one monitor loop, which also deletes the scanner as soon as its purge completes
+    purgeProgress = progress.Progress("Purge", len(scanners), "catalog sources", ("catalog_source",))
+    with tracing.span("purge", {"idmc.scanners": len(scanners)}):
+        if executionMode == "async":
+            results = async_engine.run_coroutine(purge_scanners_async, asyncConcurrency, asyncConnectionsPerHost, scanners)
+        else:
+            results = purge_scanners(scanners)
+    purgeProgress.finish()
+
+    if not log_results(results):
+        logging.error("Not every purge completed, see the scanners above")
+        exit(1)
 
     logging.info("Script Completed")
 
@@ -0,0 +1,305 @@
+import os
+import sys
+import json
+import time
+import getopt
+import signal
+import subprocess
+from collections import Counter
+from pathlib import Path
+from setup import *
+import setup
+repoRoot = str(Path(__file__).resolve().parent.parent)
+sys.path.append(repoRoot)
+import purge_results
+import purge_shards
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Runs a plan of cdgc_delete_gov_assets.py or cdgc_delete_cdam_assets.py (--plan) as N shards in parallel processes. Each process deletes
+# the plan assets whose identity hashes to its shard (--execute-plan <plan> --shard k/N) with its own login, token, connection pool, journal
+# and 1/N of the rate limits, so a large purge isn't limited by one process's GIL for the JSON work or one host's network.
+#
+# This script starts the shards, adds up the progress files they write next to the plan and logs the combined progress and ETA until all of
+# them have finished. To spread a purge over several hosts, put the plan on a shared directory and split the shards between the hosts with
+# --run, e.g. --run 1-4 on one host and --run 5-8 on the other; each host then reports the progress of all 8. The output of a shard goes to
+# <plan>.shards/shard<k>of<N>/worker.log, along with its journal, progress and metrics files.
+#
+# The shards are started through idmc_common/runscript.py with the settings this script runs with (setup.py, plus $IDMC_SETTINGS or the
+# idmc --set / --settings of a multi org run) and the username and password in their environment, so every shard works on the same org
+# and no password shows up in the process list. A shard on another host whose progress file hasn't been updated for shardLostSeconds is
+# reported as lost, so the coordinator doesn't wait forever for a host that went down.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+loglevel = 1
+purgeScripts = ("cdgc_delete_gov_assets", "cdgc_delete_cdam_assets")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)-5s - %(message)s'
+)
+
+######################################################################################################
+# Functions
+######################################################################################################
+def parse_shard_list(value, count):
+
+    # "1-4,7" -> [1, 2, 3, 4, 7]
+    shards = set()
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        first, last = part.split("-", 1) if "-" in part else (part, part)
+        shards.update(range(int(first), int(last) + 1))
+
+    if any(shard < 1 or shard > count for shard in shards):
+        raise ValueError(f"shards must be between 1 and {count}")
+
+    return sorted(shards)
+
+
+def worker_settings(username, password):
+
+    # The settings of this run as the shards' $IDMC_SETTINGS. Modules and functions of setup.py are left out, they aren't settings
+    settings = {name: value for name, value in vars(setup).items()
+                if not name.startswith("_") and isinstance(value, (str, int, float, bool, list, dict, type(None)))}
+    if username:
+        settings['username'] = username
+    if password:
+        settings['password'] = password
+
+    return settings
+
+
+def start_shard(scriptPath, planPath, shard, count, workerArgs, settings):
+
+    shardDir = purge_shards.shard_dir(planPath, shard, count)
+
+    # A progress file left by an earlier run would look finished before the new worker has started
+    Path(purge_shards.progress_file(planPath, shard, count)).unlink(missing_ok=True)
+
+    environment = dict(os.environ)
+    environment['IDMC_SETTINGS'] = json.dumps(settings)
+    environment['PYTHONPATH'] = os.pathsep.join([repoRoot] + [path for path in [os.environ.get('PYTHONPATH')] if path])
+
+    with open(shardDir / "worker.log", 'w') as workerLog:
+        process = subprocess.Popen([sys.executable, "-m", "idmc_common.runscript", str(scriptPath), "--execute-plan", planPath, "--shard", f"{shard}/{count}"] + workerArgs,
+                                   cwd=shardDir, stdout=workerLog, stderr=subprocess.STDOUT, env=environment)
+
+    logging.info(f"Shard {shard} of {count} started (pid {process.pid})")
+
+    return process
+
+
+def shard_states(planPath, count):
+    return {shard: purge_shards.read_progress(purge_shards.progress_file(planPath, shard, count)) for shard in range(1, count + 1)}
+
+
+def lost_shards(states, localShards, watchStarted):
+
+    # Remote shards still running by their progress file that haven't updated it for shardLostSeconds (the shards rewrite it at least every
+    # purge_shards.heartbeatSeconds), or that haven't written one at all that long after this coordinator started
+    now = time.time()
+    lost = set()
+    for shard, state in states.items():
+        if shard in localShards:
+            continue
+        if state is None:
+            if now - watchStarted >= shardLostSeconds:
+                lost.add(shard)
+        elif state['status'] != purge_shards.FINISHED and now - state['updated'] >= shardLostSeconds:
+            lost.add(shard)
+
+    return lost
+
+
+def report(states, shardSizes, started, lost=()):
+
+    total = sum(shardSizes.values())
+    deleted = sum(state['deleted'] for state in states.values() if state)
+    done = deleted + sum(state['skipped'] for state in states.values() if state)
+    failed = sum(state['failed'] for state in states.values() if state)
+    statuses = Counter("lost" if shard in lost else state['status'] if state else "not started" for shard, state in states.items())
+
+    elapsed = max(time.monotonic() - started, 0.001)
+    message = f"Progress : {done}/{total}"
+    if total:
+        eta = (total - done) / (done / elapsed) if done else 0
+        message = message + f" ({done * 100 // total}%) - ETA {purge_results.format_seconds(eta)}"
+
+    logging.info(message + f" - {deleted / elapsed:.1f} deletes/s")
+    logging.info(f"    - deleted {deleted}, failed {failed}, shards " + ", ".join(f"{status} {number}" for status, number in sorted(statuses.items())))
+
+
+def summary(states, shardSizes, exitCodes, lost):
+
+    # Returns True when every shard finished and deleted everything it had
+    complete = True
+    for shard, state in states.items():
+        if shard in lost:
+            updated = f"last update {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(state['updated']))} on {state['host']}" if state else "no progress file"
+            logging.error(f"    - shard {shard} : lost, {updated}. Rerun it with --run {shard} --resume")
+            complete = False
+            continue
+
+        if state is None:
+            logging.error(f"    - shard {shard} : no progress file, it never started")
+            complete = False
+            continue
+
+        line = f"    - shard {shard} on {state['host']} : {state['status']}, {state['deleted']} of {shardSizes[shard]} deleted, {state['failed']} failed"
+        if shard in exitCodes and exitCodes[shard] != 0:
+            line = line + f", exited with {exitCodes[shard]}"
+
+        if state['status'] != purge_shards.FINISHED or state['failed'] or exitCodes.get(shard, 0) != 0:
+            logging.warning(line)
+            complete = False
+        else:
+            logging.info(line)
+
+    return complete
+
+
+######################################################################################################
+# Main
+######################################################################################################
+def main(argv):
+
+    shardCount = purgeShards
+    planPath = runList = username = password = ""
+    watchFlag = "N"
+    workerArgs = []
+
+    arg_help = f"""cdgc_purge_shards.py --execute-plan <file> -n <shards> --run <shards> -e <mode>
+           -h               help
+           -u  <username>   Username to log into IDMC (passed to the shards in their environment)
+           -p  <password>   Password to log into IDMC (passed to the shards in their environment)
+           -e  <mode>       Execution mode of the shards: thread (default) or async
+           -n  <count>      Number of shards (default {purgeShards})
+           --execute-plan <file>    Plan written by cdgc_delete_gov_assets.py or cdgc_delete_cdam_assets.py --plan (required)
+           --run <shards>           Shards to run on this host, e.g. 1-4 or 1,3 (default all of them)
+           --watch                  Run no shard here, only report the progress of the shards running on other hosts
+           --resume                 Shards skip everything their journal of a previous run has already deleted
+       """.format(argv[0])
+
+    try:
+        opts, args = getopt.getopt(argv[1:], "hu:p:e:n:", ["help", "username=", "password=", "engine=", "shards=", "execute-plan=", "run=", "watch", "resume"])
+    except getopt.GetoptError:
+        print(arg_help)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(arg_help)
+            sys.exit(2)
+        elif opt in ("-u", "--username"):
+            username = arg
+        elif opt in ("-p", "--password"):
+            password = arg
+        elif opt in ("-e", "--engine"):
+            workerArgs = workerArgs + ["-e", arg]
+        elif opt in ("-n", "--shards"):
+            try:
+                shardCount = int(arg)
+            except ValueError:
+                print(f"Invalid -n {arg}, the number of shards must be a whole number")
+                print(arg_help)
+                sys.exit(2)
+        elif opt == "--execute-plan":
+            planPath = str(Path(arg).resolve())
+        elif opt == "--run":
+            runList = arg
+        elif opt == "--watch":
+            watchFlag = "Y"
+        elif opt == "--resume":
+            workerArgs = workerArgs + ["--resume"]
+
+    if not planPath or shardCount < 1:
+        print(arg_help)
+        sys.exit(2)
+
+    if ok_to_delete != "Y":
+        print(f"Please update setup.py and set ok_to_delete to confirm it's ok to delete assets")
+        sys.exit(2)
+
+    try:
+        localShards = [] if watchFlag == "Y" else parse_shard_list(runList, shardCount) if runList else list(range(1, shardCount + 1))
+    except ValueError as e:
+        print(f"Invalid --run : {e}")
+        sys.exit(2)
+
+    with open(planPath) as planFile:
+        plan = json.load(planFile)
+
+    if plan.get("script") not in purgeScripts:
+        logging.error(f"Plan {planPath} was created by {plan.get('script')}, only the gov and CDAM purge plans can be sharded")
+        exit(1)
+
+    scriptPath = Path(__file__).resolve().parent / (plan['script'] + ".py")
+    shardSizes = Counter(purge_shards.shard_of(asset['identity'], shardCount) for asset in plan['assets'])
+    shardSizes = {shard: shardSizes.get(shard, 0) for shard in range(1, shardCount + 1)}
+
+    logging.info(f"Plan {planPath} : {plan['assetCount']} assets for {plan['script']} in {shardCount} shards of "
+                 f"{min(shardSizes.values())} to {max(shardSizes.values())} assets")
+    logging.info(f"Shards running here : {', '.join(str(shard) for shard in localShards) or 'none'}")
+
+    # SIGTERM stops the shards the same way as Ctrl-C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    started = time.monotonic()
+    watchStarted = time.time()
+    settings = worker_settings(username, password)
+    processes = {shard: start_shard(scriptPath, planPath, shard, shardCount, workerArgs, settings) for shard in localShards}
+    exitCodes = {}
+    lost = set()
+    lastReport = started
+
+    try:
+        while True:
+            time.sleep(1)
+
+            for shard, process in processes.items():
+                if shard not in exitCodes and process.poll() is not None:
+                    exitCodes[shard] = process.returncode
+                    if process.returncode:
+                        logging.warning(f"Shard {shard} exited with {process.returncode}, see {purge_shards.shard_dir(planPath, shard, shardCount) / 'worker.log'}")
+
+            # Done once the local shards have exited and the remote ones report they have finished or are lost
+            states = shard_states(planPath, shardCount)
+            nowLost = lost_shards(states, processes, watchStarted)
+            for shard in sorted(nowLost - lost):
+                reason = "hasn't been updated" if states[shard] else "hasn't been written"
+                logging.error(f"Shard {shard} is lost, its progress file {reason} for {shardLostSeconds} seconds")
+            lost = nowLost
+            remoteRunning = [shard for shard, state in states.items()
+                             if shard not in processes and shard not in lost and (state is None or state['status'] != purge_shards.FINISHED)]
+            if len(exitCodes) == len(processes) and not remoteRunning:
+                break
+
+            if time.monotonic() - lastReport >= purge_results.reportSeconds:
+                lastReport = time.monotonic()
+                report(states, shardSizes, started, lost)
+
+    except KeyboardInterrupt:
+        logging.info("Stopping the shards here, rerun with --resume to carry on")
+        for process in processes.values():
+            process.send_signal(signal.SIGINT)
+        for shard, process in processes.items():
+            exitCodes[shard] = process.wait()
+
+    states = shard_states(planPath, shardCount)
+    lost = lost & lost_shards(states, processes, watchStarted)
+    logging.info(f"Shards finished in {purge_results.format_seconds(time.monotonic() - started)}")
+    report(states, shardSizes, started, lost)
+
+    if not summary(states, shardSizes, exitCodes, lost):
+        logging.error("Not every shard deleted all of its assets, rerun with --resume to retry them")
+        exit(1)
+
+    logging.info(f'Script Completed')
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,129 @@
+import time
+import heapq
+import asyncio
+import random
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Tracks every outstanding purge job from one loop instead of one sleeping thread per job. Each job has its own poll interval that starts
+# at pollInitial and doubles after every check that isn't final, up to pollMax, with +/- 20% jitter so jobs submitted together don't keep
+# polling together. The loop sleeps until the next job is due, polls it, and calls onComplete the moment a job reaches a final status.
+# onComplete may add new jobs to the monitor; the loop keeps going until no jobs are left. A job whose status can't be read maxFailures
+# times in a row is given up on with the status UNKNOWN, so a job the server lost doesn't keep the run going forever. The final status of
+# every job is kept in results.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+UNKNOWN = "UNKNOWN"
+finalStatuses = ['COMPLETED', 'FAILED', 'COMPLETED WITH ERRORS', 'PARTIAL_COMPLETED', UNKNOWN]
+backoffFactor = 2
+jitter = 0.2
+
+
+class PurgeJob:
+
+    def __init__(self, jobId, name, pollDelay):
+        self.jobId = jobId
+        self.name = name
+        self.pollDelay = pollDelay
+        self.polls = 0
+        self.failures = 0       # status checks in a row that failed
+        self.submitted = time.monotonic()
+
+
+class JobMonitor:
+
+    def __init__(self, pollInitial, pollMax, maxFailures):
+        self.pollInitial = pollInitial
+        self.pollMax = pollMax
+        self.maxFailures = maxFailures
+        self.queue = []
+        self.sequence = 0
+        self.running = 0
+        self.results = {}
+
+    def add(self, jobId, name):
+
+        job = PurgeJob(jobId, name, self.pollInitial)
+        self.running = self.running + 1
+        self.schedule(job)
+        return job
+
+    def schedule(self, job):
+
+        # the sequence number keeps the heap from ever comparing two jobs that are due at the same time
+        self.sequence = self.sequence + 1
+        nextPoll = time.monotonic() + job.pollDelay * random.uniform(1 - jitter, 1 + jitter)
+        heapq.heappush(self.queue, (nextPoll, self.sequence, job))
+
+    def next_wait(self):
+        return max(0, self.queue[0][0] - time.monotonic())
+
+    def due_jobs(self):
+
+        now = time.monotonic()
+        dueJobs = []
+        while self.queue and self.queue[0][0] <= now:
+            dueJobs.append(heapq.heappop(self.queue)[2])
+
+        return dueJobs
+
+    def update(self, job, status):
+
+        # Returns True once the job has finished, otherwise puts it back in the queue with a longer interval
+        job.polls = job.polls + 1
+        logging.info(f"Checking Job Status [{job.name}] : {status}")
+
+        if status in finalStatuses:
+            self.running = self.running - 1
+            self.results[job.name] = status
+            return True
+
+        job.pollDelay = min(self.pollMax, job.pollDelay * backoffFactor)
+        self.schedule(job)
+        return False
+
+    def failed_poll(self, job, error):
+
+        # Returns the status to go on with, "" to try again later or UNKNOWN once the job is given up on
+        job.failures = job.failures + 1
+        if job.failures >= self.maxFailures:
+            logging.error(f"Unable to get status of job [{job.name}] {job.failures} times in a row, giving up on it : {error!r}")
+            return UNKNOWN
+
+        logging.warning(f"Unable to get status of job [{job.name}], will retry ({job.failures} of {self.maxFailures}) : {error!r}")
+        return ""
+
+    def run(self, getStatus, onComplete):
+
+        while self.queue:
+            time.sleep(self.next_wait())
+
+            for job in self.due_jobs():
+                try:
+                    status = getStatus(job.jobId)
+                    job.failures = 0
+                except Exception as e:
+                    status = self.failed_poll(job, e)
+
+                if self.update(job, status):
+                    onComplete(job, status)
+
+    async def run_async(self, getStatus, onComplete):
+
+        # Same loop as run(), but all jobs that are due at the same time are polled concurrently
+        while self.queue:
+            await asyncio.sleep(self.next_wait())
+
+            dueJobs = self.due_jobs()
+            statuses = await asyncio.gather(*(getStatus(job.jobId) for job in dueJobs), return_exceptions=True)
+
+            for job, status in zip(dueJobs, statuses):
+                if isinstance(status, Exception):
+                    status = self.failed_poll(job, status)
+                else:
+                    job.failures = 0
+
+                if self.update(job, status):
+                    await onComplete(job, status)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import threading
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Append-only journal of everything a purge has confirmed deleted, one JSON line per asset or relationship. Lines are written and fsynced
+# in groups (every journalGroupSize entries or journalGroupSeconds seconds, whichever comes first) so the journal doesn't cost a disk sync
+# per delete. A crash loses at most the last unsynced group, and those items are simply deleted again on the next run.
+# A run with --resume loads the journal and skips everything in it. A run without --resume starts a new journal, an earlier one that isn't
+# empty is kept under its name plus the time it was last written to (e.g. cdgc_delete_gov_assets.journal.20240131-142501).
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+
+def relationship_key(fromIdentity, toIdentity, link):
+    return fromIdentity + "|" + toIdentity + "|" + link
+
+
+def load_journal(fileName):
+
+    deletedAssets = set()
+    deletedRelationships = set()
+
+    if not os.path.isfile(fileName):
+        logging.info(f"No journal found at {fileName}, nothing to resume")
+        return deletedAssets, deletedRelationships
+
+    with open(fileName) as journalFile:
+        for line in journalFile:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line can be cut short if the process died while writing it
+                continue
+
+            if entry['type'] == "asset":
+                deletedAssets.add(entry['id'])
+            else:
+                deletedRelationships.add(entry['id'])
+
+    logging.info(f"Resuming from {fileName} : {len(deletedAssets)} assets and {len(deletedRelationships)} relationships already deleted")
+
+    return deletedAssets, deletedRelationships
+
+
+def open_journal(fileName, groupSize, groupSeconds, resume):
+
+    # Returns (journal, deleted assets, deleted relationships), the sets are empty unless the run resumes
+    deletedAssets, deletedRelationships = load_journal(fileName) if resume else (set(), set())
+
+    return PurgeJournal(fileName, groupSize, groupSeconds, resume), deletedAssets, deletedRelationships
+
+
+def rotate_journal(fileName):
+
+    # Returns the name the journal was moved to, or None when there was nothing to keep
+    if not os.path.isfile(fileName) or os.path.getsize(fileName) == 0:
+        return None
+
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(os.path.getmtime(fileName)))
+    keptName = f"{fileName}.{stamp}"
+    number = 1
+    while os.path.exists(keptName):
+        number = number + 1
+        keptName = f"{fileName}.{stamp}-{number}"
+
+    os.rename(fileName, keptName)
+    logging.info(f"Journal of an earlier run moved to {keptName}, use --resume to carry on from a journal")
+
+    return keptName
+
+
+class PurgeJournal:
+
+    def __init__(self, fileName, groupSize, groupSeconds, resume=False):
+        self.fileName = fileName
+        self.groupSize = groupSize
+        self.groupSeconds = groupSeconds
+        self.lock = threading.Lock()
+        self.pending = []
+        self.lastSync = time.monotonic()
+        if not resume:
+            rotate_journal(fileName)
+        self.file = open(fileName, 'a')
+
+    def record(self, elementType, key):
+
+        with self.lock:
+            self.pending.append(json.dumps({"type": elementType, "id": key}) + "\n")
+
+            if len(self.pending) >= self.groupSize or time.monotonic() - self.lastSync >= self.groupSeconds:
+                self.sync()
+
+    def sync(self):
+
+        # caller must hold the lock
+        if self.pending:
+            self.file.writelines(self.pending)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.pending = []
+
+        self.lastSync = time.monotonic()
+
+    def close(self):
+
+        with self.lock:
+            self.sync()
+            self.file.close()
@@ -0,0 +1,158 @@
+import json
+import time
+import threading
+import logging
+from datetime import datetime
+import purge_results
+import purge_shards
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Dry run support for the purge scripts. "--plan <file>" enumerates everything a purge would delete with the normal search calls, times
+# those calls, and writes the result to a plan file together with an estimate of the request count and wall time. Nothing is published.
+# "--execute-plan <file>" later loads the plan and deletes exactly what is listed, without searching again, with extra passes over the
+# assets that failed (execute_plan(), shared by the gov and CDAM purges).
+#
+# The estimate takes every kind of request a purge makes at the throughput it can reach: the requests in flight at once divided by the
+# latency (sampled for the searches and relationship lookups, publishLatencyEstimate for the deletes), capped by the rateLimits of the
+# kind's endpoint family. Search pages are read one after the other, everything else runs at the purge's concurrency.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+# request kind -> (rate limit family, sampled endpoint or None for the publish estimate, whether the requests are made one at a time)
+requestKinds = {
+    "search": ("search", "search", True),
+    "relationships": ("search", "relationships", False),
+    "relationshipDelete": ("publish", None, False),
+    "assetDelete": ("publish", None, False)
+}
+
+
+class LatencySampler:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def timed(self, endpoint, func, *args):
+
+        startTime = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - startTime
+            with self.lock:
+                self.samples.setdefault(endpoint, []).append(elapsed)
+
+    def summary(self):
+
+        summary = {}
+        with self.lock:
+            for endpoint, samples in self.samples.items():
+                ordered = sorted(samples)
+                summary[endpoint] = {
+                    "count": len(ordered),
+                    "mean": round(sum(ordered) / len(ordered), 4),
+                    "p50": round(ordered[len(ordered) // 2], 4),
+                    "p90": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))], 4)
+                }
+
+        return summary
+
+
+def estimate(requestCounts, sampler, publishLatency, concurrency, rateLimits):
+
+    # requestCounts are the deletes, the searches and lookups a purge makes are the ones the plan made, counted by the sampler. Publish
+    # calls can't be sampled without deleting something, so they use the configured estimate instead of a measured latency
+    latency = sampler.summary()
+    counts = {endpoint: summary['count'] for endpoint, summary in latency.items()}
+    counts.update(requestCounts)
+
+    seconds = {}
+    for kind, count in counts.items():
+        family, endpoint, oneAtATime = requestKinds[kind]
+        kindLatency = latency[endpoint]['mean'] if endpoint in latency else publishLatency
+        throughput = (1 if oneAtATime else max(1, concurrency)) / max(kindLatency, 0.001)
+        if rateLimits.get(family):
+            throughput = min(throughput, rateLimits[family])
+        seconds[kind] = count / throughput
+
+    return {
+        "requests": dict(counts, total=sum(counts.values())),
+        "sampledLatency": latency,
+        "publishLatencyEstimate": publishLatency,
+        "concurrency": concurrency,
+        "rateLimits": {family: rateLimits.get(family, 0) for family in sorted({kind[0] for kind in requestKinds.values()})},
+        "seconds": {kind: round(kindSeconds, 1) for kind, kindSeconds in seconds.items()},
+        "wallSeconds": round(sum(seconds.values()), 1),
+        "executePlanSeconds": round(sum(kindSeconds for kind, kindSeconds in seconds.items() if requestKinds[kind][1] is None), 1)
+    }
+
+
+def write_plan(fileName, script, assets, planEstimate, **details):
+
+    plan = {
+        "script": script,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "assetCount": len(assets),
+        "estimate": planEstimate,
+        "assets": assets
+    }
+    plan.update(details)
+
+    with open(fileName, 'w') as planFile:
+        json.dump(plan, planFile, indent=2)
+
+    logging.info(f"Plan written to {fileName}")
+    logging.info(f"    - Assets : {len(assets)}")
+    logging.info(f"    - Requests : {planEstimate['requests']['total']}")
+    logging.info(f"    - Estimated wall time : {planEstimate['wallSeconds']} seconds at concurrency {planEstimate['concurrency']}, "
+                 f"{planEstimate['executePlanSeconds']} seconds with --execute-plan")
+
+
+def read_plan(fileName, script):
+
+    with open(fileName) as planFile:
+        plan = json.load(planFile)
+
+    if plan.get("script") != script:
+        logging.error(f"Plan {fileName} was created by {plan.get('script')}, not {script}")
+        exit(1)
+
+    logging.info(f"Loaded plan {fileName} created {plan['created']} with {plan['assetCount']} assets")
+
+    return plan
+
+
+def execute_plan(fileName, script, runner, func, asyncFunc, maxRetryPasses, shardIndex=0, shardCount=0):
+
+    # Deletes the assets of the plan with func / asyncFunc on the runner (purge_results.TaskRunner), or only shard k of N of them
+    plan = read_plan(fileName, script)
+    planAssets = plan['assets']
+    deleted = 0
+
+    # A shard only deletes its part of the plan, other processes delete the rest
+    shardProgress = None
+    if shardCount:
+        planAssets = purge_shards.select(planAssets, shardIndex, shardCount)
+        logging.info(f"Shard {shardIndex} of {shardCount} : {len(planAssets)} of {plan['assetCount']} assets in the plan")
+        shardProgress = runner.progress = purge_shards.ShardProgress(fileName, shardIndex, shardCount, len(planAssets))
+    totalAssets = len(planAssets)
+
+    for retryPass in range(maxRetryPasses + 1):
+        if retryPass:
+            logging.info(f"Retrying {len(planAssets)} assets that were not deleted (pass {retryPass} of {maxRetryPasses})")
+
+        logging.info(f'Starting to delete assets')
+        results = runner.run(func, asyncFunc, planAssets)
+        deleted = deleted + results.counts[purge_results.DELETED]
+        planAssets = results.failedItems
+        if shardProgress is not None:
+            shardProgress.pass_finished(results)
+
+        if not purge_results.should_retry(results):
+            break
+
+    logging.info(f"Deleted {deleted} of {totalAssets} assets in the plan")
+    if shardProgress is not None:
+        shardProgress.finish()
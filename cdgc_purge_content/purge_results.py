@@ -0,0 +1,132 @@
+import time
+import threading
+import logging
+from multiprocessing.pool import ThreadPool
+from idmc_common import progress, tracing
+import async_engine
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Collects the outcome of every purge task as it finishes. Each task returns one of the statuses below and the collector keeps thread safe
+# counters per status and the items that didn't get deleted (for retries). Progress, rate, API latency and ETA are shown by idmc_common/progress.py.
+#
+# The gov and CDAM purges share the rest of their task handling from here: TaskRunner runs one task per item on the thread pool or the
+# async engine, should_retry() decides whether the failed items get another pass and check_delete_response() reads a publish response.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+DELETED = "DELETED"
+CONTENT_FAILED = "CONTENT_FAILED"
+HTTP_ERROR = "HTTP_ERROR"
+EXCEPTION = "EXCEPTION"
+SKIPPED = "SKIPPED"
+
+reportSeconds = 10     # how often cdgc_purge_shards.py logs the combined progress of the shards
+progressSeconds = 1     # how often a sharded run rewrites its progress file
+
+format_seconds = progress.format_seconds
+
+
+class PurgeResults:
+
+    def __init__(self, total=0):
+        self.lock = threading.Lock()
+        self.total = total
+        self.counts = {DELETED: 0, CONTENT_FAILED: 0, HTTP_ERROR: 0, EXCEPTION: 0, SKIPPED: 0}
+        self.failedItems = []
+        self.started = time.monotonic()
+        self.progress = None        # purge_shards.ShardProgress of a sharded run
+        self.lastProgress = self.started
+        self.display = progress.Progress("Delete", total, "assets", ("publish",), self.detail)
+
+    def add_total(self, count):
+
+        with self.lock:
+            self.total = self.total + count
+        self.display.add_total(count)
+
+    def record(self, item, status):
+
+        if isinstance(status, Exception) or status not in self.counts:
+            status = EXCEPTION
+
+        with self.lock:
+            self.counts[status] = self.counts[status] + 1
+
+            if status not in (DELETED, SKIPPED):
+                self.failedItems.append(item)
+
+            if self.progress is not None and time.monotonic() - self.lastProgress >= progressSeconds:
+                self.lastProgress = time.monotonic()
+                self.progress.update(self)
+
+        self.display.advance()
+
+    def done(self):
+        return sum(self.counts.values())
+
+    def detail(self):
+        return (f"deleted {self.counts[DELETED]}, content failed {self.counts[CONTENT_FAILED]}, http errors {self.counts[HTTP_ERROR]}, "
+                f"exceptions {self.counts[EXCEPTION]}, skipped {self.counts[SKIPPED]}")
+
+    def summary(self):
+
+        self.display.finish()
+        with self.lock:
+            logging.info("    - " + self.detail())
+
+
+class TaskRunner:
+
+    def __init__(self, executionMode, threads, asyncConcurrency, connectionsPerHost):
+        self.executionMode = executionMode
+        self.threads = threads
+        self.asyncConcurrency = asyncConcurrency
+        self.connectionsPerHost = connectionsPerHost
+        self.progress = None        # purge_shards.ShardProgress of a sharded run
+
+    def run(self, func, asyncFunc, items):
+
+        # Runs one task per item on the configured engine and collects every status as soon as the task finishes
+        results = PurgeResults(len(items))
+        results.progress = self.progress
+
+        with tracing.span("delete", {"idmc.tasks": len(items)}):
+            if self.executionMode == "async":
+                async_engine.run(asyncFunc, items, self.asyncConcurrency, self.connectionsPerHost, results.record)
+            else:
+                with ThreadPool(self.threads) as pool:
+                    for item, status in pool.imap_unordered(tracing.task(lambda item: (item, func(item)), func.__name__), items):
+                        results.record(item, status)
+
+        results.summary()
+
+        return results
+
+
+def should_retry(results):
+
+    # CONTENT_FAILED usually means the asset is still referenced by another asset in the same run, so it is worth another pass as long as
+    # the last pass deleted something. HTTP errors and exceptions are retried regardless, up to maxRetryPasses
+    if not results.failedItems:
+        return False
+
+    transientErrors = results.counts[HTTP_ERROR] + results.counts[EXCEPTION]
+
+    return results.counts[DELETED] > 0 or transientErrors > 0
+
+
+def check_delete_response(deleteResponse, elementName, journalKey, journal):
+
+    # Publish response of a single delete. elementName is "Asset" or "Relationship", a confirmed delete is recorded in the journal
+    if deleteResponse['items'][0]['messageCode'] == "CONTENT_FAILED":
+        logging.debug(f"Status: " + deleteResponse['items'][0]['messageCode'])
+        logging.debug(f"Reason: " + deleteResponse['items'][0]['validations'][0]['results'][0]['messageCode'])
+        return CONTENT_FAILED
+
+    logging.debug(f"{elementName} has been deleted")
+
+    if journal is not None:
+        journal.record(elementName.lower(), journalKey)
+
+    return DELETED
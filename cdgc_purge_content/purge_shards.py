@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import zlib
+import socket
+import logging
+import threading
+from pathlib import Path
+import purge_results
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Sharded plan execution for the gov and CDAM purges. "--execute-plan <file> --shard k/N" makes a purge delete only the plan assets whose
+# identity hashes to shard k of N, so N processes, on one host or several sharing the plan file, can work through one plan without
+# overlapping. Each shard logs in on its own (own session, token and connection pool), keeps its own journal and writes its progress to a
+# JSON file next to the plan that cdgc_purge_shards.py adds up:
+#
+#   <plan>.shards/shard<k>of<N>/journal         journal of the shard, used by --resume
+#   <plan>.shards/shard<k>of<N>/progress.json   deleted / failed counts of the shard, rewritten at every progress report
+#
+# The rateLimits in setup.py are the budget of the whole purge, each shard takes 1/N of them. A running shard rewrites its progress file at
+# least every heartbeatSeconds, also while nothing gets deleted, so the coordinator can tell a slow shard from a lost one.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+RUNNING = "running"
+FINISHED = "finished"
+
+heartbeatSeconds = 30
+
+
+def parse_shard(value):
+
+    # "k/N" with 1 <= k <= N, returns (k, N) or None when it isn't valid
+    try:
+        shard, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        return None
+
+    return (shard, count) if 1 <= shard <= count else None
+
+
+def shard_of(identity, count):
+
+    # crc32 rather than hash(), which is salted per process
+    return zlib.crc32(identity.encode()) % count + 1
+
+
+def select(items, shard, count):
+    return [item for item in items if shard_of(item['identity'], count) == shard]
+
+
+def shard_rates(rateLimits, count):
+    return {family: limit / count for family, limit in rateLimits.items()}
+
+
+def shard_dir(planFile, shard, count):
+
+    # Created if it doesn't exist yet
+    directory = Path(str(Path(planFile).resolve()) + ".shards") / f"shard{shard}of{count}"
+    directory.mkdir(parents=True, exist_ok=True)
+
+    return directory
+
+
+def journal_file(planFile, shard, count):
+    return str(shard_dir(planFile, shard, count) / "journal")
+
+
+def progress_file(planFile, shard, count):
+    return str(shard_dir(planFile, shard, count) / "progress.json")
+
+
+def read_progress(fileName):
+
+    try:
+        with open(fileName) as progressInput:
+            return json.load(progressInput)
+    except (OSError, ValueError):
+        return None
+
+
+class ShardProgress:
+
+    def __init__(self, planFile, shard, count, total):
+        self.fileName = progress_file(planFile, shard, count)
+        self.state = {
+            "shard": shard,
+            "count": count,
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "status": RUNNING,
+            "total": total,
+            "deleted": 0,
+            "skipped": 0,
+            "failed": 0,
+            "pass": 0,
+            "started": time.time(),
+            "updated": time.time()
+        }
+        self.deletedBefore = self.skippedBefore = 0
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.write()
+        threading.Thread(target=self.heartbeat, name="shard-heartbeat", daemon=True).start()
+
+    def write(self):
+
+        # Written to a temp file and renamed, so the coordinator never reads half a file
+        with self.lock:
+            self.state['updated'] = time.time()
+            tempFile = self.fileName + ".tmp"
+            with open(tempFile, 'w') as progressOutput:
+                json.dump(self.state, progressOutput)
+            os.replace(tempFile, self.fileName)
+
+    def heartbeat(self):
+        while not self.stop.wait(heartbeatSeconds):
+            self.write()
+
+    def update(self, results):
+
+        # Called by PurgeResults every progressSeconds, with its lock held
+        self.state['deleted'] = self.deletedBefore + results.counts[purge_results.DELETED]
+        self.state['skipped'] = self.skippedBefore + results.counts[purge_results.SKIPPED]
+        self.state['failed'] = len(results.failedItems)
+        self.write()
+
+    def pass_finished(self, results):
+
+        self.update(results)
+        self.deletedBefore, self.skippedBefore = self.state['deleted'], self.state['skipped']
+        self.state['pass'] = self.state['pass'] + 1
+
+    def finish(self):
+
+        self.stop.set()
+        self.state['status'] = FINISHED
+        self.write()
+        logging.info(f"Shard {self.state['shard']} of {self.state['count']} finished : {self.state['deleted']} of {self.state['total']} assets deleted")
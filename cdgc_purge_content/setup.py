@@ -10,4 +10,52 @@ cdgc_api_url = "https://cdgc-api.dmp-us.informaticacloud.com"
 # Agreement
 # Set to Y means you agree that this program can delete content from your catalog
 # Informatica provides no support or warranty for this the usage of this program
-ok_to_delete = "N"
\ No newline at end of file
+ok_to_delete = "N"
+
+# Execution mode used to send the purge requests (can also be set with -e on the command line)
+#   thread - ThreadPool with blocking requests
+#   async  - asyncio event loop with a non-blocking HTTP client, requires aiohttp (pip install aiohttp)
+executionMode = "thread"
+concurrentThreads = 25          # worker threads of the gov and CDAM purges in thread mode
+asyncConcurrency = 200          # max requests in flight at once
+asyncConnectionsPerHost = 100   # max open connections to a single host
+
+# Dry run planning (--plan). Publish calls can't be timed without deleting something, so the wall time estimate in a plan uses this many
+# seconds per delete request
+publishLatencyEstimate = 0.5
+
+# Journal of confirmed deletes, used by --resume. Entries are written to disk in groups of this many entries or after this many seconds
+journalGroupSize = 100
+journalGroupSeconds = 2
+
+# Technical asset purges -- max number of catalog source purge jobs running on the server at the same time, and threads used to count the
+# assets of each catalog source
+maxRunningPurges = 4
+technicalThreads = 8
+maxStatusPollFailures = 10      # status checks of a purge job in a row that may fail before the job is reported as UNKNOWN
+
+# Search filter (dsl filterSpec) that selects the assets of one catalog source when -a counts them to purge the largest first. {id} and
+# {name} are the catalog source's ID and name. Check it against your org, a scanner whose count fails is purged after the counted ones
+scannerAssetFilter = 'core.origin = "{id}"'
+
+# Sharded plan execution (cdgc_purge_shards.py) -- number of shard processes a plan is split into. rateLimits are shared out between them
+purgeShards = 4
+shardLostSeconds = 300          # a shard on another host whose progress file hasn't changed for this long is reported as lost
+
+# Number of extra passes over assets that failed with an HTTP error or exception before the gov and CDAM purges give up on them
+maxRetryPasses = 3
+
+# Shared by the scripts of every folder, the idmc_common module named at the end of a line explains the setting
+rateLimits = {"identity": 0, "search": 0, "publish": 0, "catalog_source": 0, "notification": 0}  # requests per second per endpoint family, 0 = no limit (ratelimit.py)
+rateLimitBurst = 1                                  # requests that may go out back to back (ratelimit.py)
+credentialCache = "~/.idmc/credentials.json"        # session and token reused by the next run, "" logs in every time (credentials.py)
+tokenRefreshMargin = 300                            # seconds before it expires that the token is refreshed (credentials.py)
+metricsJsonFile = "{script}.metrics.json"           # API metrics summary written at exit, "" for none (metrics.py)
+metricsPromFile = "{script}.prom"                   # the same as a Prometheus textfile, "" for none (metrics.py)
+traceFile = ""                                      # OTLP JSON trace of the run, e.g. "{script}.trace.json", "" for none (tracing.py)
+profileFile = "{script}.{phase}"                    # reports of --profile, one per phase (profiling.py)
+profileInterval = 0.005                             # seconds between two stack samples (profiling.py)
+httpCacheFile = "~/.idmc/http_cache.db"             # catalog reads revalidated instead of downloaded again, "" for none (httpcache.py)
+httpCacheDays = 7                                   # entries not used for this many days are dropped (httpcache.py)
+progressDisplay = "auto"                            # auto, live, log or off (progress.py)
+progressReportSeconds = 10                          # seconds between two progress log lines (progress.py)
@@ -0,0 +1,7 @@
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Code shared by the scripts in cdgc_lineage, cdgc_purge_content, multi_org and notifications. The scripts are run from their own folder, so
+# each one adds the repository root to sys.path before importing from here. Modules are imported individually, nothing is loaded by this
+# file. cli.py is the "idmc" command that runs any of the scripts (pip install -e . from the repository root).
+# ---------------------------------------------------------------------------------------------------------------------------------------------
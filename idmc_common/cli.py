@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# One command for all the scripts in this repo, installed as "idmc" by pip install -e . from the repository root:
+#
+#   idmc lineage export -a <asset id>
+#   idmc purge gov -u <username> -p <password> -e async --concurrency 50 --output-dir runs/gov
+#
+# The command picks the script and runs it with its own options (see idmc_common/runscript.py), so everything after the command works as
+# it does for the script. Only the selected script and what it imports are loaded; this file itself imports nothing but os, sys and json,
+# which keeps "idmc" as quick to start as running the script directly. The shared options below can be given anywhere on the command line
+# and mean the same for every command, they are turned into the matching setup.py settings of the script.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+repoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# command -> (script, description, settings --concurrency sets, whether the script takes --metrics-interval)
+commands = {
+    "lineage": {
+        "export": ("cdgc_lineage/cdgc_export_lineage.py", "Inbound and outbound lineage of an asset to CSV files", [], True),
+        "list": ("cdgc_lineage/cdgc_list_object_lineage.py", "Assets with lineage whose name matches a search", [], True),
+        "snapshot": ("cdgc_lineage/cdgc_snapshot_catalog.py", "Take or refresh a local snapshot of the catalog", ["snapshotThreads"], True),
+        "query": ("cdgc_lineage/cdgc_query_lineage.py", "Answer lineage questions from a snapshot, without the API", [], False)
+    },
+    "purge": {
+        "gov": ("cdgc_purge_content/cdgc_delete_gov_assets.py", "Delete business (governance) assets", ["concurrentThreads", "asyncConcurrency"], True),
+        "cdam": ("cdgc_purge_content/cdgc_delete_cdam_assets.py", "Delete CDAM policies and rules", ["concurrentThreads", "asyncConcurrency"], True),
+        "technical": ("cdgc_purge_content/cdgc_delete_technical_assets.py", "Purge catalog sources", ["technicalThreads"], True),
+        "shards": ("cdgc_purge_content/cdgc_purge_shards.py", "Run a gov or CDAM purge plan as parallel shards", [], False)
+    },
+    "notify": {
+        "send": ("notifications/idmc_send_bell_notification.py", "Send bell notifications", ["notificationThreads"], True),
+        "dispatch": ("notifications/idmc_notification_dispatcher.py", "Send the queued notifications", ["notificationThreads"], True)
+    },
+    "multi-org": ("multi_org/idmc_multi_org.py", "Run a script on every org of an inventory file", [], False)
+}
+
+# option -> (value, "" when it takes none, help)
+sharedOptions = {
+    "--concurrency": ("<count>", "Requests / threads working at the same time"),
+    "--no-cache": ("", "Don't use the HTTP cache or the in memory lookup cache"),
+    "--cache-file": ("<file>", "HTTP cache file (httpCacheFile)"),
+    "--output-dir": ("<dir>", "Run in this directory, the output files are written there. Relative input paths are relative to it too"),
+    "--metrics-interval": ("<seconds>", "Log and write the API metrics every so many seconds"),
+    "--metrics-json": ("<file>", "API metrics JSON file, \"\" for none (metricsJsonFile)"),
+    "--metrics-prom": ("<file>", "API metrics Prometheus textfile, \"\" for none (metricsPromFile)"),
+    "--trace": ("<file>", "Write an OTLP JSON trace of the run to this file (traceFile)"),
+    "--progress": ("<mode>", "Progress display: auto, live, log or off (progressDisplay)"),
+    "--settings": ("<file>", "JSON file of setup.py settings to use, like the defaults of a multi org inventory"),
+    "--set": ("<name=value>", "Set one setup.py setting, name=value with a JSON or plain string value. Can be repeated")
+}
+
+
+def usage(group=None):
+
+    lines = ["usage: idmc <command> [shared options] [command options]", ""]
+    for name, entry in commands.items():
+        if group is not None and name != group:
+            continue
+        if isinstance(entry, tuple):
+            lines.append(f"  {name:<30}{entry[1]}")
+        else:
+            for command, (script, description, threadSettings, takesInterval) in entry.items():
+                lines.append(f"  {name + ' ' + command:<30}{description}")
+
+    lines = lines + ["", "shared options:"]
+    lines = lines + [f"  {(option + ' ' + value).strip():<30}{description}" for option, (value, description) in sharedOptions.items()]
+    lines = lines + ["", "idmc <command> -h shows the options of the command. Settings can also come from $IDMC_SETTINGS (JSON)."]
+
+    return "\n".join(lines)
+
+
+def find_command(args):
+
+    # Returns (command name, command entry, remaining arguments) or None
+    if not args or args[0] not in commands:
+        return None
+
+    entry = commands[args[0]]
+    if isinstance(entry, tuple):
+        return args[0], entry, args[1:]
+    if len(args) < 2 or args[1] not in entry:
+        return None
+
+    return args[0] + " " + args[1], entry[args[1]], args[2:]
+
+
+def split_shared(args):
+
+    # Takes the shared options out of the arguments, "--option value" or "--option=value". Returns ({option: [values]}, other arguments)
+    shared = {}
+    rest = []
+    index = 0
+    while index < len(args):
+        option, separator, value = args[index].partition("=")
+        if option not in sharedOptions:
+            rest.append(args[index])
+        elif not sharedOptions[option][0]:
+            shared.setdefault(option, []).append("")
+        elif separator:
+            shared.setdefault(option, []).append(value)
+        elif index + 1 < len(args):
+            index = index + 1
+            shared.setdefault(option, []).append(args[index])
+        else:
+            raise ValueError(f"{option} needs a value")
+        index = index + 1
+
+    return shared, rest
+
+
+def setting_value(value):
+
+    # JSON when it parses (numbers, lists, dicts, true / false), a plain string otherwise
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def build_settings(name, shared, threadSettings):
+
+    settings = json.loads(os.environ.get("IDMC_SETTINGS") or "{}")
+
+    for fileName in shared.get("--settings", []):
+        with open(fileName) as settingsFile:
+            settings.update(json.load(settingsFile))
+
+    if "--concurrency" in shared:
+        if not threadSettings:
+            print(f"idmc: --concurrency has no effect on {name}", file=sys.stderr)
+        settings.update({setting: int(shared["--concurrency"][-1]) for setting in threadSettings})
+    if "--no-cache" in shared:
+        settings.update({"httpCacheFile": "", "coalesceCacheSize": 0})
+    if "--cache-file" in shared:
+        settings['httpCacheFile'] = shared["--cache-file"][-1]
+    if "--metrics-json" in shared:
+        settings['metricsJsonFile'] = shared["--metrics-json"][-1]
+    if "--metrics-prom" in shared:
+        settings['metricsPromFile'] = shared["--metrics-prom"][-1]
+    if "--trace" in shared:
+        settings['traceFile'] = shared["--trace"][-1]
+    if "--progress" in shared:
+        if shared["--progress"][-1] not in ("auto", "live", "log", "off"):
+            raise ValueError("--progress must be auto, live, log or off")
+        settings['progressDisplay'] = shared["--progress"][-1]
+
+    for assignment in shared.get("--set", []):
+        setting, separator, value = assignment.partition("=")
+        if not separator or not setting:
+            raise ValueError(f"--set {assignment} isn't name=value")
+        settings[setting] = setting_value(value)
+
+    return settings
+
+
+def main(argv=None):
+
+    argv = sys.argv if argv is None else argv
+
+    if len(argv) < 2 or argv[1] in ("-h", "--help"):
+        print(usage())
+        sys.exit(2)
+
+    found = find_command(argv[1:])
+    if found is None:
+        print(usage(argv[1] if argv[1] in commands else None))
+        sys.exit(2)
+
+    name, (script, description, threadSettings, takesInterval), args = found
+    try:
+        shared, scriptArgs = split_shared(args)
+        settings = build_settings(name, shared, threadSettings)
+    except (ValueError, OSError) as e:
+        print(f"idmc: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if "--metrics-interval" in shared:
+        if takesInterval:
+            scriptArgs = scriptArgs + ["--metrics-interval", shared["--metrics-interval"][-1]]
+        else:
+            print(f"idmc: --metrics-interval has no effect on {name}", file=sys.stderr)
+
+    if "--output-dir" in shared:
+        os.makedirs(shared["--output-dir"][-1], exist_ok=True)
+        os.chdir(shared["--output-dir"][-1])
+
+    # Loaded only now, so a typo or -h doesn't pay for anything
+    from idmc_common import runscript
+
+    runscript.run(os.path.join(repoRoot, script), scriptArgs, settings)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import json
+import time
+import logging
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from idmc_common import httpcache, jsonstream, metrics, ratelimit, tracing
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Shared IDMC / CDGC HTTP client. Every request goes through one requests.Session, so connections are kept alive and reused instead of
+# paying a TCP and TLS handshake per call. The connection pool is sized to the number of worker threads with configure(). After login and
+# generate_token every request carries the org ID and bearer token by default, and gzip (plus br when brotli is installed) responses are
+# decoded transparently. When credentials.login() is used, refreshHook keeps the token fresh before each request and after a 401. Every
+# request is recorded in metrics and traced as a client span. conditional() revalidates catalog reads kept in the httpcache file rather
+# than fetching them again.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+apiTimeout = 120
+poolSize = 10
+acceptEncoding = "gzip, deflate, br" if brotli else "gzip, deflate"
+
+orgID = sessionID = token = ""
+refreshHook = None
+
+session = None
+sessionLock = threading.Lock()
+
+
+def configure(workers):
+
+    # Call before the first request, the pool is created on first use
+    global poolSize, session
+
+    poolSize = max(1, workers)
+    session = None
+
+
+def get_session():
+
+    global session
+
+    with sessionLock:
+        if session is None:
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=poolSize)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({'Accept-Encoding': acceptEncoding, 'Content-type': 'application/json'})
+
+            # Sessions and tokens are always passed in headers, don't let cookies set by one response leak into every later request
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        return session
+
+
+def auth_headers():
+
+    if refreshHook is not None:
+        refreshHook()
+
+    return session_headers()
+
+
+def session_headers():
+
+    # The org and auth headers as they are now, without a token refresh (the async engine refreshes off the event loop first)
+    headers = {}
+    if orgID:
+        headers['X-INFA-ORG-ID'] = orgID
+    if token:
+        headers['Authorization'] = 'Bearer ' + token
+
+    return headers
+
+
+def request(family, method, url, headers=None, data=None, auth=True, timeout=apiTimeout, stream=False):
+
+    # headers are added to (and override) the default org and auth headers, auth=False sends neither. The auth headers are read after
+    # the rate limit wait so a request never goes out with a token that expired while it was waiting
+    ratelimit.acquire(family)
+
+    requestHeaders = auth_headers() if auth else {}
+    if headers:
+        requestHeaders.update(headers)
+
+    response = send(family, method, url, requestHeaders, data, timeout, stream)
+
+    # The token can be revoked or expire early, get a new one and try once more
+    if response.status_code == 401 and auth and refreshHook is not None:
+        response.close()
+        refreshHook(requestHeaders.get('Authorization', '')[len('Bearer '):])
+        requestHeaders.update(auth_headers())
+        ratelimit.acquire(family)
+        response = send(family, method, url, requestHeaders, data, timeout, stream)
+
+    return response
+
+
+def send(family, method, url, headers, data, timeout, stream):
+
+    # One request on the pooled session, recorded in metrics and traced. A streamed 200 response is recorded by request_items once it has
+    # been read
+    with tracing.http_span(family, method, url) as httpSpan:
+        started = time.perf_counter()
+        try:
+            response = get_session().request(method, url, headers=headers, data=data, timeout=timeout, stream=stream)
+        except requests.exceptions.RequestException as e:
+            metrics.record(family, method, url, type(e).__name__, time.perf_counter() - started, len(data or ""))
+            raise
+
+        httpSpan.set_status(response.status_code)
+
+        if not stream or response.status_code != 200:
+            # Received bytes are counted on the wire, before gzip / br decoding. A streamed error body is read here, callers only use its text
+            response.content
+            metrics.record(family, method, url, response.status_code, time.perf_counter() - started, len(data or ""), response.raw.tell())
+
+    return response
+
+
+def request_items(family, method, url, prefix, headers=None, data=None, convert=None, **kwargs):
+
+    # For large responses. Decodes the body incrementally and returns the response and a list of convert(item) for every item at prefix
+    # (see jsonstream), so only the converted items are kept. The list is None when the status isn't 200, the body is in response.text
+    response = request(family, method, url, headers, data, stream=True, **kwargs)
+
+    if response.status_code != 200:
+        return response, None
+
+    decodeStarted = time.perf_counter()
+    items = [convert(item) if convert else item for item in jsonstream.items(response, prefix)]
+    metrics.record(family, method, url, response.status_code, response.elapsed.total_seconds() + time.perf_counter() - decodeStarted,
+                   len(data or ""), response.raw.tell())
+
+    return response, items
+
+
+def conditional(family, method, url, headers=None, data=None, **kwargs):
+
+    # A read that is revalidated against the response cache (httpcache) instead of refetched. The ETag / Last-Modified of the stored
+    # response are sent as If-None-Match / If-Modified-Since, and a 304 Not Modified is returned as a 200 response with the stored body,
+    # so callers handle it like any other response. Without the cache this is a plain request
+    if not httpcache.enabled():
+        return request(family, method, url, headers, data, **kwargs)
+
+    key = httpcache.response_key(orgID, method, url, data)
+    cached = httpcache.lookup(key)
+    httpcache.count_request()
+
+    requestHeaders = dict(headers or {})
+    if cached is not None:
+        etag, lastModified, body = cached
+        if etag:
+            requestHeaders['If-None-Match'] = etag
+        if lastModified:
+            requestHeaders['If-Modified-Since'] = lastModified
+
+    response = request(family, method, url, requestHeaders, data, **kwargs)
+
+    if response.status_code == 304 and cached is not None:
+        httpcache.touch(key)
+        cachedResponse = requests.Response()
+        cachedResponse.status_code = 200
+        cachedResponse.headers = response.headers
+        cachedResponse.url = response.url
+        cachedResponse.encoding = "utf-8"
+        cachedResponse._content = body
+        return cachedResponse
+
+    etag, lastModified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+    if response.status_code == 200 and (etag or lastModified):
+        httpcache.store(key, etag, lastModified, response.content)
+
+    return response
+
+
+def get(family, url, headers=None, **kwargs):
+    return request(family, "GET", url, headers, **kwargs)
+
+
+def post(family, url, headers=None, data=None, **kwargs):
+    return request(family, "POST", url, headers, data, **kwargs)
+
+
+def delete(family, url, headers=None, **kwargs):
+    return request(family, "DELETE", url, headers, **kwargs)
+
+
+def idmc_login(username, password, url):
+
+    global orgID, sessionID
+
+    url = url + "/identity-service/api/v1/Login"
+    rawData = json.dumps({"username": username, "password": password})
+
+    response = post("identity", url, data=rawData, auth=False)
+    loginInfo = json.loads(response.text)
+
+    if "error" in loginInfo or response.status_code >= 400:
+        logging.error(f"Error logging into IDMC : {loginInfo.get('error', {}).get('message', response.text)}")
+        exit(1)
+
+    orgID = loginInfo['orgId']
+    sessionID = loginInfo['sessionId']
+
+    return loginInfo
+
+
+def idmc_login_ma(username, password, url):
+
+    # Platform (v2) login, returns the pod URL in serverUrl as well as the session
+    global orgID, sessionID
+
+    url = url + "/ma/api/v2/user/login"
+    rawData = json.dumps({"username": username, "password": password})
+
+    response = post("identity", url, data=rawData, auth=False)
+    loginInfo = json.loads(response.text)
+
+    if "icSessionId" not in loginInfo:
+        logging.error(f"Error logging into IDMC : {response.text}")
+        exit(1)
+
+    orgID = loginInfo['orgUuid']
+    sessionID = loginInfo['icSessionId']
+
+    return loginInfo
+
+
+def generate_token(url, exitOnError=True):
+
+    # With exitOnError=False a failure returns None, which is how the credential manager finds out the session has expired
+    global token
+
+    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
+    headers = {'cookie': 'USER_SESSION=' + sessionID, 'IDS-SESSION-ID': sessionID}
+
+    response = post("identity", url, headers, auth=False)
+    try:
+        tokenJson = json.loads(response.text)
+    except ValueError:
+        tokenJson = {"error": {"message": f"HTTP {response.status_code}"}}
+
+    if "error" in tokenJson or "jwt_token" not in tokenJson:
+        if not exitOnError:
+            return None
+        logging.error(f"Error getting token: {tokenJson.get('error', {}).get('message', response.text)}")
+        exit(1)
+
+    token = tokenJson['jwt_token']
+
+    return tokenJson
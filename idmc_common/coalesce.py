@@ -0,0 +1,151 @@
+import time
+import atexit
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Single-flight request coalescing with a small LRU of recent results. When several threads (or coroutines) ask for the same key while a
+# request for it is in flight, only the first one calls the API and the others wait for its result, so they share one HTTP call and one
+# decoded result. Completed results are kept in the LRU for cacheSeconds, up to cacheSize entries, and a cache size of 0 only coalesces
+# requests that are in flight at the same time.
+#
+# Results are shared between callers, they must be treated as read only. A failed lookup (an exception, None or "") is handed to the
+# callers that waited for it but never cached, so the next call asks the API again.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+
+    def __init__(self, name, cacheSize=0, cacheSeconds=0):
+        self.name = name
+        self.cacheSize = cacheSize
+        self.cacheSeconds = cacheSeconds
+        self.cache = OrderedDict()
+        self.inFlight = {}
+        self.inFlightAsync = {}
+        self.lock = threading.Lock()
+        self.calls = self.shared = self.cacheHits = 0
+
+        atexit.register(self.log_summary)
+
+    def cached(self, key):
+
+        # Called with the lock held, returns (True, result) on a hit
+        entry = self.cache.get(key)
+        if entry is None:
+            return False, None
+
+        storedAt, result = entry
+        if time.monotonic() - storedAt > self.cacheSeconds:
+            del self.cache[key]
+            return False, None
+
+        self.cache.move_to_end(key)
+        self.cacheHits = self.cacheHits + 1
+        return True, result
+
+    def store(self, key, result):
+
+        # Called with the lock held
+        if self.cacheSize <= 0 or result is None or result == "":
+            return
+
+        self.cache[key] = (time.monotonic(), result)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+
+    def call(self, key, func, *args):
+
+        # Returns func(*args), shared with every other call for the same key that is in flight or recently completed
+        with self.lock:
+            self.calls = self.calls + 1
+            hit, result = self.cached(key)
+            if hit:
+                return result
+
+            flight = self.inFlight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.inFlight[key] = Flight()
+            else:
+                self.shared = self.shared + 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inFlight[key]
+                if flight.error is None:
+                    self.store(key, flight.result)
+            flight.done.set()
+
+        return flight.result
+
+    async def call_async(self, key, func, *args):
+
+        # The same for coroutines of one event loop, func(*args) is awaited
+        with self.lock:
+            self.calls = self.calls + 1
+            hit, result = self.cached(key)
+            if hit:
+                return result
+
+            future = self.inFlightAsync.get(key)
+            if future is not None:
+                self.shared = self.shared + 1
+
+        if future is not None:
+            # Shielded, so a waiter that is cancelled doesn't cancel the request the others are waiting for
+            return await asyncio.shield(future)
+
+        future = self.inFlightAsync[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func(*args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so an exception nobody else waited for isn't reported as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            with self.lock:
+                self.store(key, result)
+        finally:
+            del self.inFlightAsync[key]
+
+        return result
+
+    def clear(self):
+
+        with self.lock:
+            self.cache.clear()
+
+    def log_summary(self):
+
+        if self.shared or self.cacheHits:
+            logging.info(f"Coalesced {self.name}: {self.calls} calls, {self.shared} shared an in-flight request, {self.cacheHits} came from the cache")
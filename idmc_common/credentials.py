@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import base64
+import logging
+import threading
+from pathlib import Path
+from idmc_common import client
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Keeps the IDMC session and JWT of a script run alive. login() reuses the session and token cached on disk by an earlier run while the
+# token is still valid, otherwise it logs in and caches the new ones. The cache file is only readable by the current user and never holds
+# the password. During the run every request checks the token expiry (the exp claim of the JWT); once it is within refreshMargin seconds
+# one worker gets a new token from the session, or logs in again if the session has expired too, while the others keep using the current
+# token. Only when a token has actually expired do the other workers wait for the refresh to finish.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+cacheFile = ""
+refreshMargin = 300
+defaultTokenLifetime = 1800     # used when a token has no readable exp claim
+
+account = {}
+expires = 0
+refreshLock = threading.Lock()
+
+
+def configure(credentialCache, tokenRefreshMargin):
+
+    # credentialCache is the cache file path, "" turns caching off
+    global cacheFile, refreshMargin
+
+    cacheFile = str(Path(credentialCache).expanduser()) if credentialCache else ""
+    refreshMargin = tokenRefreshMargin
+
+
+def token_expiry(token):
+
+    # The signature isn't checked, the payload is only read to find out when the token expires
+    try:
+        payload = token.split(".")[1]
+        payload = payload + "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))['exp'])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return time.time() + defaultTokenLifetime
+
+
+def cache_key():
+    return account['loginUrl'] + "|" + account['username'] + ("|ma" if account['ma'] else "")
+
+
+def read_cache():
+
+    if not cacheFile or not os.path.isfile(cacheFile):
+        return {}
+
+    if os.stat(cacheFile).st_mode & 0o077:
+        logging.warning(f"Ignoring credential cache {cacheFile}, it can be read by other users (chmod 600 it)")
+        return {}
+
+    try:
+        with open(cacheFile) as credentialFile:
+            return json.load(credentialFile)
+    except ValueError:
+        return {}
+
+
+def write_cache():
+
+    if not cacheFile:
+        return
+
+    cache = read_cache()
+    cache[cache_key()] = {"loginInfo": account['loginInfo'], "token": client.token, "expires": expires}
+
+    # Written to a new file created with mode 600 and then renamed, so the file is never readable by others, not even briefly
+    os.makedirs(os.path.dirname(cacheFile) or ".", mode=0o700, exist_ok=True)
+    tempFile = cacheFile + ".tmp"
+    fileHandle = os.open(tempFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fileHandle, "w") as credentialFile:
+        json.dump(cache, credentialFile)
+    os.replace(tempFile, cacheFile)
+
+
+def set_session(loginInfo):
+
+    account['loginInfo'] = loginInfo
+
+    if account['ma']:
+        client.orgID = loginInfo['orgUuid']
+        client.sessionID = loginInfo['icSessionId']
+    else:
+        client.orgID = loginInfo['orgId']
+        client.sessionID = loginInfo['sessionId']
+
+
+def new_token(fullLogin):
+
+    # Gets a token from the current session, logging in again first if asked to or if the session has expired
+    global expires
+
+    if not fullLogin and client.generate_token(account['loginUrl'], exitOnError=False) is None:
+        logging.info("IDMC session has expired, logging in again")
+        fullLogin = True
+
+    if fullLogin:
+        if account['ma']:
+            set_session(client.idmc_login_ma(account['username'], account['password'], account['loginUrl']))
+        else:
+            set_session(client.idmc_login(account['username'], account['password'], account['loginUrl']))
+        client.generate_token(account['loginUrl'])
+
+    expires = token_expiry(client.token)
+    write_cache()
+
+
+def refresh_due(staleToken=None):
+
+    # Whether refresh_if_needed(staleToken) would get a new token, so the async engine only leaves the event loop when it has to
+    if staleToken is not None:
+        return staleToken == client.token
+
+    return expires - time.time() <= refreshMargin
+
+
+def refresh_if_needed(staleToken=None):
+
+    # staleToken is the token of a request that got a 401, it's replaced even if it hasn't reached its expiry time yet
+    remaining = expires - time.time()
+    if staleToken is None and remaining > refreshMargin:
+        return
+
+    # While the current token is still valid only one worker refreshes it and the rest carry on
+    if not refreshLock.acquire(blocking=staleToken is not None or remaining <= 0):
+        return
+
+    try:
+        if staleToken is None and expires - time.time() > refreshMargin:
+            return
+        if staleToken is not None and staleToken != client.token:
+            return
+
+        logging.info("Refreshing IDMC token")
+        new_token(fullLogin=False)
+    finally:
+        refreshLock.release()
+
+
+def login(username, password, loginUrl, ma=False):
+
+    # Returns the login response, cached or new. ma=True uses the platform (v2) login
+    global expires
+
+    account.update({"username": username, "password": password, "loginUrl": loginUrl, "ma": ma})
+    client.refreshHook = None
+
+    cached = read_cache().get(cache_key())
+    if cached and cached['expires'] - time.time() > refreshMargin:
+        logging.info("Reusing cached IDMC session and token")
+        set_session(cached['loginInfo'])
+        client.token = cached['token']
+        expires = cached['expires']
+    elif cached:
+        logging.info("Cached IDMC token has expired, getting a new one")
+        set_session(cached['loginInfo'])
+        new_token(fullLogin=False)
+    else:
+        new_token(fullLogin=True)
+
+    client.refreshHook = refresh_if_needed
+
+    return account['loginInfo']
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import zlib
+import atexit
+import sqlite3
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Disk cache of catalog reads that is revalidated instead of refetched, shared by every run of the scripts (SQLite, so runs and shards can
+# use it at the same time). Two kinds of entries are kept:
+#
+#   responses   a response body with the ETag / Last-Modified it came with, keyed by org, method, URL and request body. client.conditional()
+#               sends them back as If-None-Match / If-Modified-Since and reuses the stored body when the server answers 304 Not Modified.
+#               A response without either header is never stored, there would be no way to tell whether it is still current
+#   items       the attributes of single assets of a bulk details response with the asset's modified time, keyed by org, namespace and
+#               asset ID, so the next bulk call only fetches them again for the assets whose modified time has changed since. Whatever
+#               can change without the modified time changing, like lineage, is not stored (see cdgc_list_object_lineage.py)
+#
+# Entries not used for keepDays days are dropped when the cache is opened. The cache is best effort: when the file can't be read or written
+# (locked for too long, disk full) the request simply goes to the API.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+cacheFile = ""
+keepDays = 7
+
+connection = None
+lock = threading.Lock()
+counts = {"requests": 0, "notModified": 0, "stored": 0, "items": 0, "itemsReused": 0}
+
+schema = """
+create table if not exists responses (key text primary key, etag text, last_modified text, body blob, used real);
+create table if not exists items (namespace text, id text, version text, item blob, used real, primary key (namespace, id));
+"""
+
+
+def configure(httpCacheFile, httpCacheDays):
+
+    # httpCacheFile is the cache file path, "" turns the cache off
+    global cacheFile, keepDays, connection
+
+    cacheFile = str(Path(httpCacheFile).expanduser()) if httpCacheFile else ""
+    keepDays = httpCacheDays
+    connection = None
+
+    if cacheFile:
+        atexit.register(log_summary)
+
+
+def enabled():
+    return bool(cacheFile)
+
+
+def get_connection():
+
+    # Called with the lock held. The file is only readable by the current user, it holds catalog content
+    global connection, cacheFile
+
+    if connection is None:
+        try:
+            os.makedirs(os.path.dirname(cacheFile) or ".", mode=0o700, exist_ok=True)
+            os.close(os.open(cacheFile, os.O_WRONLY | os.O_CREAT, 0o600))
+            connection = sqlite3.connect(cacheFile, timeout=30, check_same_thread=False, isolation_level=None)
+            connection.execute("pragma journal_mode=wal")
+            connection.executescript(schema)
+
+            cutoff = time.time() - keepDays * 86400
+            connection.execute("delete from responses where used < ?", (cutoff,))
+            connection.execute("delete from items where used < ?", (cutoff,))
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"HTTP cache {cacheFile} can't be used, continuing without it : {e}")
+            cacheFile = ""
+            return None
+
+    return connection
+
+
+def execute(sql, parameters=()):
+
+    # Returns the rows, or [] when the cache isn't usable right now
+    with lock:
+        database = get_connection() if cacheFile else None
+        if database is None:
+            return []
+        try:
+            return database.execute(sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            logging.debug(f"HTTP cache {cacheFile} : {e}")
+            return []
+
+
+def response_key(orgID, method, url, data):
+
+    data = data.encode() if isinstance(data, str) else (data or b"")
+    return hashlib.sha256(b"\n".join([orgID.encode(), method.encode(), url.encode(), data])).hexdigest()
+
+
+def lookup(key):
+
+    # Returns (etag, last modified, body) of the stored response or None
+    rows = execute("select etag, last_modified, body from responses where key = ?", (key,))
+    if not rows:
+        return None
+
+    etag, lastModified, body = rows[0]
+    return etag, lastModified, zlib.decompress(body)
+
+
+def store(key, etag, lastModified, body):
+
+    execute("insert or replace into responses values (?, ?, ?, ?, ?)", (key, etag, lastModified, zlib.compress(body), time.time()))
+    with lock:
+        counts['stored'] = counts['stored'] + 1
+
+
+def touch(key):
+
+    # A 304 keeps the entry alive
+    execute("update responses set used = ? where key = ?", (time.time(), key))
+    with lock:
+        counts['notModified'] = counts['notModified'] + 1
+
+
+def count_request():
+    with lock:
+        counts['requests'] = counts['requests'] + 1
+
+
+def item_namespace(orgID, namespace):
+    return orgID + "\n" + namespace
+
+
+def get_items(orgID, namespace, itemIDs):
+
+    # Returns {item id: (version, item)} for the cached ones
+    namespace = item_namespace(orgID, namespace)
+    cached = {}
+    for start in range(0, len(itemIDs), 500):
+        chunk = itemIDs[start:start + 500]
+        rows = execute(f"select id, version, item from items where namespace = ? and id in ({','.join('?' * len(chunk))})", [namespace] + chunk)
+        for itemID, version, item in rows:
+            cached[itemID] = (version, json.loads(zlib.decompress(item)))
+
+    return cached
+
+
+def put_items(orgID, namespace, items):
+
+    # items are (item id, version, item), an item without a version is not stored
+    namespace = item_namespace(orgID, namespace)
+    now = time.time()
+    rows = [(namespace, itemID, str(version), zlib.compress(json.dumps(item).encode()), now) for itemID, version, item in items if version]
+    with lock:
+        database = get_connection() if cacheFile and rows else None
+        if database is None:
+            return
+        try:
+            database.executemany("insert or replace into items values (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            logging.debug(f"HTTP cache {cacheFile} : {e}")
+            return
+        counts['items'] = counts['items'] + len(rows)
+
+
+def reused_items(orgID, namespace, itemIDs):
+
+    namespace = item_namespace(orgID, namespace)
+    itemIDs = list(itemIDs)
+    for start in range(0, len(itemIDs), 500):
+        chunk = itemIDs[start:start + 500]
+        execute(f"update items set used = ? where namespace = ? and id in ({','.join('?' * len(chunk))})", [time.time(), namespace] + chunk)
+    with lock:
+        counts['itemsReused'] = counts['itemsReused'] + len(itemIDs)
+
+
+def log_summary():
+
+    if counts['requests']:
+        logging.info(f"HTTP cache: {counts['requests']} conditional requests, {counts['notModified']} not modified, {counts['stored']} responses stored")
+    if counts['items'] or counts['itemsReused']:
+        logging.info(f"HTTP cache: {counts['itemsReused']} assets unchanged and reused, {counts['items']} assets fetched and stored")
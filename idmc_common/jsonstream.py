@@ -0,0 +1,74 @@
+import json
+import logging
+
+try:
+    import ijson
+    try:
+        ijson = ijson.get_backend("yajl2_c")
+    except ImportError:
+        logging.debug("ijson C backend (yajl2_c) not available, using the default backend")
+except ImportError:
+    ijson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# JSON decoding for large API responses. items() decodes a streamed response incrementally with ijson (the yajl2_c backend when it is
+# built) and yields the elements found at an ijson prefix one at a time, e.g. "hits.hits.item" for the hits of a search. Only the element
+# being built is held in memory, not the raw body or the whole document. Without ijson the body is decoded in one go with loads() and the
+# same elements are yielded, so callers don't have to care which one is installed. loads() uses orjson when it is installed.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+
+def streaming_available():
+    return ijson is not None
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def walk(node, path):
+
+    # Yields what an ijson prefix (already split on ".") points to in an already decoded document
+    if not path:
+        yield node
+    elif path[0] == "item":
+        if isinstance(node, list):
+            for element in node:
+                yield from walk(element, path[1:])
+    elif isinstance(node, dict) and path[0] in node:
+        yield from walk(node[path[0]], path[1:])
+
+
+def split_prefix(prefix):
+    return prefix.split(".") if prefix else []
+
+
+def items(response, prefix):
+
+    # response must come from a request made with stream=True, it is closed once every item has been read
+    try:
+        if ijson is not None:
+            response.raw.decode_content = True
+            yield from ijson.items(response.raw, prefix, use_float=True)
+        else:
+            yield from walk(loads(response.content), split_prefix(prefix))
+    finally:
+        response.close()
+
+
+async def items_async(response, prefix):
+
+    # Same as items() for an aiohttp response
+    if ijson is not None:
+        async for item in ijson.items_async(response.content, prefix, use_float=True):
+            yield item
+    else:
+        for item in walk(loads(await response.read()), split_prefix(prefix)):
+            yield item
@@ -0,0 +1,249 @@
+import os
+import re
+import json
+import time
+import atexit
+import logging
+import threading
+from urllib.parse import urlsplit
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Per endpoint metrics of every API call made through the shared client and the async engine. Calls are grouped by method and endpoint
+# template (the URL path with asset IDs, catalog source names and job IDs replaced by a placeholder) and each group keeps a request count,
+# a latency histogram, the bytes sent and received and a count per status code (or exception name when no response came back). Received
+# bytes are counted on the wire by the shared client and after decoding by the async engine, which doesn't expose the raw count.
+#
+# configure() is called once by a script. When it exits a JSON summary and a Prometheus textfile (for the node_exporter textfile
+# collector) are written, and with an interval both files are rewritten and a one line summary per endpoint family is logged every
+# interval seconds while the script runs.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+latencyBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+endpointTemplates = [
+    (re.compile(r"^(/data360/search/v1/assets/)(?!details$)[^/]+$"), r"\1{assetId}"),
+    (re.compile(r"^(/ccgf-catalog-source-management/api/v1/datasources/)[^/]+$"), r"\1{catalogSource}"),
+    (re.compile(r"^(/ccgf-orchestration-management-api-server/api/v1/jobs/)[^/]+$"), r"\1{jobId}")
+]
+
+scriptName = ""
+jsonFile = promFile = ""
+endpoints = {}
+metricsLock = threading.Lock()
+started = time.time()
+snapshotStop = threading.Event()
+
+
+class EndpointMetrics:
+
+    def __init__(self, family, method, template):
+        self.family = family
+        self.method = method
+        self.template = template
+        self.requests = 0
+        self.statuses = {}
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.seconds = 0.0
+        self.minSeconds = None
+        self.maxSeconds = 0.0
+        self.buckets = [0] * (len(latencyBuckets) + 1)
+
+    def add(self, status, seconds, bytesSent, bytesReceived):
+        self.requests = self.requests + 1
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytesSent = self.bytesSent + bytesSent
+        self.bytesReceived = self.bytesReceived + bytesReceived
+        self.seconds = self.seconds + seconds
+        self.minSeconds = seconds if self.minSeconds is None else min(self.minSeconds, seconds)
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        self.buckets[bucket_index(seconds)] += 1
+
+    def quantile(self, fraction):
+
+        # Estimated from the histogram, linear within the bucket the quantile falls in (narrowed to the fastest and slowest request seen)
+        rank = fraction * self.requests
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = max(latencyBuckets[index - 1] if index else 0.0, self.minSeconds)
+                upper = min(latencyBuckets[index] if index < len(latencyBuckets) else self.maxSeconds, self.maxSeconds)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen = seen + count
+
+        return 0.0
+
+    def summary(self):
+        return {
+            "family": self.family,
+            "requests": self.requests,
+            "statuses": {str(status): count for status, count in self.statuses.items()},
+            "bytesSent": self.bytesSent,
+            "bytesReceived": self.bytesReceived,
+            "latency": {
+                "mean": self.seconds / self.requests if self.requests else 0.0,
+                "p50": self.quantile(0.5),
+                "p95": self.quantile(0.95),
+                "p99": self.quantile(0.99),
+                "min": self.minSeconds or 0.0,
+                "max": self.maxSeconds
+            },
+            "histogram": {str(bound): count for bound, count in zip(latencyBuckets + ["+Inf"], self.buckets)}
+        }
+
+
+def bucket_index(seconds):
+
+    for index, bound in enumerate(latencyBuckets):
+        if seconds <= bound:
+            return index
+
+    return len(latencyBuckets)
+
+
+def endpoint_template(url):
+
+    path = urlsplit(url).path
+    for pattern, template in endpointTemplates:
+        path = pattern.sub(template, path)
+
+    return path
+
+
+def record(family, method, url, status, seconds, bytesSent=0, bytesReceived=0):
+
+    # status is the HTTP status code, or the exception name when the request failed without a response
+    key = (method, endpoint_template(url))
+
+    with metricsLock:
+        endpoint = endpoints.get(key)
+        if endpoint is None:
+            endpoint = endpoints[key] = EndpointMetrics(family, method, key[1])
+        endpoint.add(status, seconds, bytesSent, bytesReceived)
+
+
+def totals(families=()):
+
+    # (requests, seconds spent in them) so far for the given endpoint families, or for all of them
+    with metricsLock:
+        selected = [endpoint for endpoint in endpoints.values() if not families or endpoint.family in families]
+        return sum(endpoint.requests for endpoint in selected), sum(endpoint.seconds for endpoint in selected)
+
+
+def configure(script, metricsJsonFile, metricsPromFile, interval=0):
+
+    # File names can use {script}. Empty names skip that file, interval is in seconds and 0 turns the periodic snapshots off
+    global scriptName, jsonFile, promFile
+
+    scriptName = script
+    jsonFile = metricsJsonFile.format(script=script) if metricsJsonFile else ""
+    promFile = metricsPromFile.format(script=script) if metricsPromFile else ""
+
+    atexit.register(write)
+
+    if interval:
+        threading.Thread(target=snapshot_loop, args=(float(interval),), daemon=True).start()
+
+
+def summary():
+
+    with metricsLock:
+        endpointSummaries = {f"{endpoint.method} {endpoint.template}": endpoint.summary() for endpoint in endpoints.values()}
+
+    return {
+        "script": scriptName,
+        "started": started,
+        "elapsed": time.time() - started,
+        "requests": sum(endpoint['requests'] for endpoint in endpointSummaries.values()),
+        "endpoints": endpointSummaries
+    }
+
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_labels(endpoint):
+    return f'script="{label_value(scriptName)}",family="{endpoint.family}",method="{endpoint.method}",endpoint="{label_value(endpoint.template)}"'
+
+
+def prometheus_text():
+
+    lines = []
+    with metricsLock:
+        endpointList = sorted(endpoints.values(), key=lambda endpoint: (endpoint.family, endpoint.template, endpoint.method))
+
+        lines.append("# HELP idmc_api_request_duration_seconds Latency of IDMC / CDGC API requests")
+        lines.append("# TYPE idmc_api_request_duration_seconds histogram")
+        for endpoint in endpointList:
+            labels = prometheus_labels(endpoint)
+            cumulative = 0
+            for bound, count in zip(latencyBuckets + ["+Inf"], endpoint.buckets):
+                cumulative = cumulative + count
+                lines.append(f'idmc_api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"idmc_api_request_duration_seconds_sum{{{labels}}} {endpoint.seconds}")
+            lines.append(f"idmc_api_request_duration_seconds_count{{{labels}}} {endpoint.requests}")
+
+        lines.append("# HELP idmc_api_requests_total IDMC / CDGC API requests by status code (or exception name)")
+        lines.append("# TYPE idmc_api_requests_total counter")
+        for endpoint in endpointList:
+            labels = prometheus_labels(endpoint)
+            for status, count in sorted(endpoint.statuses.items(), key=lambda item: str(item[0])):
+                lines.append(f'idmc_api_requests_total{{{labels},status="{label_value(status)}"}} {count}')
+
+        lines.append("# HELP idmc_api_bytes_total Bytes sent and received by IDMC / CDGC API requests")
+        lines.append("# TYPE idmc_api_bytes_total counter")
+        for endpoint in endpointList:
+            labels = prometheus_labels(endpoint)
+            lines.append(f'idmc_api_bytes_total{{{labels},direction="sent"}} {endpoint.bytesSent}')
+            lines.append(f'idmc_api_bytes_total{{{labels},direction="received"}} {endpoint.bytesReceived}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_file(fileName, content):
+
+    # Written to a temp file and renamed, so a collector never reads a half written file
+    tempFile = fileName + ".tmp"
+    with open(tempFile, "w") as metricsFile:
+        metricsFile.write(content)
+    os.replace(tempFile, fileName)
+
+
+def write():
+
+    if not endpoints:
+        return
+
+    try:
+        if jsonFile:
+            write_file(jsonFile, json.dumps(summary(), indent=2))
+        if promFile:
+            write_file(promFile, prometheus_text())
+    except OSError as e:
+        logging.warning(f"Unable to write API metrics : {e!r}")
+
+
+def log_snapshot():
+
+    families = {}
+    with metricsLock:
+        for endpoint in endpoints.values():
+            family = families.setdefault(endpoint.family, {"requests": 0, "errors": 0, "seconds": 0.0})
+            family['requests'] = family['requests'] + endpoint.requests
+            family['errors'] = family['errors'] + sum(count for status, count in endpoint.statuses.items() if not isinstance(status, int) or status >= 400)
+            family['seconds'] = family['seconds'] + endpoint.seconds
+
+    elapsed = time.time() - started
+    for family, totals in sorted(families.items()):
+        logging.info(f"Metrics {family}: {totals['requests']} requests ({totals['requests'] / elapsed:.1f}/s), {totals['errors']} errors, "
+                     f"mean latency {1000 * totals['seconds'] / totals['requests']:.0f} ms")
+
+
+def snapshot_loop(interval):
+
+    while not snapshotStop.wait(interval):
+        log_snapshot()
+        write()
@@ -0,0 +1,271 @@
+import os
+import re
+import sys
+import time
+import atexit
+import pstats
+import cProfile
+import logging
+import threading
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Profiling mode of the scripts, turned on with --profile. The run is split into phases, which are the top level tracing spans started by
+# the main thread (login, search, delete, purge, ...), and time outside any of them goes to the "main" phase. For every phase two files are
+# written when the script exits, named after profileFile in setup.py:
+#
+#   <name>.pstats     - profile statistics, open with "python -m pstats <file>" or snakeviz
+#   <name>.collapsed  - collapsed stacks ("frame;frame;frame count" per line) for flamegraph.pl, speedscope or inferno
+#
+# Two modes:
+#   cprofile - deterministic, every function call of the main thread and of the thread pool workers is timed by cProfile. Exact call counts
+#              but the run gets noticeably slower. A worker thread is counted in the phase that started it. From Python 3.12 only one
+#              profiler can be active per interpreter and it sees every thread, so a single profiler per phase is switched at the phase
+#              boundaries and worker threads are counted in the phase that is current while they run
+#   sample   - a background thread takes the stack of every thread every profileInterval seconds. Low overhead, good enough for long runs.
+#              Its pstats file is built from the samples, so call counts are sample counts and times are estimates
+#
+# The collapsed stacks always come from the sampler (it runs in both modes) and show wall clock time, so threads waiting on the API show up.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+modes = ("cprofile", "sample")
+threadProfiling = sys.version_info < (3, 12)    # a cProfile profiler per thread, before sys.monitoring made it one per interpreter
+
+enabled = False
+mode = ""
+scriptName = ""
+profileFile = ""
+sampleInterval = 0.005
+
+currentPhase = "main"
+phaseDepth = 0
+phaseLock = threading.Lock()
+
+profilers = {}
+threadProfilers = []
+samples = {}
+samplerThread = None
+samplerStop = threading.Event()
+
+
+class Phase:
+
+    # Wraps the tracing span of a phase, so the profile switches phase when the span is entered and left
+    def __init__(self, name, span):
+        self.name = name
+        self.span = span
+        self.previousPhase = "main"
+
+    def set_attribute(self, key, value):
+        self.span.set_attribute(key, value)
+
+    def set_status(self, statusCode):
+        self.span.set_status(statusCode)
+
+    def __enter__(self):
+        self.previousPhase = enter_phase(self.name)
+        return self.span.__enter__()
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            return self.span.__exit__(excType, excValue, traceback)
+        finally:
+            leave_phase(self.previousPhase)
+
+
+class SampledProfile:
+
+    # What pstats.Stats needs to load statistics that didn't come from cProfile
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def configure(script, profileMode, profileFileName, interval=0.005):
+
+    # profileMode is "cprofile", "sample" or "" (off). profileFileName can use {script} and {phase}
+    global enabled, mode, scriptName, profileFile, sampleInterval, samplerThread
+
+    if not profileMode:
+        return
+
+    enabled = True
+    mode = profileMode
+    scriptName = script
+    profileFile = profileFileName
+    sampleInterval = interval
+
+    samplerThread = threading.Thread(target=sample_loop, name="profiling-sampler", daemon=True)
+    samplerThread.start()
+
+    if mode == "cprofile":
+        # Threads started from here on profile themselves from their first call
+        if threadProfiling:
+            threading.setprofile(start_thread_profiler)
+        phase_profiler("main").enable()
+
+    atexit.register(write)
+
+    logging.info(f"Profiling enabled ({mode}), reports are written when the script exits")
+
+
+def phase(name, span):
+
+    # Called by tracing.span(). Only a span the main thread starts outside any other phase begins a new phase
+    if phaseDepth or threading.current_thread() is not threading.main_thread():
+        return span
+
+    return Phase(name, span)
+
+
+def phase_profiler(name):
+
+    profiler = profilers.get(name)
+    if profiler is None:
+        profiler = profilers[name] = cProfile.Profile()
+
+    return profiler
+
+
+def enter_phase(name):
+
+    global currentPhase, phaseDepth
+
+    with phaseLock:
+        previousPhase = currentPhase
+        if mode == "cprofile":
+            phase_profiler(previousPhase).disable()
+            phase_profiler(name).enable()
+        currentPhase = name
+        phaseDepth = phaseDepth + 1
+
+    return previousPhase
+
+
+def leave_phase(previousPhase):
+
+    global currentPhase, phaseDepth
+
+    with phaseLock:
+        if mode == "cprofile":
+            phase_profiler(currentPhase).disable()
+            phase_profiler(previousPhase).enable()
+        currentPhase = previousPhase
+        phaseDepth = phaseDepth - 1
+
+
+def start_thread_profiler(frame, event, arg):
+
+    # Installed with threading.setprofile, runs once in each new thread and replaces itself with a cProfile profiler of that thread
+    profiler = cProfile.Profile()
+    with phaseLock:
+        threadProfilers.append((currentPhase, profiler))
+    profiler.enable()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Sampler
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def frame_key(code):
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def frame_label(key):
+    return f"{key[2]} ({os.path.basename(key[0])}:{key[1]})".replace(";", ",")
+
+
+def take_sample(seconds):
+
+    # Only the stacks are counted here, the pstats entries are built from them when the reports are written
+    samplerId = threading.get_ident()
+    phaseSamples = samples.setdefault(currentPhase, {})
+
+    for threadId, frame in sys._current_frames().items():
+        if threadId == samplerId:
+            continue
+
+        stack = []
+        while frame is not None:
+            stack.append(frame_key(frame.f_code))
+            frame = frame.f_back
+        stack = tuple(reversed(stack))
+
+        count, stackSeconds = phaseSamples.get(stack, (0, 0.0))
+        phaseSamples[stack] = (count + 1, stackSeconds + seconds)
+
+
+def sampled_stats(phaseSamples):
+
+    # pstats entries are (primitive calls, calls, own time, cumulative time, callers), calls are counted in samples
+    stats = {}
+    for stack, (count, seconds) in phaseSamples.items():
+        seen = set()
+        for index, key in enumerate(stack):
+            if key in seen:
+                continue
+            seen.add(key)
+            leaf = index == len(stack) - 1
+            calls, totalCalls, ownTime, cumulativeTime, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+            if index:
+                callerCalls, callerTotal, callerOwn, callerCumulative = callers.get(stack[index - 1], (0, 0, 0.0, 0.0))
+                callers[stack[index - 1]] = (callerCalls + count, callerTotal + count, callerOwn + (seconds if leaf else 0.0), callerCumulative + seconds)
+            stats[key] = (calls + count, totalCalls + count, ownTime + (seconds if leaf else 0.0), cumulativeTime + seconds, callers)
+
+    return stats
+
+
+def sample_loop():
+
+    lastSample = time.perf_counter()
+    while not samplerStop.wait(sampleInterval):
+        now = time.perf_counter()
+        take_sample(now - lastSample)
+        lastSample = now
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Reports
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def report_name(phaseName):
+    return profileFile.format(script=scriptName, phase=re.sub(r"[^A-Za-z0-9_.-]+", "_", phaseName))
+
+
+def phase_stats(phaseName):
+
+    if mode == "cprofile":
+        phaseProfilers = [profilers[phaseName]] + [profiler for name, profiler in threadProfilers if name == phaseName]
+        for profiler in phaseProfilers:
+            profiler.snapshot_stats()
+        stats = pstats.Stats(SampledProfile(phaseProfilers[0].stats))
+        for profiler in phaseProfilers[1:]:
+            stats.add(SampledProfile(profiler.stats))
+        return stats
+
+    return pstats.Stats(SampledProfile(sampled_stats(samples.get(phaseName, {}))))
+
+
+def write():
+
+    if not enabled:
+        return
+
+    samplerStop.set()
+    samplerThread.join()
+    if mode == "cprofile":
+        if threadProfiling:
+            threading.setprofile(None)
+        phase_profiler(currentPhase).disable()
+
+    for phaseName in sorted(set(profilers) | set(samples)):
+        baseName = report_name(phaseName)
+        try:
+            phase_stats(phaseName).dump_stats(baseName + ".pstats")
+            with open(baseName + ".collapsed", "w") as collapsedFile:
+                for stack, (count, seconds) in sorted(samples.get(phaseName, {}).items()):
+                    collapsedFile.write(";".join(frame_label(key) for key in stack) + f" {count}\n")
+            logging.info(f"Profile of phase {phaseName} written to {baseName}.pstats and {baseName}.collapsed")
+        except OSError as e:
+            logging.warning(f"Unable to write the profile of phase {phaseName} : {e!r}")
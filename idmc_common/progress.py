@@ -0,0 +1,200 @@
+import sys
+import time
+import shutil
+import logging
+import threading
+from collections import deque
+from idmc_common import metrics
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Progress of a long running loop: items done out of the total (total_hits of a search, the size of a plan, or a total that grows as the
+# work is discovered), the current rate over the last rateWindow seconds, the moving average latency of the API calls made for it (taken
+# from metrics, so nothing is timed in the loop) and the ETA at the current rate. The loop only calls advance(), which adds to a counter;
+# everything else is done by a background thread:
+#
+#   live    one status line at the bottom of the terminal, redrawn every liveSeconds. Log lines are written above it
+#   log     a progress log line every reportSeconds, what ends up in log files, cron mails and the multi org output.log
+#   auto    live when stderr is a terminal, log otherwise
+#   off     nothing until the final line of finish()
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+AUTO = "auto"
+LIVE = "live"
+LOG = "log"
+OFF = "off"
+modes = (AUTO, LIVE, LOG, OFF)
+
+display = AUTO
+reportSeconds = 10
+liveSeconds = 0.5
+rateWindow = 30             # seconds the current rate is measured over
+latencySmoothing = 0.3      # weight of the latest interval in the moving average latency
+
+clearLine = "\r\x1b[2K"
+
+
+def configure(progressDisplay, progressReportSeconds):
+
+    global display, reportSeconds
+
+    display = progressDisplay if progressDisplay in modes else AUTO
+    reportSeconds = progressReportSeconds
+
+
+def format_seconds(seconds):
+
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def terminal_handler():
+
+    # The log handler writing to a terminal, the live line is drawn on the same stream under its lock
+    for handler in logging.getLogger().handlers:
+        stream = getattr(handler, 'stream', None)
+        if isinstance(handler, logging.StreamHandler) and stream is not None and hasattr(stream, 'isatty') and stream.isatty():
+            return handler
+
+    return None
+
+
+class LiveFormatter(logging.Formatter):
+
+    # Wraps the formatter of the terminal handler so a log line first clears the live line, which is redrawn at the next tick
+    def __init__(self, formatter, progress):
+        super().__init__()
+        self.formatter = formatter or logging.Formatter()
+        self.progress = progress
+
+    def format(self, record):
+
+        text = self.formatter.format(record)
+        if self.progress.shown:
+            self.progress.shown = False
+            return clearLine + text
+
+        return text
+
+
+class Progress:
+
+    def __init__(self, label, total=0, unit="assets", families=(), detail=None):
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.families = families
+        self.detail = detail            # returns an extra line of counts, read at each report
+        self.done = 0
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.samples = deque([(self.started, 0)])
+        self.lastRequests, self.lastSeconds = metrics.totals(families)
+        self.latency = None
+        self.shown = False
+        self.stop = threading.Event()
+        self.thread = None
+
+        self.handler = terminal_handler() if display in (AUTO, LIVE) else None
+        self.mode = LIVE if self.handler is not None else OFF if display == OFF else LOG
+        if self.mode == LIVE:
+            self.formatter = self.handler.formatter
+            self.handler.setFormatter(LiveFormatter(self.formatter, self))
+
+        if self.mode != OFF:
+            self.thread = threading.Thread(target=self.run, name="progress", daemon=True)
+            self.thread.start()
+
+    def advance(self, count=1):
+        with self.lock:
+            self.done = self.done + count
+
+    def add_total(self, count):
+        with self.lock:
+            self.total = self.total + count
+
+    def run(self):
+
+        interval = liveSeconds if self.mode == LIVE else reportSeconds
+        while not self.stop.wait(interval):
+            self.report()
+
+    def update(self):
+
+        # Returns (done, total, rate, latency), called by the reporting thread only
+        now = time.monotonic()
+        with self.lock:
+            done, total = self.done, self.total
+
+        self.samples.append((now, done))
+        while len(self.samples) > 2 and now - self.samples[1][0] >= rateWindow:
+            self.samples.popleft()
+        sampledAt, sampledDone = self.samples[0]
+        rate = (done - sampledDone) / max(now - sampledAt, 0.001)
+
+        requests, seconds = metrics.totals(self.families)
+        if requests > self.lastRequests:
+            latency = (seconds - self.lastSeconds) / (requests - self.lastRequests)
+            self.latency = latency if self.latency is None else latencySmoothing * latency + (1 - latencySmoothing) * self.latency
+        self.lastRequests, self.lastSeconds = requests, seconds
+
+        return done, total, rate, self.latency
+
+    def line(self):
+
+        done, total, rate, latency = self.update()
+
+        text = f"{self.label} : {done}/{total} {self.unit}" if total else f"{self.label} : {done} {self.unit}"
+        if total:
+            text = text + f" ({min(done, total) * 100 // total}%)"
+        text = text + f" - {rate:.1f}/s"
+        if latency is not None:
+            text = text + f" - latency {latency * 1000:.0f} ms"
+        if total and done < total:
+            text = text + (f" - ETA {format_seconds((total - done) / rate)}" if rate > 0 else " - ETA ?")
+
+        return text
+
+    def report(self):
+
+        if self.mode == LOG:
+            logging.info(self.line())
+            if self.detail is not None:
+                logging.info("    - " + self.detail())
+            return
+
+        text = self.line()
+        if self.detail is not None:
+            text = text + " - " + self.detail()
+        width = shutil.get_terminal_size().columns
+
+        self.handler.acquire()
+        try:
+            self.handler.stream.write(clearLine + text[:width - 1])
+            self.handler.flush()
+            self.shown = True
+        finally:
+            self.handler.release()
+
+    def finish(self):
+
+        # Stops the display and logs the final counts, the rate is the average of the whole run
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        if self.mode == LIVE:
+            self.handler.acquire()
+            try:
+                if self.shown:
+                    self.handler.stream.write(clearLine)
+                    self.shown = False
+                self.handler.setFormatter(self.formatter)
+            finally:
+                self.handler.release()
+
+        elapsed = max(time.monotonic() - self.started, 0.001)
+        logging.info(f"{self.label} : {self.done} {self.unit} in {format_seconds(elapsed)} ({self.done / elapsed:.1f}/s)")
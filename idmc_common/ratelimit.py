@@ -0,0 +1,78 @@
+import time
+import asyncio
+import threading
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Process wide token bucket rate limiter, one bucket per API endpoint family. Every request helper calls acquire(<family>) before it sends
+# a request. A caller reserves the next free slot in its bucket and sleeps until that slot comes up, so concurrent threads and coroutines
+# are spaced out evenly at the configured rate instead of bursting and then being throttled by the server.
+#
+# Families:
+#   identity        - login, token and user / group lookups
+#   search          - data360 search and asset details, ccgf-searchv2
+#   publish         - ccgf-contentv2 publish (deletes)
+#   catalog_source  - catalog source management and orchestration job status
+#   notification    - notification-service
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+families = ["identity", "search", "publish", "catalog_source", "notification"]
+buckets = {}
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+
+        # Takes a token and returns how many seconds the caller has to wait for it. Tokens can go negative, which is what queues callers
+        # behind each other one interval apart
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens = self.tokens - 1
+
+            if self.tokens >= 0:
+                return 0
+
+            return -self.tokens / self.rate
+
+
+def configure(rateLimits, burst=1):
+
+    # rateLimits is a dict of family -> requests per second, 0 or a missing family means no limit
+    buckets.clear()
+
+    for family, rate in rateLimits.items():
+        if family not in families:
+            logging.warning(f"Unknown rate limit family {family}, ignoring it")
+        elif rate:
+            buckets[family] = TokenBucket(rate, burst)
+            logging.debug(f"Rate limit for {family} : {rate} requests/s")
+
+
+def acquire(family):
+
+    bucket = buckets.get(family)
+    if bucket is not None:
+        wait = bucket.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+async def acquire_async(family):
+
+    bucket = buckets.get(family)
+    if bucket is not None:
+        wait = bucket.reserve()
+        if wait:
+            await asyncio.sleep(wait)
@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import runpy
+import importlib
+from pathlib import Path
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Runs one of the scripts with some of its setup.py settings replaced, without editing setup.py:
+#
+#   IDMC_SETTINGS='{"username": "...", "login_url": "..."}' python -m idmc_common.runscript cdgc_lineage/cdgc_export_lineage.py -a <id>
+#
+# The script's setup module is imported first and the settings are set on it, then the script runs as __main__ with the remaining
+# arguments. Its "from setup import *" picks up the changed module, so the script behaves exactly as if setup.py held those values. The
+# settings come from the environment rather than the command line so passwords don't show up in the process list. Used by the multi org
+# runner to point the same script at a different org in each process, and by the idmc command (cli.py) to run the selected script.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+settingsVariable = "IDMC_SETTINGS"
+
+
+def run(scriptPath, argv, settings):
+
+    scriptPath = Path(scriptPath).resolve()
+    sys.path.insert(0, str(scriptPath.parent))
+
+    # Settings the script's setup.py doesn't have are set too and simply not used, so one set of settings can serve every script
+    setup = importlib.import_module("setup")
+    for name, value in settings.items():
+        setattr(setup, name, value)
+
+    sys.argv = [str(scriptPath)] + argv
+    runpy.run_path(str(scriptPath), run_name="__main__")
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) < 2:
+        print(f"usage: {settingsVariable}='<json settings>' python -m idmc_common.runscript <script> [arguments]", file=sys.stderr)
+        sys.exit(2)
+
+    run(sys.argv[1], sys.argv[2:], json.loads(os.environ.get(settingsVariable) or "{}"))
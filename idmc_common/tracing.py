@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+import contextvars
+from idmc_common import metrics, profiling
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Hierarchical timing spans for the phases of a script run (login, search pages, bulk fetches, lineage levels, deletes, job polling) with
+# a child span for every API call made through the shared client and the async engine. configure() starts a root span for the script and,
+# when the script exits, all finished spans are written to an OTLP JSON file (the JSON form of an OTLP ExportTraceServiceRequest) that can
+# be loaded into Jaeger, Grafana Tempo or any OTLP compatible trace viewer.
+#
+# The current span is kept in a context variable, so coroutines started under a span are its children. Thread pool workers don't inherit
+# it, functions handed to a pool are wrapped with task() so their spans hang under the phase that started the pool.
+#
+# With no trace file configured span() returns one shared no-op span and task() returns the function unchanged, so the instrumentation
+# costs a function call and a flag check. The top level spans of the main thread mark the phases profiling.py reports on, which works
+# with tracing off as well.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+INTERNAL = 1
+CLIENT = 3
+
+enabled = False
+traceFile = ""
+serviceName = ""
+maxSpans = 200000
+
+traceId = ""
+rootSpan = None
+spans = []
+droppedSpans = 0
+spansLock = threading.Lock()
+currentSpan = contextvars.ContextVar("currentSpan", default=None)
+
+
+class Span:
+
+    def __init__(self, name, kind, attributes, parent):
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.spanId = os.urandom(8).hex()
+        self.parentId = parent.spanId if parent is not None else ""
+        self.start = time.time_ns()
+        self.end = 0
+        self.error = ""
+        self.contextToken = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_status(self, statusCode):
+
+        # HTTP status of a client span, 4xx and 5xx mark the span as failed
+        self.attributes['http.response.status_code'] = statusCode
+        if statusCode >= 400:
+            self.error = f"HTTP {statusCode}"
+
+    def __enter__(self):
+        self.contextToken = currentSpan.set(self)
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excValue is not None:
+            self.error = repr(excValue)
+        currentSpan.reset(self.contextToken)
+        self.finish()
+        return False
+
+    def finish(self):
+
+        global droppedSpans
+
+        self.end = time.time_ns()
+        with spansLock:
+            if len(spans) < maxSpans:
+                spans.append(self)
+            else:
+                droppedSpans = droppedSpans + 1
+
+    def otlp(self):
+
+        span = {
+            "traceId": traceId,
+            "spanId": self.spanId,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": [otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1}
+        }
+        if self.parentId:
+            span['parentSpanId'] = self.parentId
+
+        return span
+
+
+class NoopSpan:
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_status(self, statusCode):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+noopSpan = NoopSpan()
+
+
+def otlp_attribute(key, value):
+
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def configure(script, traceFileName):
+
+    # traceFileName can use {script}, "" turns tracing off. Starts the root span of the run, which ends when the trace is written at exit
+    global enabled, traceFile, serviceName, traceId, rootSpan
+
+    if not traceFileName:
+        return
+
+    enabled = True
+    serviceName = script
+    traceFile = traceFileName.format(script=script)
+    traceId = os.urandom(16).hex()
+
+    rootSpan = Span(script, INTERNAL, {"process.pid": os.getpid()}, None)
+    currentSpan.set(rootSpan)
+
+    atexit.register(write)
+
+
+def span(name, attributes=None, kind=INTERNAL):
+
+    # Use as "with tracing.span(...) as phase:", the new span is a child of the current one. The top level spans of the main thread are
+    # also the phases of a profile
+    newSpan = Span(name, kind, attributes, currentSpan.get()) if enabled else noopSpan
+    if profiling.enabled:
+        return profiling.phase(name, newSpan)
+
+    return newSpan
+
+
+def http_span(family, method, url):
+
+    # Client span of one API call, named after the endpoint template the metrics use
+    if not enabled:
+        return noopSpan
+
+    attributes = {"http.request.method": method, "url.full": url, "idmc.family": family}
+    return Span(method + " " + metrics.endpoint_template(url), CLIENT, attributes, currentSpan.get())
+
+
+def task(func, name=None):
+
+    # Wraps a function handed to a thread pool so it runs under the span that is current now, in a span of its own when a name is given
+    if not enabled:
+        return func
+
+    parent = currentSpan.get()
+
+    def run_task(*args):
+        contextToken = currentSpan.set(parent)
+        try:
+            if name is None:
+                return func(*args)
+            with span(name):
+                return func(*args)
+        finally:
+            currentSpan.reset(contextToken)
+
+    return run_task
+
+
+def write():
+
+    if not enabled:
+        return
+
+    # The root span is kept even when the span limit was reached
+    if rootSpan.end == 0:
+        rootSpan.end = time.time_ns()
+
+    with spansLock:
+        finishedSpans = [rootSpan.otlp()] + [finishedSpan.otlp() for finishedSpan in spans]
+
+    trace = {
+        "resourceSpans": [{
+            "resource": {"attributes": [otlp_attribute("service.name", serviceName)]},
+            "scopeSpans": [{"scope": {"name": "idmc_common.tracing"}, "spans": finishedSpans}]
+        }]
+    }
+
+    try:
+        with open(traceFile, "w") as traceOutput:
+            json.dump(trace, traceOutput)
+        logging.info(f"Trace with {len(finishedSpans)} spans written to {traceFile}")
+        if droppedSpans:
+            logging.warning(f"{droppedSpans} spans were dropped, the trace holds at most {maxSpans}")
+    except OSError as e:
+        logging.warning(f"Unable to write trace {traceFile} : {e!r}")
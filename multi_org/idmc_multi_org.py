@@ -0,0 +1,222 @@
+import os
+import re
+import sys
+import json
+import time
+import getopt
+import subprocess
+from csv import writer
+from datetime import datetime
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from setup import *
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Runs any of the scripts in this repo against every org of an inventory file at the same time, e.g. a nightly reset of all the sandboxes:
+#
+#   idmc_multi_org.py -i orgs.json -t sandbox cdgc_purge_content/cdgc_delete_gov_assets.py -e async
+#
+# Each org runs in its own process (idmc_common/runscript.py) with the org's settings in place of the ones in the script's setup.py, so it
+# gets its own login, token, connection pool and rate limits, and orgConcurrency orgs run at once. The run takes as long as the slowest
+# org rather than the sum of all of them. The output of each org goes to <run directory>/<org>/output.log and the status, exit code, time
+# and last error of every org are written to <run directory>/results.csv. The runner exits with 1 if any org failed.
+#
+# The inventory is a JSON file (see orgs.example.json). "defaults" are settings for every org, each entry of "orgs" has a name, optional
+# tags and its own settings: any setup.py setting of the script (username, login_url, cdgc_api_url, rateLimits, ...). The password can be
+# read from an environment variable with "passwordEnv" instead of being kept in the file.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+loglevel = 1
+repoRoot = Path(__file__).resolve().parent.parent
+inventoryKeys = ("name", "tags", "passwordEnv")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)-5s - %(message)s'
+)
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Functions
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+
+def read_inventory(fileName):
+
+    # Returns [(org name, tags, settings)]
+    with open(fileName) as inventoryFile:
+        inventory = json.load(inventoryFile)
+
+    orgs = []
+    for org in inventory.get('orgs', []):
+        name = org.get('name', "")
+        if not re.fullmatch(r"[\w.-]+", name):
+            logging.error(f"Org name {name!r} in {fileName} is missing or not usable as a directory name")
+            exit(1)
+        if name in (orgName for orgName, tags, settings in orgs):
+            logging.error(f"Org {name} is in {fileName} more than once")
+            exit(1)
+
+        settings = dict(inventory.get('defaults', {}))
+        settings.update({key: value for key, value in org.items() if key not in inventoryKeys})
+        if org.get('passwordEnv'):
+            if org['passwordEnv'] not in os.environ:
+                logging.error(f"Org {name} reads its password from ${org['passwordEnv']}, which isn't set")
+                exit(1)
+            settings['password'] = os.environ[org['passwordEnv']]
+
+        orgs.append((name, org.get('tags', []), settings))
+
+    return orgs
+
+
+def find_script(script):
+
+    # A path, a path relative to the repo root, or just the name of a script in one of the repo's folders
+    for candidate in (Path(script), repoRoot / script):
+        if candidate.is_file():
+            return candidate.resolve()
+
+    name = script if script.endswith(".py") else script + ".py"
+    matches = sorted(repoRoot.glob("*/" + name))
+    if len(matches) == 1:
+        return matches[0]
+
+    logging.error(f"Script {script} not found" if not matches else f"Script {script} is ambiguous : {', '.join(str(match) for match in matches)}")
+    exit(1)
+
+
+def last_error(logFile):
+
+    # The last ERROR line the script logged, or its last line when it died without logging one (a traceback, an exit message)
+    try:
+        with open(logFile, errors="replace") as outputLog:
+            lines = [line.rstrip() for line in outputLog if line.strip()]
+    except OSError:
+        return ""
+
+    errors = [line for line in lines if " - ERROR " in line]
+
+    return (errors or lines or [""])[-1]
+
+
+def run_org(org, scriptPath, scriptArgs, runDir):
+
+    name, tags, settings = org
+    orgDir = runDir / name
+    orgDir.mkdir(parents=True, exist_ok=True)
+    logFile = orgDir / "output.log"
+
+    # {org} in the arguments is replaced by the org name, e.g. --plan {org}.plan.json
+    argv = [arg.replace("{org}", name) for arg in scriptArgs]
+    env = dict(os.environ, IDMC_SETTINGS=json.dumps(settings), PYTHONPATH=os.pathsep.join(filter(None, [str(repoRoot), os.environ.get("PYTHONPATH")])))
+
+    logging.info(f"{name} : started")
+    started = time.monotonic()
+    try:
+        with open(logFile, 'w') as outputLog:
+            process = subprocess.run([sys.executable, "-m", "idmc_common.runscript", str(scriptPath)] + argv, cwd=orgDir, env=env,
+                                     stdout=outputLog, stderr=subprocess.STDOUT, timeout=orgTimeout or None)
+        status, exitCode = ("OK" if process.returncode == 0 else "FAILED"), process.returncode
+    except subprocess.TimeoutExpired:
+        status, exitCode = "TIMEOUT", ""
+    seconds = time.monotonic() - started
+
+    error = "" if status == "OK" else last_error(logFile)
+    if status == "OK":
+        logging.info(f"{name} : finished in {seconds:.1f}s")
+    else:
+        logging.warning(f"{name} : {status} after {seconds:.1f}s {error}")
+
+    return [name, status, exitCode, round(seconds, 1), error, str(logFile)]
+
+
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------------------------------------------------------------------------------
+def main(argv):
+
+    inventoryFile = ""
+    orgNames = []
+    orgTags = []
+    concurrency = orgConcurrency
+
+    arg_help = f"""idmc_multi_org.py -i <inventory> -o <orgs> -t <tags> -j <count> <script> [script arguments]
+        -h              help
+        -i  <file>      Org inventory file (required)
+        -o  <names>     Only run on these comma separated orgs (optional)
+        -t  <tags>      Only run on orgs with one of these comma separated tags (optional)
+        -j  <count>     Orgs to run at the same time (optional, default {orgConcurrency})
+        <script>        Script to run, e.g. cdgc_purge_content/cdgc_delete_gov_assets.py, followed by its own arguments. {{org}} in
+                        the arguments is replaced by the org name
+    """
+
+    # getopt stops at the script, everything after it is passed to the script as is
+    try:
+        opts, args = getopt.getopt(argv[1:], "hi:o:t:j:", ["help", "inventory=", "orgs=", "tags=", "jobs="])
+    except getopt.GetoptError:
+        print(arg_help)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(arg_help)
+            sys.exit(2)
+        elif opt in ("-i", "--inventory"):
+            inventoryFile = arg
+        elif opt in ("-o", "--orgs"):
+            orgNames = [orgName.strip() for orgName in arg.split(",") if orgName.strip()]
+        elif opt in ("-t", "--tags"):
+            orgTags = [orgTag.strip() for orgTag in arg.split(",") if orgTag.strip()]
+        elif opt in ("-j", "--jobs"):
+            concurrency = int(arg)
+
+    if not inventoryFile or not args:
+        print(arg_help)
+        sys.exit(2)
+
+    scriptPath = find_script(args[0])
+    orgs = read_inventory(inventoryFile)
+
+    unknownOrgs = set(orgNames) - {name for name, tags, settings in orgs}
+    if unknownOrgs:
+        logging.error(f"Not in {inventoryFile} : {', '.join(sorted(unknownOrgs))}")
+        exit(1)
+
+    orgs = [org for org in orgs if (not orgNames or org[0] in orgNames) and (not orgTags or set(org[1]) & set(orgTags))]
+    if not orgs:
+        logging.error("No org in the inventory matches")
+        exit(1)
+
+    runDir = Path(runDirectory.format(time=datetime.now().strftime("%Y%m%d_%H%M%S"))).resolve()
+    runDir.mkdir(parents=True, exist_ok=True)
+
+    logging.info(f"Running {scriptPath.name} on {len(orgs)} orgs, {min(concurrency, len(orgs))} at a time")
+    logging.info(f"Output in {runDir}")
+
+    started = time.monotonic()
+    with ThreadPool(max(1, min(concurrency, len(orgs)))) as pool:
+        results = pool.map(lambda org: run_org(org, scriptPath, args[1:], runDir), orgs)
+    elapsed = time.monotonic() - started
+
+    with open(runDir / resultsFile, 'w', newline='') as resultsCSV:
+        csvWriter = writer(resultsCSV)
+        csvWriter.writerow(["Org", "Status", "Exit Code", "Seconds", "Error", "Log"])
+        csvWriter.writerows(results)
+
+    failed = [result for result in results if result[1] != "OK"]
+    logging.info(f"{len(results) - len(failed)} of {len(results)} orgs succeeded in {elapsed:.1f}s "
+                 f"({sum(result[3] for result in results):.1f}s one after the other)")
+    for result in failed:
+        logging.error(f"    - {result[0]} : {result[1]} {result[4]} (see {result[5]})")
+    logging.info(f"Results written to {runDir / resultsFile}")
+
+    if failed:
+        exit(1)
+
+    logging.info("Script Completed")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
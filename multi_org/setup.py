@@ -0,0 +1,12 @@
+# Number of orgs the runner works on at the same time, each in its own process with its own login, token and rate limits
+orgConcurrency = 8
+
+# A script that runs longer than this many seconds on one org is stopped and reported as TIMEOUT. 0 waits as long as it takes
+orgTimeout = 0
+
+# Every run gets its own directory with a sub directory per org, which is the working directory of the script on that org (its log,
+# CSV, journal and metrics files end up there). {time} is replaced by the start time of the run
+runDirectory = "multi_org_runs/{time}"
+
+# Consolidated results of a run (org, status, exit code, seconds, last error, log file), written in the run directory
+resultsFile = "results.csv"
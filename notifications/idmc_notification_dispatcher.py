@@ -0,0 +1,246 @@
+import sys
+import time
+import getopt
+import signal
+import threading
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, credentials, metrics, profiling, ratelimit, tracing
+from urllib.parse import urlparse
+import idmc_send_bell_notification as bell
+import notification_queue
+import logging
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview - Long running dispatcher of the notification queue. Scripts add notifications with idmc_send_bell_notification.py --queue
+# (a local SQLite insert) and this script logs in once, takes the due messages off the queue and sends them at dispatchRate requests per
+# second, packing up to notificationBatchSize messages into each request. Pending messages to the same recipients (with the same priority,
+# status and link) are sent as one digest message. Failed messages are retried with an exponential backoff and give up after
+# dispatchMaxAttempts. Stop it with Ctrl-C or SIGTERM, it finishes the messages it is sending first.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+loglevel = 1
+metricsInterval = 0
+profileMode = ""
+productID = "ccgf.apps.cdlg"
+staleClaimSeconds = 600         # messages a dispatcher claimed this long ago without finishing them are sent again
+reportSeconds = 300
+
+stopEvent = threading.Event()
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)-5s - %(message)s'
+)
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Functions
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def digest_key(notification):
+    return (tuple(sorted(notification['users'])), tuple(sorted(notification['groups'])), tuple(sorted(notification['roles'])),
+            bool(notification['sendAll']), notification['priority'], notification['status'], notification['url'], notification['linktext'])
+
+
+def digests(notifications):
+
+    # Returns (queue IDs, notification) pairs, messages to the same recipients merged into one whose description lists them all
+    groups = {}
+    for notification in notifications:
+        groups.setdefault(digest_key(notification), []).append(notification)
+
+    merged = []
+    for group in groups.values():
+        if len(group) == 1:
+            merged.append(([group[0]['id']], group[0]))
+            continue
+
+        notification = dict(group[0])
+        notification['title'] = f"{group[0]['title']} (and {len(group) - 1} more)"
+        notification['message'] = "\n".join(f"{item['title']}: {item['message']}" if item['message'] else item['title'] for item in group)
+        notification['expires'] = max(item['expires'] for item in group)
+        notification['attempts'] = max(item['attempts'] for item in group)
+        merged.append(([item['id'] for item in group], notification))
+
+    return merged
+
+
+def retry_delay(attempts):
+
+    # None once the message has used up its attempts
+    if attempts + 1 >= dispatchMaxAttempts:
+        return None
+
+    return min(dispatchRetryMaxSeconds, dispatchRetrySeconds * 2 ** attempts)
+
+
+def dispatch(queue, pool, serverHost, orgID):
+
+    # One pass over the due messages, returns the number of messages taken off the queue
+    notifications = queue.claim(notificationBatchSize * notificationThreads)
+    if not notifications:
+        return 0
+
+    with tracing.span("dispatch", {"idmc.messages": len(notifications)}):
+        merged = digests(notifications)
+
+        userIDs, groupIDs = bell.resolve_recipients([name for ids, notification in merged for name in notification['users']],
+                                                    [name for ids, notification in merged for name in notification['groups']])
+
+        pending = []
+        attempts = {}
+        for ids, notification in merged:
+            messageUserIDs = [userIDs[name] for name in notification['users'] if name in userIDs]
+            messageGroupIDs = [groupIDs[name] for name in notification['groups'] if name in groupIDs]
+            if not (messageUserIDs or messageGroupIDs or notification['roles'] or notification['sendAll']):
+                queue.mark_failed(ids, "user or group not found")
+                continue
+
+            msg = bell.bell_message(notification['title'], notification['expires'], orgID, productID, messageUserIDs, notification['roles'],
+                                    messageGroupIDs, notification['message'], notification['linktext'], notification['priority'],
+                                    notification['url'], notification['status'])
+            recipient = ", ".join(notification['users'] + notification['groups'] + notification['roles']) or "ALL"
+            pending.append((tuple(ids), recipient, msg))
+            attempts[tuple(ids)] = notification['attempts']
+
+        batches = [pending[i:i + notificationBatchSize] for i in range(0, len(pending), notificationBatchSize)]
+
+        sent = failed = 0
+        for batchResults in pool.imap_unordered(tracing.task(lambda batch: bell.send_batch(serverHost, batch), "send_batch"), batches):
+            for ids, recipient, status, detail in batchResults:
+                if status == "SENT":
+                    queue.mark_sent(ids, detail)
+                    sent = sent + len(ids)
+                else:
+                    queue.mark_failed(ids, detail, retry_delay(attempts[ids]))
+                    failed = failed + len(ids)
+                    logging.warning(f"Sending to {recipient} failed ({detail}), attempt {attempts[ids] + 1} of {dispatchMaxAttempts}")
+
+    logging.info(f"Dispatched {len(notifications)} queued messages in {len(batches)} requests : {sent} sent, {failed} failed")
+
+    return len(notifications)
+
+
+def recover(queue):
+
+    recovered = queue.recover(staleClaimSeconds)
+    if recovered:
+        logging.info(f"{recovered} messages left unfinished by an earlier dispatcher are pending again")
+
+
+def housekeeping(queue):
+
+    # Runs every reportSeconds, not only at startup: the claims of a dispatcher that died shortly before this one started only become
+    # stale later on
+    recover(queue)
+    queue.purge(queueKeepDays * 86400)
+    log_queue(queue)
+
+
+def log_queue(queue):
+    counts = queue.counts()
+    logging.info("Queue : " + ", ".join(f"{state} {counts.get(state, 0)}" for state in
+                                        (notification_queue.PENDING, notification_queue.SENDING, notification_queue.SENT, notification_queue.FAILED)))
+
+
+def stop(signalNumber, frame):
+    logging.info("Stopping after the current messages")
+    stopEvent.set()
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def main(argv):
+
+    global metricsInterval, profileMode
+
+    onceFlag = "N"
+    statusFlag = "N"
+
+    arg_help = f"""idmc_notification_dispatcher.py
+        -h              help
+        --once          Send everything that is due and exit instead of waiting for more
+        --status        Show how many messages are pending, sending, sent and failed and exit
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run (optional)
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase (optional)
+    """.format(argv[0])
+
+    try:
+        opts, args = getopt.getopt(argv[1:], "h", ["help", "once", "status", "metrics-interval=", "profile="])
+    except getopt.GetoptError:
+        print(arg_help)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(arg_help)
+            sys.exit(2)
+        elif opt == "--once":
+            onceFlag = "Y"
+        elif opt == "--status":
+            statusFlag = "Y"
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    queue = notification_queue.NotificationQueue(notificationQueue)
+    logging.info(f"Notification queue {queue.fileName}")
+    if statusFlag == "Y":
+        log_queue(queue)
+        return
+
+    recover(queue)
+
+    logging.info("Logging in")
+    ratelimit.configure(dict(rateLimits, notification=dispatchRate), rateLimitBurst)
+    client.configure(notificationThreads)
+    metrics.configure("idmc_notification_dispatcher", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("idmc_notification_dispatcher", traceFile)
+    profiling.configure("idmc_notification_dispatcher", profileMode, profileFile, profileInterval)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    with tracing.span("login"):
+        loginInfo = credentials.login(username, password, login_url, ma=True)
+
+    orgID = loginInfo['orgUuid']
+    serverHost = urlparse(loginInfo['serverUrl'])
+    serverHost = serverHost.scheme + "://" + serverHost.netloc
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    indexOpened = lastReport = 0
+    with ThreadPool(notificationThreads) as pool:
+        while not stopEvent.is_set():
+
+            # The user and group index is read again once it is older than the cache allows
+            if time.time() - indexOpened > recipientIndexSeconds:
+                bell.open_recipient_indexes(serverHost)
+                indexOpened = time.time()
+
+            if time.time() - lastReport > reportSeconds:
+                housekeeping(queue)
+                lastReport = time.time()
+
+            if dispatch(queue, pool, serverHost, orgID):
+                continue
+
+            if onceFlag == "Y":
+                break
+
+            nextDue = queue.next_due()
+            stopEvent.wait(dispatchPollSeconds if nextDue is None else min(dispatchPollSeconds, max(0.0, nextDue - time.time())))
+
+    log_queue(queue)
+    queue.close()
+    logging.info("Finished")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
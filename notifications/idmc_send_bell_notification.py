@@ -1,8 +1,14 @@
+import csv
 import json
-import requests
 import sys
 import getopt
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
 from setup import *
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from idmc_common import client, coalesce, credentials, metrics, profiling, ratelimit, tracing
+import recipient_index
+import notification_queue
 from datetime import datetime, timedelta
 from urllib.parse import urlparse
 import logging
@@ -13,7 +19,12 @@ import logging
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 
 loglevel = 1
+metricsInterval = 0
+profileMode = ""
 notifyType = ""
+userRequests = coalesce.Coalescer("get_user_id", coalesceCacheSize, coalesceCacheSeconds)
+groupRequests = coalesce.Coalescer("get_group_id", coalesceCacheSize, coalesceCacheSeconds)
+userIndex = groupIndex = None
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,38 +34,17 @@ logging.basicConfig(
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 # Functions
 # ---------------------------------------------------------------------------------------------------------------------------------------------
-def idmc_login(idmcUsername, idmcPassword, url):
+def get_user_id(url, userName):
 
-    url = url + "/ma/api/v2/user/login"
+    # Lookups of the same user share one API call while it is in flight and are cached for a while after
+    return userRequests.call((url, userName), fetch_user_id, url, userName)
 
-    raw_data = '{"username": "' + idmcUsername + '","password": "' + idmcPassword + '"}'
-    headers = {'Content-type': 'application/json'}
 
-    response = requests.post(url, data=raw_data, headers=headers)
-    loginInfo = response.text
-    loginInfo = json.loads(loginInfo)
+def fetch_user_id(url, userName):
 
-    return loginInfo
+    url = url + "/saas/public/core/v3/users?q=userName==" + userName
 
-
-def generate_token(sessionID, url):
-    url = url + "/identity-service/api/v1/jwt/Token?client_id=cdlg_app&nonce=1234"
-    headers = {'Content-type': 'application/json', 'cookie': 'USER_SESSION=' + sessionID, 'IDS-SESSION-ID': sessionID}
-
-    response = requests.post(url, headers=headers)
-    tokenJson = response.text
-    tokenJson = json.loads(tokenJson)
-
-    return tokenJson
-
-
-def get_user_id(sessionID, url, bearToken, userName):
-
-    url = "https://" + url + "/saas/public/core/v3/users?q=userName==" + userName
-
-    headers = {'Content-type': 'application/json', 'INFA-SESSION-ID': sessionID, 'Authorization': 'Bearer ' + bearToken}
-
-    response = requests.get(url, headers=headers)
+    response = client.get("identity", url, headers={'INFA-SESSION-ID': client.sessionID})
     response = response.text
     response = json.loads(response)
 
@@ -64,14 +54,16 @@ def get_user_id(sessionID, url, bearToken, userName):
         return ""
 
 
-def get_group_id(sessionID, url, bearToken, groupName ):
+def get_group_id(url, groupName):
+
+    return groupRequests.call((url, groupName), fetch_group_id, url, groupName)
 
-    url = "https://" + url + "/saas/public/core/v3/userGroups?q=userGroupName=='" + groupName + "'"
 
-    headers = {'Content-type': 'application/json', 'INFA-SESSION-ID': sessionID,
-               'Authorization': 'Bearer ' + bearToken}
+def fetch_group_id(url, groupName ):
 
-    response = requests.get(url, headers=headers)
+    url = url + "/saas/public/core/v3/userGroups?q=userGroupName=='" + groupName + "'"
+
+    response = client.get("identity", url, headers={'INFA-SESSION-ID': client.sessionID})
     response = response.text
     response = json.loads(response)
     if response:
@@ -80,9 +72,7 @@ def get_group_id(sessionID, url, bearToken, groupName ):
         return ""
 
 
-def idmc_msg_bell(serverHost, bearToken, sessionID, title, expires, orgID, productID, userID, roleName, userGroupID, message, linkTest, priority, urlLink, statusLevel):
-
-    url = "https://" + serverHost + "/notification-service/api/v1/Messages"
+def bell_message(title, expires, orgID, productID, userIDs, roleNames, userGroupIDs, message, linkTest, priority, urlLink, statusLevel):
 
     msg = {
         "content": title,
@@ -104,31 +94,238 @@ def idmc_msg_bell(serverHost, bearToken, sessionID, title, expires, orgID, produ
         }
     }
 
-    if userID:
-        msg["recipients"] = { "userIds": [ userID ] }
+    # Users, roles and groups can be combined, the message goes to all of them. With none of them it goes to every user
+    if userIDs:
+        msg["recipients"]["userIds"] = list(userIDs)
 
-    if roleName:
-        msg["recipients"] = {"roleNames": [ roleName ] }
+    if roleNames:
+        msg["recipients"]["roleNames"] = list(roleNames)
 
-    if userGroupID:
-        msg["recipients"] = { "userGroupIds": [ userGroupID ] }
+    if userGroupIDs:
+        msg["recipients"]["userGroupIds"] = list(userGroupIDs)
 
-    msg = "[" + json.dumps(msg) + "]"
+    return msg
 
-    headers = {'Content-type': 'application/json', 'xsrf_token': 'custom_msg',
-               'Cookie': 'XSRF_TOKEN=custom_msg; USER_SESSION=' + sessionID, 'Authorization': 'Bearer ' + bearToken}
 
-    response = requests.post(url, data=msg, headers=headers)
+def post_messages(serverHost, messages):
+
+    # The Messages API takes an array, so any number of messages can go out in one request
+    url = serverHost + "/notification-service/api/v1/Messages"
+
+    headers = {'xsrf_token': 'custom_msg', 'Cookie': 'XSRF_TOKEN=custom_msg; USER_SESSION=' + client.sessionID}
+
+    return client.post("notification", url, data=json.dumps(messages), headers=headers)
+
+
+def idmc_msg_bell(serverHost, title, expires, orgID, productID, userIDs, roleNames, userGroupIDs, message, linkTest, priority, urlLink, statusLevel):
+
+    msg = bell_message(title, expires, orgID, productID, userIDs, roleNames, userGroupIDs, message, linkTest, priority, urlLink, statusLevel)
+
+    response = post_messages(serverHost, [msg])
     response = response.text
     response = json.loads(response)
     return response
 
+
+def open_recipient_indexes(serverHost):
+
+    global userIndex, groupIndex
+
+    userIndex = recipient_index.RecipientIndex("users", serverHost + "/saas/public/core/v3/users", "userName",
+                                               lambda name: get_user_id(serverHost, name),
+                                               recipientIndexCache, recipientIndexSeconds, recipientLookupLimit)
+    groupIndex = recipient_index.RecipientIndex("groups", serverHost + "/saas/public/core/v3/userGroups", "userGroupName",
+                                                lambda name: get_group_id(serverHost, name),
+                                                recipientIndexCache, recipientIndexSeconds, recipientLookupLimit)
+
+
+def resolve_recipients(userNames, groupNames):
+
+    # Returns the user and group IDs by name, names that weren't found are logged and left out
+    userIDs = userIndex.resolve(userNames)
+    groupIDs = groupIndex.resolve(groupNames)
+
+    for kind, names, found in (("User", userNames, userIDs), ("Group", groupNames, groupIDs)):
+        missing = sorted(set(names) - set(found))
+        if missing:
+            logging.warning(f"{kind}(s) not found: {', '.join(missing)}")
+
+    return userIDs, groupIDs
+
+
+def expire_date(expireDays):
+
+    expires = datetime.today() + timedelta(days=int(expireDays))
+    return expires.strftime('%Y-%m-%d')
+
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Bulk delivery -- one notification per row of a CSV (with a header row) or JSONL file, columns / keys:
+#   title, message, username, group, role, all, url, linktext, priority, status, expire
+# Missing or empty fields fall back to the command line options. Recipients are resolved once per distinct name, the messages are packed
+# notificationBatchSize to a request and the requests are sent notificationThreads at a time. The outcome of every row is written to
+# the results file. A row that can't be sent as it is (a JSONL line that isn't a JSON object, an expire that isn't a number of days) is
+# reported there as INVALID and the other rows go out as usual.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+def read_notifications(fileName):
+
+    # A JSONL line that doesn't parse is returned as None, row_error() reports it
+    def parse_line(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    if fileName.lower().endswith((".jsonl", ".ndjson")):
+        with open(fileName) as notificationFile:
+            return [parse_line(line) for line in notificationFile if line.strip()]
+
+    with open(fileName, newline='') as notificationFile:
+        return list(csv.DictReader(notificationFile))
+
+
+def notification_field(row, defaults, field):
+
+    # Lists (recipients in JSONL) are returned as they are
+    value = row.get(field)
+    if value is None or value == "" or value == []:
+        return defaults.get(field, "")
+
+    return value if isinstance(value, list) else str(value)
+
+
+def row_error(row, defaults):
+
+    # Returns why the row can't be sent, "" when it's fine
+    if not isinstance(row, dict):
+        return "not a JSON object"
+
+    expire = notification_field(row, defaults, "expire")
+    try:
+        int(expire)
+    except (ValueError, TypeError):
+        return f"expire {expire!r} isn't a number of days"
+
+    return ""
+
+
+def row_recipient(recipients, sendAll):
+    return ", ".join(recipients['username'] + recipients['group'] + recipients['role']) or ("ALL" if sendAll else "")
+
+
+def write_results(fileName, results):
+
+    # results are (row number, recipient, status, message ID or error). Returns the count per status
+    resultsFile = notificationResultsFile.format(input=fileName)
+    with open(resultsFile, 'w', newline='') as resultsCSV:
+        csvWriter = csv.writer(resultsCSV)
+        csvWriter.writerow(["Row", "Recipient", "Status", "Message ID / Error"])
+        csvWriter.writerows(sorted(results))
+
+    counts = {}
+    for result in results:
+        counts[result[2]] = counts.get(result[2], 0) + 1
+    logging.info("Results : " + ", ".join(f"{status.lower()} {count}" for status, count in sorted(counts.items())) + f", written to {resultsFile}")
+
+    return counts
+
+
+def send_batch(serverHost, batch):
+
+    # batch is a list of (row number, recipient, message). Returns (row number, recipient, status, message ID or error) for every row
+    try:
+        response = post_messages(serverHost, [msg for rowNumber, recipient, msg in batch])
+    except Exception as e:
+        return [(rowNumber, recipient, "FAILED", repr(e)) for rowNumber, recipient, msg in batch]
+
+    if response.status_code >= 400:
+        return [(rowNumber, recipient, "FAILED", f"HTTP {response.status_code}") for rowNumber, recipient, msg in batch]
+
+    try:
+        messageIDs = [item.get('id', "") for item in json.loads(response.text)]
+    except (ValueError, AttributeError, TypeError):
+        messageIDs = []
+    if len(messageIDs) != len(batch):
+        messageIDs = [""] * len(batch)
+
+    return [(rowNumber, recipient, "SENT", messageID) for (rowNumber, recipient, msg), messageID in zip(batch, messageIDs)]
+
+
+def send_bulk(serverHost, orgID, productID, fileName, defaults):
+
+    rows = read_notifications(fileName)
+    logging.info(f"Read {len(rows)} notifications from {fileName}")
+    rowErrors = [row_error(row, defaults) for row in rows]
+
+    # Every name in the file is resolved in one go, see recipient_index
+    rowRecipients = [
+        {field: [] if error else recipient_index.split_names(notification_field(row, defaults, field)) for field in ("username", "group", "role")}
+        for row, error in zip(rows, rowErrors)
+    ]
+    with tracing.span("resolve recipients"):
+        userIDs, groupIDs = resolve_recipients([name for recipients in rowRecipients for name in recipients['username']],
+                                               [name for recipients in rowRecipients for name in recipients['group']])
+
+    results = []
+    with ThreadPool(notificationThreads) as pool:
+
+        pending = []
+        for rowNumber, (row, recipients, error) in enumerate(zip(rows, rowRecipients, rowErrors), 1):
+            if error:
+                logging.warning(f"Row {rowNumber} of {fileName} skipped : {error}")
+                results.append((rowNumber, "", "INVALID", error))
+                continue
+
+            sendAll = str(notification_field(row, defaults, "all")).upper() in ("Y", "YES", "TRUE", "1")
+            recipient = row_recipient(recipients, sendAll)
+
+            rowUserIDs = [userIDs[name] for name in recipients['username'] if name in userIDs]
+            rowGroupIDs = [groupIDs[name] for name in recipients['group'] if name in groupIDs]
+            if not (rowUserIDs or rowGroupIDs or recipients['role'] or sendAll):
+                results.append((rowNumber, recipient, "NO_RECIPIENT", "user or group not found" if recipient else "no recipient given"))
+                continue
+
+            msg = bell_message(notification_field(row, defaults, "title"), expire_date(notification_field(row, defaults, "expire")), orgID,
+                               productID, rowUserIDs, recipients['role'], rowGroupIDs, notification_field(row, defaults, "message"),
+                               notification_field(row, defaults, "linktext"), notification_field(row, defaults, "priority"),
+                               notification_field(row, defaults, "url"), notification_field(row, defaults, "status"))
+            pending.append((rowNumber, recipient, msg))
+
+        batches = [pending[i:i + notificationBatchSize] for i in range(0, len(pending), notificationBatchSize)]
+        logging.info(f"Sending {len(pending)} notifications in {len(batches)} requests")
+
+        with tracing.span("send", {"idmc.messages": len(pending)}):
+            for batchResults in pool.imap_unordered(tracing.task(lambda batch: send_batch(serverHost, batch), "send_batch"), batches):
+                results.extend(batchResults)
+
+    counts = write_results(fileName, results)
+
+    return counts.get("SENT", 0) == len(rows)
+
+
+def queued_notification(row, defaults):
+
+    # A row of a notifications file (or {} for the command line options) as a message for the notification queue
+    notification = {field: notification_field(row, defaults, field) for field in ("title", "message", "url", "linktext", "priority", "status")}
+    notification['users'] = recipient_index.split_names(notification_field(row, defaults, "username"))
+    notification['groups'] = recipient_index.split_names(notification_field(row, defaults, "group"))
+    notification['roles'] = recipient_index.split_names(notification_field(row, defaults, "role"))
+    notification['sendAll'] = str(notification_field(row, defaults, "all")).upper() in ("Y", "YES", "TRUE", "1")
+    notification['expires'] = expire_date(notification_field(row, defaults, "expire"))
+
+    return notification
+
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------------------------------------------------------------------------
 def main(argv):
 
-    title, message, linktext, url, userName, roleName, userGroupName, userID, userGroupID = "", "", "", "", "", "", "", "", "",
+    global metricsInterval, profileMode
+
+    title, message, linktext, url = "", "", "", ""
+    userNames, roleNames, userGroupNames = [], [], []
+    bulkFile = ""
+    queueFlag = "N"
     expireDays = 1
     productID = "ccgf.apps.cdlg"
     priority = "LOW"
@@ -148,12 +345,18 @@ def main(argv):
         -e <username>   The IDMC username of the user to receive the notification
         -r <role>       Send users with this role the notification 
         -g <group>      Send users that belong to this group the notification
+                        -e, -r and -g take comma separated lists, can be repeated and combined, one message goes to all of them
         -a              Send to all users
+        ---- or ----
+        -f <file>       Send every notification in a CSV or JSONL file, the options above are the defaults for missing fields
+        --queue         Add the notification(s) to the local queue instead of sending them, idmc_notification_dispatcher.py sends them
+        --metrics-interval <seconds>  Log and write the API metrics every so many seconds during the run (optional)
+        --profile <mode>              Profile the run with cprofile (deterministic) or sample (low overhead) and write reports per phase (optional)
         
     """.format(argv[0])
 
     try:
-        opts, args = getopt.getopt(argv[1:], "ht:m:x:u:l:p:s:e:ar:g:", ["title=","message=","expire=","linktext=","priority=","url=","status=", "username=", "all", "role=", "group="])
+        opts, args = getopt.getopt(argv[1:], "ht:m:x:u:l:p:s:e:ar:g:f:", ["title=","message=","expire=","linktext=","priority=","url=","status=", "username=", "all", "role=", "group=", "file=", "queue", "metrics-interval=", "profile="])
 
     except getopt.GetoptError as err:
         print(arg_help)
@@ -172,6 +375,10 @@ def main(argv):
         elif opt in ("-m", "--message"):
             message = arg
         elif opt in ("-x", "--expire"):
+            if row_error({"expire": arg}, {}):
+                print(f"-x must be a number of days, not {arg}")
+                print(arg_help)
+                sys.exit(2)
             expireDays = arg
         elif opt in ("-l", "--linktext"):
             linktext = arg
@@ -182,15 +389,26 @@ def main(argv):
         elif opt in ("-s", "--status"):
             statusLevel = arg
         elif opt in ("-e", "--username"):
-            userName = arg
-        elif opt in ("-r", "--rolename"):
-            roleName = arg
+            userNames.extend(recipient_index.split_names(arg))
+        elif opt in ("-r", "--role"):
+            roleNames.extend(recipient_index.split_names(arg))
         elif opt in ("-g", "--group"):
-            userGroupName = arg
+            userGroupNames.extend(recipient_index.split_names(arg))
         elif opt in ("-a", "--all"):
             sendAll = "Y"
-
-    if sendAll == "N" and not userName and not roleName and not userGroupName:
+        elif opt in ("-f", "--file"):
+            bulkFile = arg
+        elif opt == "--queue":
+            queueFlag = "Y"
+        elif opt == "--metrics-interval":
+            metricsInterval = float(arg)
+        elif opt == "--profile":
+            if arg not in profiling.modes:
+                print(arg_help)
+                sys.exit(2)
+            profileMode = arg
+
+    if sendAll == "N" and not userNames and not roleNames and not userGroupNames and not bulkFile:
         print("You must include one type of user to send notification too!")
         print(arg_help)
         sys.exit(2)
@@ -204,46 +422,88 @@ def main(argv):
     logging.info("    - link: " + url)
     logging.info("    - link text: " + linktext)
     logging.info("    - expire in days: " + str(expireDays))
-    if userName:
-        logging.info("    - User to Notify: " + userName)
-    if userGroupName:
-        logging.info("    - Group to Notify: " + userGroupName)
-    if roleName:
-        logging.info("    - Role to Notify: " + roleName)
+    if userNames:
+        logging.info("    - Users to Notify: " + ", ".join(userNames))
+    if userGroupNames:
+        logging.info("    - Groups to Notify: " + ", ".join(userGroupNames))
+    if roleNames:
+        logging.info("    - Roles to Notify: " + ", ".join(roleNames))
 
     if sendAll == "Y":
         logging.info("    - User to Notify: ALL")
+    if bulkFile:
+        logging.info("    - Notifications file: " + bulkFile)
+
+    defaults = {"title": title, "message": message, "username": userNames, "group": userGroupNames, "role": roleNames, "all": sendAll,
+                "url": url, "linktext": linktext, "priority": priority, "status": statusLevel, "expire": expireDays}
+
+    # Queued messages are sent by the dispatcher, nothing here needs a login
+    if queueFlag == "Y":
+        queue = notification_queue.NotificationQueue(notificationQueue)
+        rows = read_notifications(bulkFile) if bulkFile else [{}]
+
+        results = []
+        notifications = []
+        for rowNumber, row in enumerate(rows, 1):
+            error = row_error(row, defaults)
+            if error:
+                logging.warning(f"Row {rowNumber} of {bulkFile} skipped : {error}")
+                results.append((rowNumber, "", "INVALID", error))
+                continue
+            notification = queued_notification(row, defaults)
+            notifications.append(notification)
+            recipients = {"username": notification['users'], "group": notification['groups'], "role": notification['roles']}
+            results.append((rowNumber, row_recipient(recipients, notification['sendAll']), "QUEUED", ""))
+
+        queued = queue.enqueue_many(notifications)
+        queue.close()
+        logging.info(f"Queued {queued} of {len(notifications)} notifications in {queue.fileName}" + (", the rest are already pending" if queued < len(notifications) else ""))
+
+        if bulkFile:
+            write_results(bulkFile, results)
+        if len(notifications) < len(rows):
+            sys.exit(1)
+        return
 
     # Login and set variables
     logging.info("Logging in")
-    loginInfo = idmc_login(username, password, login_url)
+    ratelimit.configure(rateLimits, rateLimitBurst)
+    client.configure(notificationThreads)
+    metrics.configure("idmc_send_bell_notification", metricsJsonFile, metricsPromFile, metricsInterval)
+    tracing.configure("idmc_send_bell_notification", traceFile)
+    profiling.configure("idmc_send_bell_notification", profileMode, profileFile, profileInterval)
+    credentials.configure(credentialCache, tokenRefreshMargin)
+    with tracing.span("login"):
+        loginInfo = credentials.login(username, password, login_url, ma=True)
 
     orgID = loginInfo['orgUuid']
-    serverHost = loginInfo['serverUrl']
-    serverHost = urlparse(serverHost).hostname
-    sessionID = loginInfo['icSessionId']
+    # Scheme and host of the pod the org lives on, the user, group and notification APIs are called there
+    serverHost = urlparse(loginInfo['serverUrl'])
+    serverHost = serverHost.scheme + "://" + serverHost.netloc
 
     logging.info("    -  Org ID = " + orgID)
     logging.info("    -  IDMC Host = " + serverHost)
 
-    logging.info("Getting Token")
-    tokenJson = generate_token(sessionID, login_url)
-    bearToken = tokenJson['jwt_token']
+    open_recipient_indexes(serverHost)
 
-    if userName:
-        userID = get_user_id(sessionID, serverHost, bearToken, userName)
+    if bulkFile:
+        allSent = send_bulk(serverHost, orgID, productID, bulkFile, defaults)
+        logging.info("Finished")
+        if not allSent:
+            sys.exit(1)
+        return
 
-    if userGroupName:
-        userGroupID = get_group_id(sessionID, serverHost, bearToken, userGroupName)
+    with tracing.span("resolve recipients"):
+        userIDs, userGroupIDs = resolve_recipients(userNames, userGroupNames)
 
     logging.info("Sending Notification")
 
-    today = datetime.today()
-    today = today + timedelta(days=int(expireDays))
-    expires = today.strftime('%Y-%m-%d')
+    expires = expire_date(expireDays)
 
-    if userID or sendAll == "Y" or roleName or userGroupID:
-        idmc_msg_bell(serverHost, bearToken, sessionID, title, expires, orgID, productID, userID, roleName, userGroupID, message, linktext, priority, url, statusLevel)
+    if userIDs or sendAll == "Y" or roleNames or userGroupIDs:
+        with tracing.span("send"):
+            idmc_msg_bell(serverHost, title, expires, orgID, productID, list(userIDs.values()), roleNames, list(userGroupIDs.values()), message,
+                          linktext, priority, url, statusLevel)
 
     logging.info("Finished")
 
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from pathlib import Path
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# SQLite backed queue of bell notifications. idmc_send_bell_notification.py --queue adds to it (a local insert, no login or API call) and
+# idmc_notification_dispatcher.py takes the due messages off it and sends them. A message is pending until it is sent, or failed once it
+# has used up its attempts. Identical pending messages (same text, link, priority, status and recipients) are only queued once.
+#
+# The database runs in WAL mode so scripts can keep adding messages while the dispatcher reads and updates them. claim() marks the messages
+# it returns as sending in one transaction, and messages left sending by a dispatcher that died are made pending again on the next start.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+fields = ("title", "message", "users", "groups", "roles", "sendAll", "url", "linktext", "priority", "status", "expires")
+
+schema = """
+create table if not exists messages (
+    id integer primary key,
+    created real not null,
+    dedupeKey text not null,
+    title text, message text, users text, groups text, roles text, sendAll integer, url text, linktext text, priority text, status text,
+    expires text,
+    state text not null default 'pending',
+    attempts integer not null default 0,
+    nextAttempt real not null,
+    claimed real,
+    finished real,
+    messageId text,
+    lastError text
+);
+create unique index if not exists messagesPendingKey on messages (dedupeKey) where state = 'pending';
+create index if not exists messagesDue on messages (state, nextAttempt);
+"""
+
+
+def dedupe_key(notification):
+
+    content = {field: notification.get(field) for field in fields if field != "expires"}
+    for field in ("users", "groups", "roles"):
+        content[field] = sorted(content[field] or [])
+
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+class NotificationQueue:
+
+    def __init__(self, fileName):
+
+        self.fileName = str(Path(fileName).expanduser())
+        os.makedirs(os.path.dirname(self.fileName) or ".", mode=0o700, exist_ok=True)
+
+        # Autocommit, transactions are started explicitly where more than one statement has to be atomic
+        self.db = sqlite3.connect(self.fileName, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("pragma journal_mode = wal")
+        self.db.execute("pragma synchronous = normal")
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    def enqueue(self, notification, notBefore=0):
+
+        # notification has the keys in fields, users / groups / roles are lists of names. Returns the new ID, or None when an identical
+        # message is already pending
+        values = [json.dumps(notification.get(field) or []) if field in ("users", "groups", "roles") else notification.get(field)
+                  for field in fields]
+        now = time.time()
+
+        cursor = self.db.execute(
+            f"insert or ignore into messages (created, dedupeKey, {', '.join(fields)}, nextAttempt) values (?, ?, {', '.join('?' * len(fields))}, ?)",
+            [now, dedupe_key(notification)] + values + [max(now, notBefore)])
+
+        return cursor.lastrowid if cursor.rowcount else None
+
+    def enqueue_many(self, notifications):
+
+        # One transaction for the lot. Returns the number of messages queued, duplicates aren't counted
+        self.db.execute("begin immediate")
+        try:
+            queued = sum(1 for notification in notifications if self.enqueue(notification) is not None)
+            self.db.execute("commit")
+        except BaseException:
+            self.db.execute("rollback")
+            raise
+
+        return queued
+
+    def recover(self, staleSeconds):
+
+        # Messages a dispatcher claimed but never finished go back to pending. If an identical one has been queued since, that one is sent
+        now = time.time()
+        cursor = self.db.execute("update or ignore messages set state = ? where state = ? and claimed < ?", (PENDING, SENDING, now - staleSeconds))
+        self.db.execute("update messages set state = ?, finished = ?, lastError = ? where state = ? and claimed < ?",
+                        (FAILED, now, "duplicate of a pending message", SENDING, now - staleSeconds))
+        return cursor.rowcount
+
+    def claim(self, limit):
+
+        # Returns up to limit due pending messages, oldest first, and marks them as sending
+        now = time.time()
+        self.db.execute("begin immediate")
+        try:
+            rows = self.db.execute("select * from messages where state = ? and nextAttempt <= ? order by nextAttempt, id limit ?",
+                                   (PENDING, now, limit)).fetchall()
+            self.db.executemany("update messages set state = ?, claimed = ? where id = ?", [(SENDING, now, row['id']) for row in rows])
+            self.db.execute("commit")
+        except BaseException:
+            self.db.execute("rollback")
+            raise
+
+        return [self.notification(row) for row in rows]
+
+    def notification(self, row):
+
+        notification = {field: row[field] for field in fields}
+        for field in ("users", "groups", "roles"):
+            notification[field] = json.loads(notification[field] or "[]")
+        notification['id'] = row['id']
+        notification['attempts'] = row['attempts']
+
+        return notification
+
+    def mark_sent(self, ids, messageID):
+        self.db.executemany("update messages set state = ?, finished = ?, messageId = ? where id = ?",
+                            [(SENT, time.time(), messageID, rowId) for rowId in ids])
+
+    def mark_failed(self, ids, error, retryDelay=None):
+
+        # With a retry delay the messages are pending again after it (unless an identical one is already pending, then that one is sent
+        # instead), without one they have failed for good
+        now = time.time()
+        if retryDelay is None:
+            self.db.executemany("update messages set state = ?, finished = ?, attempts = attempts + 1, lastError = ? where id = ?",
+                                [(FAILED, now, error, rowId) for rowId in ids])
+            return
+
+        for rowId in ids:
+            cursor = self.db.execute("update or ignore messages set state = ?, attempts = attempts + 1, nextAttempt = ?, lastError = ? where id = ?",
+                                     (PENDING, now + retryDelay, error, rowId))
+            if not cursor.rowcount:
+                self.db.execute("update messages set state = ?, finished = ?, lastError = ? where id = ?",
+                                (FAILED, now, "duplicate of a pending message", rowId))
+
+    def purge(self, keepSeconds):
+
+        # Sent and failed messages are kept keepSeconds for reference
+        cursor = self.db.execute("delete from messages where state in (?, ?) and finished < ?", (SENT, FAILED, time.time() - keepSeconds))
+        return cursor.rowcount
+
+    def counts(self):
+        return {row['state']: row['count'] for row in self.db.execute("select state, count(*) as count from messages group by state")}
+
+    def next_due(self):
+
+        row = self.db.execute("select min(nextAttempt) as due from messages where state = ?", (PENDING,)).fetchone()
+        return row['due']
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import logging
+from pathlib import Path
+from multiprocessing.pool import ThreadPool
+from idmc_common import client, tracing
+
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+# Overview -
+#
+# Resolves user and group names to IDs for the notification script. A few names are looked up one at a time (lookup is the script's
+# coalesced single name query). Past lookupLimit names the whole user or group list of the org is read a page at a time instead, which
+# costs one request per pageSize principals however many names are asked for, and kept as a name -> ID index. The index is cached on disk
+# for cacheSeconds so the next runs (and the queue dispatcher) don't read it again. A name that isn't in a cached index is still looked up
+# on its own, it may have been created after the index was read.
+# ---------------------------------------------------------------------------------------------------------------------------------------------
+
+pageSize = 200
+lookupThreads = 8
+
+
+def split_names(value):
+
+    # A field can hold one name, a comma separated list (command line, CSV) or a JSON list (JSONL)
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(name).strip() for name in value if str(name).strip()]
+
+    return [name.strip() for name in str(value).split(",") if name.strip()]
+
+
+class RecipientIndex:
+
+    def __init__(self, kind, url, nameField, lookup, cacheFile="", cacheSeconds=0, lookupLimit=10):
+        self.kind = kind
+        self.url = url
+        self.nameField = nameField
+        self.lookup = lookup
+        self.cacheFile = str(Path(cacheFile).expanduser()) if cacheFile else ""
+        self.cacheSeconds = cacheSeconds
+        self.lookupLimit = lookupLimit
+        self.names = None
+        self.listed = False
+
+    def cache_key(self):
+        return client.orgID + "|" + self.kind
+
+    def read_cache(self):
+
+        if not self.cacheFile or not os.path.isfile(self.cacheFile):
+            return {}
+
+        try:
+            with open(self.cacheFile) as cacheInput:
+                return json.load(cacheInput)
+        except ValueError:
+            return {}
+
+    def write_cache(self):
+
+        if not self.cacheFile:
+            return
+
+        cache = self.read_cache()
+        cache[self.cache_key()] = {"loaded": time.time(), "names": self.names}
+
+        # User names are personal data, the file is created readable by the current user only
+        os.makedirs(os.path.dirname(self.cacheFile) or ".", mode=0o700, exist_ok=True)
+        tempFile = self.cacheFile + ".tmp"
+        fileHandle = os.open(tempFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fileHandle, "w") as cacheOutput:
+            json.dump(cache, cacheOutput)
+        os.replace(tempFile, self.cacheFile)
+
+    def load(self):
+
+        if self.names is not None:
+            return
+
+        cached = self.read_cache().get(self.cache_key())
+        if cached and time.time() - cached['loaded'] < self.cacheSeconds:
+            self.names = cached['names']
+            logging.info(f"    - {len(self.names)} {self.kind} read from the cache")
+            return
+
+        self.names = {}
+        self.listed = True
+        with tracing.span("list " + self.kind):
+            skip = 0
+            while True:
+                response = client.get("identity", f"{self.url}?limit={pageSize}&skip={skip}", headers={'INFA-SESSION-ID': client.sessionID})
+                if response.status_code != 200:
+                    logging.error(f"Unable to list {self.kind} : HTTP {response.status_code} {response.text}")
+                    exit(1)
+
+                page = json.loads(response.text)
+                self.names.update({principal[self.nameField]: principal['id'] for principal in page if self.nameField in principal})
+                if len(page) < pageSize:
+                    break
+                skip = skip + pageSize
+
+        logging.info(f"    - {len(self.names)} {self.kind} listed in {skip // pageSize + 1} requests")
+        self.write_cache()
+
+    def lookup_each(self, names):
+
+        with ThreadPool(min(lookupThreads, len(names))) as pool:
+            principalIDs = pool.map(tracing.task(self.lookup), names)
+
+        return {name: principalID for name, principalID in zip(names, principalIDs) if principalID}
+
+    def resolve(self, names):
+
+        # Returns {name: ID} for the names that were found, names that weren't are left out
+        names = sorted(set(names))
+        if not names:
+            return {}
+
+        if self.names is None and len(names) <= self.lookupLimit:
+            return self.lookup_each(names)
+
+        self.load()
+        resolved = {name: self.names[name] for name in names if name in self.names}
+
+        # Only a cached index can be missing names that exist
+        missing = [name for name in names if name not in resolved]
+        if missing and not self.listed and len(missing) <= self.lookupLimit:
+            found = self.lookup_each(missing)
+            if found:
+                resolved.update(found)
+                self.names.update(found)
+                self.write_cache()
+
+        return resolved
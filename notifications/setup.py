@@ -4,3 +4,41 @@ password = ""
 #IDMC and CDGC API Url
 login_url = "https://dmp-us.informaticacloud.com"
 cdgc_api_url = "https://cdgc-api.dmp-us.informaticacloud.com"
+
+# Shared by the scripts of every folder, the idmc_common module named at the end of a line explains the setting
+rateLimits = {"identity": 0, "search": 0, "publish": 0, "catalog_source": 0, "notification": 0}  # requests per second per endpoint family, 0 = no limit (ratelimit.py)
+rateLimitBurst = 1                                  # requests that may go out back to back (ratelimit.py)
+credentialCache = "~/.idmc/credentials.json"        # session and token reused by the next run, "" logs in every time (credentials.py)
+tokenRefreshMargin = 300                            # seconds before it expires that the token is refreshed (credentials.py)
+metricsJsonFile = "{script}.metrics.json"           # API metrics summary written at exit, "" for none (metrics.py)
+metricsPromFile = "{script}.prom"                   # the same as a Prometheus textfile, "" for none (metrics.py)
+traceFile = ""                                      # OTLP JSON trace of the run, e.g. "{script}.trace.json", "" for none (tracing.py)
+profileFile = "{script}.{phase}"                    # reports of --profile, one per phase (profiling.py)
+profileInterval = 0.005                             # seconds between two stack samples (profiling.py)
+coalesceCacheSize = 1000                            # recent user and group lookups kept, 0 for none (coalesce.py)
+coalesceCacheSeconds = 300                          # seconds a lookup is kept (coalesce.py)
+
+# Bulk mode (-f <file>) -- messages per Messages API request, requests sent at the same time and the file the outcome of every row is
+# written to. {input} is replaced by the name of the notifications file
+notificationBatchSize = 50
+notificationThreads = 8
+notificationResultsFile = "{input}.results.csv"
+
+# User and group names are resolved one query per name up to recipientLookupLimit names, past that the org's whole user or group list is
+# read a page at a time and kept as an index in recipientIndexCache for recipientIndexSeconds seconds. "" keeps the index in memory only
+recipientLookupLimit = 10
+recipientIndexCache = "~/.idmc/recipients.json"
+recipientIndexSeconds = 3600
+
+# Notification queue -- idmc_send_bell_notification.py --queue adds to it, idmc_notification_dispatcher.py sends what is queued.
+# The dispatcher sends at most dispatchRate Messages API requests per second (0 = no limit) with up to notificationBatchSize messages in
+# each. Pending messages to the same recipients are sent as one digest message. A failed message is retried after dispatchRetrySeconds,
+# doubling every attempt up to dispatchRetryMaxSeconds, and gives up after dispatchMaxAttempts. Sent and failed messages are kept
+# queueKeepDays days
+notificationQueue = "~/.idmc/notifications.db"
+dispatchRate = 2
+dispatchPollSeconds = 5
+dispatchMaxAttempts = 5
+dispatchRetrySeconds = 30
+dispatchRetryMaxSeconds = 3600
+queueKeepDays = 7
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The scripts import their helper modules from their own folder, as they do when run from it
+repoRoot = Path(__file__).resolve().parent.parent
+for folder in ("", "cdgc_lineage", "cdgc_purge_content", "notifications"):
+    sys.path.insert(0, str(repoRoot / folder))
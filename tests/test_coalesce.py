@@ -0,0 +1,73 @@
+import time
+import asyncio
+import threading
+import pytest
+from idmc_common.coalesce import Coalescer
+
+
+def test_concurrent_calls_share_one_request():
+    coalescer = Coalescer("test")
+    calls = []
+    release = threading.Event()
+
+    def lookup(key):
+        calls.append(key)
+        release.wait(5)
+        return key.upper()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(coalescer.call("a", lookup, "a"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while coalescer.calls < 5:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["a"] and results == ["A"] * 5 and coalescer.shared == 4
+
+
+def test_error_is_shared_and_not_cached():
+    coalescer = Coalescer("test", cacheSize=10, cacheSeconds=60)
+
+    def lookup():
+        raise ValueError("lookup failed")
+
+    with pytest.raises(ValueError):
+        coalescer.call("a", lookup)
+    assert coalescer.call("a", lambda: "A") == "A"
+
+
+def test_cache_size_and_age():
+    coalescer = Coalescer("test", cacheSize=2, cacheSeconds=60)
+    for key in ("a", "b", "c"):
+        coalescer.call(key, str.upper, key)
+
+    assert coalescer.call("b", lambda: "new") == "B"
+    assert coalescer.call("a", lambda: "new") == "new"
+
+    coalescer.cacheSeconds = 0
+    time.sleep(0.01)
+    assert coalescer.call("b", lambda: "newer") == "newer"
+
+
+def test_empty_results_are_not_cached():
+    coalescer = Coalescer("test", cacheSize=10, cacheSeconds=60)
+    coalescer.call("a", lambda: None)
+    assert coalescer.call("a", lambda: "A") == "A"
+
+
+def test_async_calls_share_one_request():
+    coalescer = Coalescer("test")
+    calls = []
+
+    async def lookup(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return key.upper()
+
+    async def main():
+        return await asyncio.gather(*(coalescer.call_async("a", lookup, "a") for _ in range(5)))
+
+    assert asyncio.run(main()) == ["A"] * 5 and calls == ["a"]
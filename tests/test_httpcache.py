@@ -0,0 +1,27 @@
+import pytest
+from idmc_common import httpcache
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(httpcache, "connection", None)
+    monkeypatch.setattr(httpcache, "cacheFile", str(tmp_path / "http_cache.db"))
+    yield
+    httpcache.connection.close()
+
+
+def test_items_are_kept_per_org(cache):
+    httpcache.put_items("org-a", "details", [("ds-1", 1, {"name": "a"}), ("ds-2", None, {"name": "no version"})])
+    httpcache.put_items("org-b", "details", [("ds-1", 2, {"name": "b"})])
+
+    assert httpcache.get_items("org-a", "details", ["ds-1", "ds-2"]) == {"ds-1": ("1", {"name": "a"})}
+    assert httpcache.get_items("org-b", "details", ["ds-1"]) == {"ds-1": ("2", {"name": "b"})}
+    assert httpcache.get_items("org-a", "other", ["ds-1"]) == {}
+
+
+def test_responses_are_kept_per_org(cache):
+    key = httpcache.response_key("org-a", "POST", "https://cdgc/search", "{}")
+    httpcache.store(key, '"v1"', None, b"body")
+
+    assert httpcache.lookup(key) == ('"v1"', None, b"body")
+    assert httpcache.lookup(httpcache.response_key("org-b", "POST", "https://cdgc/search", "{}")) is None
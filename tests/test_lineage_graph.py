@@ -0,0 +1,51 @@
+import pytest
+import lineage_graph
+from lineage_graph import LineageGraph, INBOUND, OUTBOUND
+
+pytestmark = pytest.mark.skipif(not lineage_graph.available(), reason="requires numpy")
+
+#   a -> b -> c -> d        e -> c        f (no lineage)
+edges = [("a", "b"), ("b", "c"), ("c", "d"), ("e", "c")]
+
+
+def test_closure_downstream():
+    assert LineageGraph(edges).closure(["a"], OUTBOUND) == [("b", 1), ("c", 2), ("d", 3)]
+
+
+def test_closure_upstream():
+    assert sorted(LineageGraph(edges).closure(["d"], INBOUND)) == [("a", 3), ("b", 2), ("c", 1), ("e", 2)]
+
+
+def test_closure_max_distance():
+    assert LineageGraph(edges).closure(["a"], OUTBOUND, maxDistance=2) == [("b", 1), ("c", 2)]
+
+
+def test_closure_of_several_assets_keeps_the_nearest_distance():
+    assert sorted(LineageGraph(edges).closure(["a", "e"], OUTBOUND)) == [("b", 1), ("c", 1), ("d", 2)]
+
+
+def test_closure_unknown_asset():
+    assert LineageGraph(edges).closure(["f"], OUTBOUND) == []
+
+
+def test_closure_cycle_ends():
+    assert sorted(LineageGraph([("a", "b"), ("b", "a")]).closure(["a"], OUTBOUND)) == [("b", 1)]
+
+
+def test_shortest_path():
+    graph = LineageGraph(edges + [("a", "c")])
+    assert graph.shortest_path("a", "d") == ["a", "c", "d"]
+    assert graph.shortest_path("e", "d") == ["e", "c", "d"]
+
+
+def test_shortest_path_follows_the_lineage_direction():
+    graph = LineageGraph(edges)
+    assert graph.shortest_path("d", "a") is None
+    assert graph.shortest_path("a", "e") is None
+    assert graph.shortest_path("a", "f") is None
+
+
+def test_link_counts():
+    counts = LineageGraph(edges).link_counts(["c", "f"], maxDistance=1)
+    # c : b -> c and e -> c upstream, c -> d downstream
+    assert counts == {"c": (3, 1)}
@@ -0,0 +1,120 @@
+import time
+import pytest
+import notification_queue
+import idmc_notification_dispatcher as dispatcher
+from notification_queue import NotificationQueue, PENDING, SENDING, SENT, FAILED
+
+
+def message(text, **fields):
+    return dict({"title": "Title", "message": text, "users": ["jdoe"], "groups": [], "roles": [], "sendAll": 0,
+                 "url": "", "linktext": "", "priority": "HIGH", "status": "INFO", "expires": None}, **fields)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    yield queue
+    queue.close()
+
+
+def test_identical_pending_messages_are_queued_once(queue):
+    assert queue.enqueue(message("one")) is not None
+    assert queue.enqueue(message("one")) is None
+    assert queue.enqueue(message("two")) is not None
+    assert queue.counts() == {PENDING: 2}
+
+
+def test_dedupe_ignores_recipient_order_and_expiry():
+    key = notification_queue.dedupe_key
+    assert key(message("one", users=["a", "b"])) == key(message("one", users=["b", "a"], expires="2030-01-01"))
+    assert key(message("one")) != key(message("one", groups=["admins"]))
+
+
+def test_enqueue_many_counts_only_new_messages(queue):
+    assert queue.enqueue_many([message("one"), message("one"), message("two")]) == 2
+
+
+def test_claim_returns_due_messages_oldest_first(queue):
+    first = queue.enqueue(message("one"))
+    second = queue.enqueue(message("two"))
+    queue.enqueue(message("later"), notBefore=time.time() + 3600)
+
+    claimed = queue.claim(10)
+    assert [notification['id'] for notification in claimed] == [first, second]
+    assert claimed[0]['users'] == ["jdoe"]
+    assert queue.counts() == {PENDING: 1, SENDING: 2}
+    assert queue.claim(10) == []
+
+
+def test_claim_limit(queue):
+    queue.enqueue_many([message(str(number)) for number in range(5)])
+    assert len(queue.claim(3)) == 3
+    assert len(queue.claim(3)) == 2
+
+
+def test_sent_message_can_be_queued_again(queue):
+    queue.enqueue(message("one"))
+    queue.mark_sent([notification['id'] for notification in queue.claim(10)], "message-1")
+    assert queue.enqueue(message("one")) is not None
+    assert queue.counts() == {PENDING: 1, SENT: 1}
+
+
+def test_recover_makes_stale_claims_pending_again(queue):
+    queue.enqueue(message("one"))
+    queue.claim(10)
+
+    assert queue.recover(staleSeconds=3600) == 0
+    assert queue.recover(staleSeconds=-1) == 1
+    assert queue.counts() == {PENDING: 1}
+    assert len(queue.claim(10)) == 1
+
+
+def test_recover_fails_a_claim_that_has_been_queued_again(queue):
+    queue.enqueue(message("one"))
+    queue.claim(10)
+    queue.enqueue(message("one"))
+
+    queue.recover(staleSeconds=-1)
+    assert queue.counts() == {PENDING: 1, FAILED: 1}
+
+
+def test_mark_failed_with_retry(queue):
+    rowId = queue.enqueue(message("one"))
+    queue.claim(10)
+    queue.mark_failed([rowId], "HTTP 503", retryDelay=3600)
+
+    assert queue.counts() == {PENDING: 1}
+    assert queue.claim(10) == []
+    assert queue.next_due() > time.time()
+
+
+def test_mark_failed_for_good(queue):
+    rowId = queue.enqueue(message("one"))
+    queue.claim(10)
+    queue.mark_failed([rowId], "HTTP 400")
+    assert queue.counts() == {FAILED: 1}
+
+
+def test_purge_drops_finished_messages(queue):
+    rowId = queue.enqueue(message("one"))
+    queue.enqueue(message("two"))
+    queue.claim(1)
+    queue.mark_sent([rowId], "message-1")
+
+    assert queue.purge(keepSeconds=-1) == 1
+    assert queue.counts() == {PENDING: 1}
+
+
+def test_dispatcher_recovers_claims_that_become_stale_after_startup(queue, monkeypatch):
+    monkeypatch.setattr(dispatcher, "staleClaimSeconds", 0.2)
+    dispatcher.recover(queue)
+
+    # Claimed by a dispatcher that died just before this one started
+    queue.enqueue(message("one"))
+    queue.claim(10)
+    dispatcher.housekeeping(queue)
+    assert queue.counts() == {SENDING: 1}
+
+    time.sleep(0.3)
+    dispatcher.housekeeping(queue)
+    assert queue.counts() == {PENDING: 1}
@@ -0,0 +1,58 @@
+import time
+import pstats
+import pytest
+from multiprocessing.pool import ThreadPool
+from idmc_common import profiling
+
+
+class Span:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+
+def work(number):
+    return sum(range(number))
+
+
+def wait(number):
+    time.sleep(0.005)
+    return number
+
+
+@pytest.fixture
+def profile(tmp_path, monkeypatch):
+    for name, value in (("profilers", {}), ("threadProfilers", []), ("samples", {}), ("currentPhase", "main"), ("phaseDepth", 0)):
+        monkeypatch.setattr(profiling, name, value)
+    monkeypatch.setattr(profiling, "samplerStop", profiling.threading.Event())
+    yield str(tmp_path / "{script}.{phase}")
+    monkeypatch.setattr(profiling, "enabled", False)
+
+
+def test_cprofile_thread_pool(profile):
+    profiling.configure("test", "cprofile", profile, 0.001)
+    try:
+        with profiling.phase("delete", Span()):
+            with ThreadPool(4) as pool:
+                results = pool.map_async(work, range(100)).get(timeout=30)
+    finally:
+        profiling.write()
+
+    assert results[-1] == sum(range(99))
+    functions = {function for filename, line, function in pstats.Stats(profile.format(script="test", phase="delete") + ".pstats").stats}
+    assert "work" in functions
+
+
+def test_sample_thread_pool(profile):
+    profiling.configure("test", "sample", profile, 0.001)
+    try:
+        with ThreadPool(4) as pool:
+            pool.map_async(wait, range(100)).get(timeout=30)
+    finally:
+        profiling.write()
+
+    functions = {function for filename, line, function in pstats.Stats(profile.format(script="test", phase="main") + ".pstats").stats}
+    assert "wait" in functions
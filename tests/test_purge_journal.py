@@ -0,0 +1,67 @@
+import os
+import purge_journal
+from purge_journal import PurgeJournal
+
+
+def write_journal(fileName, entries, resume=False):
+    journal = PurgeJournal(str(fileName), groupSize=2, groupSeconds=60, resume=resume)
+    for elementType, key in entries:
+        journal.record(elementType, key)
+    journal.close()
+
+
+def test_resume_skips_journaled_deletes(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    relationship = purge_journal.relationship_key("a", "b", "core.DataFlow")
+    write_journal(fileName, [("asset", "a"), ("relationship", relationship), ("asset", "b")])
+
+    assert purge_journal.load_journal(str(fileName)) == ({"a", "b"}, {relationship})
+
+
+def test_resume_appends_to_the_journal(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    write_journal(fileName, [("asset", "a")])
+    write_journal(fileName, [("asset", "b")], resume=True)
+
+    assert purge_journal.load_journal(str(fileName)) == ({"a", "b"}, set())
+    assert os.listdir(tmp_path) == ["purge.journal"]
+
+
+def test_resume_ignores_a_cut_short_last_line(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    write_journal(fileName, [("asset", "a")])
+    with open(fileName, 'a') as journalFile:
+        journalFile.write('{"type": "asset", "id": "b')
+
+    assert purge_journal.load_journal(str(fileName)) == ({"a"}, set())
+
+
+def test_resume_without_a_journal(tmp_path):
+    assert purge_journal.load_journal(str(tmp_path / "missing.journal")) == (set(), set())
+
+
+def test_new_run_keeps_the_previous_journal(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    write_journal(fileName, [("asset", "a")])
+    write_journal(fileName, [("asset", "b")])
+
+    assert purge_journal.load_journal(str(fileName)) == ({"b"}, set())
+    keptNames = [name for name in os.listdir(tmp_path) if name != "purge.journal"]
+    assert len(keptNames) == 1 and keptNames[0].startswith("purge.journal.")
+    assert purge_journal.load_journal(str(tmp_path / keptNames[0])) == ({"a"}, set())
+
+
+def test_rotate_keeps_every_earlier_journal(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    for key in ("a", "b", "c"):
+        write_journal(fileName, [("asset", key)])
+        os.utime(fileName, (0, 0))
+
+    assert len(os.listdir(tmp_path)) == 3
+
+
+def test_rotate_leaves_an_empty_journal(tmp_path):
+    fileName = tmp_path / "purge.journal"
+    fileName.touch()
+    assert purge_journal.rotate_journal(str(fileName)) is None
+    assert purge_journal.rotate_journal(str(tmp_path / "missing.journal")) is None
@@ -0,0 +1,67 @@
+import json
+import purge_plan
+import purge_results
+import purge_shards
+from purge_results import DELETED, CONTENT_FAILED, HTTP_ERROR
+
+
+class Runner:
+
+    # Stands in for purge_results.TaskRunner, every item gets the next of its statuses on each pass
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.passes = []
+        self.progress = None
+
+    def run(self, func, asyncFunc, items):
+        self.passes.append([item['identity'] for item in items])
+        results = purge_results.PurgeResults(len(items))
+        for item in items:
+            results.record(item, self.statuses[item['identity']].pop(0))
+        return results
+
+
+def write_plan(tmp_path, identities):
+    fileName = str(tmp_path / "test.plan")
+    assets = [{"identity": identity, "name": identity, "classType": "core.Asset"} for identity in identities]
+    purge_plan.write_plan(fileName, "test_script", assets, {"requests": {"total": len(assets)}, "wallSeconds": 0, "concurrency": 1,
+                                                            "executePlanSeconds": 0})
+    return fileName
+
+
+def test_execute_plan_retries_the_failed_assets(tmp_path):
+    runner = Runner({"a": [DELETED], "b": [HTTP_ERROR, DELETED], "c": [CONTENT_FAILED, CONTENT_FAILED, CONTENT_FAILED]})
+    purge_plan.execute_plan(write_plan(tmp_path, "abc"), "test_script", runner, None, None, maxRetryPasses=3)
+
+    # The third pass deletes nothing and has no transient errors, so there is no fourth
+    assert runner.passes == [["a", "b", "c"], ["b", "c"], ["c"]]
+
+
+def test_execute_plan_stops_after_max_retry_passes(tmp_path):
+    runner = Runner({"a": [HTTP_ERROR] * 3})
+    purge_plan.execute_plan(write_plan(tmp_path, "a"), "test_script", runner, None, None, maxRetryPasses=2)
+    assert len(runner.passes) == 3
+
+
+def test_execute_plan_shard(tmp_path):
+    fileName = write_plan(tmp_path, [f"asset-{number}" for number in range(20)])
+    runner = Runner({f"asset-{number}": [DELETED] for number in range(20)})
+    purge_plan.execute_plan(fileName, "test_script", runner, None, None, maxRetryPasses=1, shardIndex=2, shardCount=3)
+
+    assert runner.passes[0] and all(purge_shards.shard_of(identity, 3) == 2 for identity in runner.passes[0])
+    with open(tmp_path / "test.plan.shards" / "shard2of3" / "progress.json") as progressFile:
+        state = json.load(progressFile)
+    assert state['status'] == "finished" and state['deleted'] == len(runner.passes[0])
+
+
+def test_check_delete_response():
+    recorded = []
+
+    class Journal:
+        def record(self, elementType, key):
+            recorded.append((elementType, key))
+
+    assert purge_results.check_delete_response({"items": [{"messageCode": "SUCCESS"}]}, "Relationship", "a|b|link", Journal()) == DELETED
+    failed = {"items": [{"messageCode": "CONTENT_FAILED", "validations": [{"results": [{"messageCode": "REFERENCED"}]}]}]}
+    assert purge_results.check_delete_response(failed, "Asset", "a", Journal()) == CONTENT_FAILED
+    assert recorded == [("relationship", "a|b|link")]
@@ -0,0 +1,52 @@
+import time
+import zlib
+import purge_shards
+
+
+def test_parse_shard():
+    assert purge_shards.parse_shard("2/4") == (2, 4)
+    assert purge_shards.parse_shard("1/1") == (1, 1)
+    for value in ("0/4", "5/4", "2", "a/4", "1/2/3", ""):
+        assert purge_shards.parse_shard(value) is None
+
+
+def test_shard_of_is_the_same_in_every_process():
+    # crc32, not the per process salted hash(), so every host splits a plan the same way
+    assert purge_shards.shard_of("asset-1", 4) == zlib.crc32(b"asset-1") % 4 + 1
+    assert purge_shards.shard_of("asset-1", 1) == 1
+
+
+def test_shards_split_a_plan_without_overlap():
+    items = [{"identity": f"asset-{number}"} for number in range(1000)]
+    shards = [purge_shards.select(items, shard, 4) for shard in range(1, 5)]
+
+    identities = [item['identity'] for shard in shards for item in shard]
+    assert sorted(identities) == sorted(item['identity'] for item in items)
+    assert all(150 < len(shard) < 350 for shard in shards)
+
+
+def test_shard_rates():
+    assert purge_shards.shard_rates({"publish": 20, "search": 0}, 4) == {"publish": 5, "search": 0}
+
+
+def test_shard_files(tmp_path):
+    planFile = str(tmp_path / "gov.plan")
+    assert purge_shards.journal_file(planFile, 2, 4) == str(tmp_path / "gov.plan.shards" / "shard2of4" / "journal")
+    assert (tmp_path / "gov.plan.shards" / "shard2of4").is_dir()
+
+
+def test_progress_heartbeat(tmp_path, monkeypatch):
+    monkeypatch.setattr(purge_shards, "heartbeatSeconds", 0.05)
+    planFile = str(tmp_path / "gov.plan")
+    progress = purge_shards.ShardProgress(planFile, 1, 2, 10)
+    fileName = purge_shards.progress_file(planFile, 1, 2)
+    written = purge_shards.read_progress(fileName)['updated']
+
+    time.sleep(0.3)
+    assert purge_shards.read_progress(fileName)['updated'] > written
+
+    progress.finish()
+    state = purge_shards.read_progress(fileName)
+    assert state['status'] == purge_shards.FINISHED and state['total'] == 10
+    time.sleep(0.2)
+    assert purge_shards.read_progress(fileName)['updated'] == state['updated']
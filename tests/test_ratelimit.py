@@ -0,0 +1,43 @@
+import time
+import pytest
+from idmc_common import ratelimit
+
+
+@pytest.fixture(autouse=True)
+def no_limits():
+    yield
+    ratelimit.configure({})
+
+
+def test_bucket_spaces_requests_one_interval_apart():
+    bucket = ratelimit.TokenBucket(10, 1)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[0] == 0
+    assert waits[1:] == pytest.approx([0.1, 0.2, 0.3], abs=0.01)
+
+
+def test_bucket_burst():
+    bucket = ratelimit.TokenBucket(10, 3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+
+
+def test_bucket_refills_over_time():
+    bucket = ratelimit.TokenBucket(100, 1)
+    bucket.reserve()
+    time.sleep(0.02)
+    assert bucket.reserve() == 0
+
+
+def test_configure_skips_unlimited_and_unknown_families():
+    ratelimit.configure({"publish": 5, "search": 0, "unknown": 3})
+    assert list(ratelimit.buckets) == ["publish"]
+
+
+def test_acquire_waits_for_the_rate():
+    ratelimit.configure({"publish": 20})
+    startTime = time.monotonic()
+    for _ in range(5):
+        ratelimit.acquire("publish")
+        ratelimit.acquire("search")
+    assert time.monotonic() - startTime == pytest.approx(0.2, abs=0.05)